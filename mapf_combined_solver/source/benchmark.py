@@ -0,0 +1,214 @@
+import argparse
+import ast
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENS_DIR = os.path.join(SOURCE_DIR, "resources", "scens")
+
+# values read from mapf_solver.log of a run, the first number the pattern matches
+LOG_VALUES = {
+    "initial_planning_s": r"Non-optimal solver took ([\d.e-]+) seconds",
+    "conflict_solving_s": r"Fixing conflicts took ([\d.e-]+) seconds",
+    "solver_runtime_s": r"Total combined solver runtime is ([\d.e-]+) seconds",
+    "initial_conflicts": r"Initial conflicts identified: (\d+)",
+    "remaining_conflicts": r"Number of conflicts at termination: (\d+)",
+    "unsolveable_conflicts": r"Number of unsolveable conflicts at termination: (\d+)",
+    "initial_makespan": r"Maximum agent path legnth after non-optimal solver: (\d+)",
+    "final_makespan": r"Maximum agent path legnth after optimal solver: (\d+)",
+}
+# log lines counted in a run
+LOG_COUNTS = {
+    "subproblems": "Created subproblem instance",
+    "batches": "Solving a batch of",
+    "retries": "Optimal solver was not successful the first time",
+    "solver_successes": "Optimal solver was successful",
+    "solver_failures": "Optimal solver was not successful the second time",
+}
+KEY = ["scen", "agents", "options"]     # runs with the same key are repetitions of each other
+
+def log_time(line):
+    # timestamp the logging format of combined_solver starts every line with
+    return datetime.strptime(line[:23], "%Y-%m-%d %H:%M:%S,%f").timestamp()
+
+def parse_log(text):
+    """ Phase times, conflict numbers and solver counts of one run from the text of its mapf_solver.log """
+    result = {}
+    for name, pattern in LOG_VALUES.items():
+        match = re.search(pattern, text)
+        if match is None:
+            result[name] = None
+        else:
+            result[name] = float(match.group(1)) if name.endswith("_s") else int(match.group(1))
+    for name, line in LOG_COUNTS.items():
+        result[name] = text.count(line)
+    attempts = result["solver_successes"] + result["solver_failures"]
+    result["success_rate"] = result["solver_successes"] / attempts if attempts > 0 else None
+    result["timeout"] = "Timeout occurred" in text
+
+    # the options of a run may choose another backend than the sweep
+    match = re.search(r"Solving subproblems with the (\S+) backend", text)
+    if match:
+        result["backend"] = match.group(1)
+
+    match = re.search(r"Solution cache: (\{.*\})", text)
+    stats = ast.literal_eval(match.group(1)) if match else {}
+    result["cache_hits"] = stats.get("hits")
+    result["cache_misses"] = stats.get("misses")
+
+    # loading the map is the time between the first log line and the one after loading
+    lines = text.splitlines()
+    loaded = [line for line in lines if "Map and agent information loaded." in line]
+    result["load_s"] = log_time(loaded[0]) - log_time(lines[0]) if loaded else None
+    return result
+
+def run_one(scen, agents, options, backend, timeout, run_dir):
+    """ Runs combined_solver.py once in run_dir and returns the row of the results file
+
+    run_dir gets a link to the source directory, so the solver finds its resources and writes its
+    mapf_solver.log, metrics.json, conflict_counts_df.csv and unsolveable.txt there instead of the current directory.
+    It has to be empty, files of an earlier run would be read as the results of a run that didn't write them.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    if os.listdir(run_dir):
+        raise ValueError(f"The run directory {run_dir} is not empty")
+    os.symlink(SOURCE_DIR, os.path.join(run_dir, "source"))
+    command = [sys.executable, os.path.join("source", "combined_solver.py"), "-s", scen, "-n", str(agents),
+               "-t", str(timeout), "-c", "--solver-backend", backend, "--metrics-file", "metrics.json"] + shlex.split(options)
+    start = time.time()
+    try:
+        # the solver only checks its timeout between subproblems, so the process gets some more time
+        process = subprocess.run(command, cwd=run_dir, capture_output=True, timeout=2 * timeout + 60)
+        returncode = process.returncode
+    except subprocess.TimeoutExpired:
+        returncode = None
+    row = {"scen": scen, "agents": agents, "options": options, "backend": backend,
+           "returncode": returncode, "wall_s": time.time() - start}
+    log_file = os.path.join(run_dir, "mapf_solver.log")
+    text = ""
+    if os.path.exists(log_file):
+        with open(log_file) as f:
+            text = f.read()
+    row.update(parse_log(text) if text else {})
+    # the counters and phase times of the run's metrics summary are exact where the log only allows estimates
+    metrics_file = os.path.join(run_dir, "metrics.json")
+    if os.path.exists(metrics_file):
+        with open(metrics_file) as f:
+            summary = json.load(f)
+        for name, phase in summary["phases"].items():
+            row[f"phase_{name}_s"] = phase["seconds"]
+        row.update(summary["counters"])
+    row["solved"] = returncode == 0 and row.get("remaining_conflicts") == 0
+    return row
+
+def run(args):
+    scens = args.scens or sorted(os.listdir(SCENS_DIR))
+    backend = args.solver_backend
+    if backend is None:
+        # without a picat binary every subproblem would fail, the local stand-in solver is used instead
+        backend = "picat" if shutil.which("picat") else "local"
+        print(f"Using the {backend} solver backend.")
+    runs_dir = args.runs_dir or tempfile.mkdtemp(prefix="mapf_benchmark_")
+    os.makedirs(runs_dir, exist_ok=True)
+
+    rows = []
+    configs = [(s, n, o, r) for s in scens for n in args.agents for o in args.options for r in range(args.repeat)]
+    for i, (scen, agents, options, repeat) in enumerate(configs):
+        # a new directory for every run, also when runs_dir holds the runs of an earlier sweep
+        row = run_one(scen, agents, options, backend, args.timeout, tempfile.mkdtemp(prefix=f"{i}_", dir=runs_dir))
+        row["repeat"] = repeat
+        rows.append(row)
+        print(f"[{i + 1}/{len(configs)}] {scen} -n {agents} {options} : {row['wall_s']:.2f} s, "
+              f"{row.get('remaining_conflicts')} conflicts left")
+        # written after every run, so an interrupted sweep keeps its results
+        pd.DataFrame(rows).to_csv(args.output, index=False)
+
+    if args.runs_dir is None:
+        shutil.rmtree(runs_dir)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        return compare(args.baseline, args.output, args.time_tolerance, args.min_time)
+    return 0
+
+def summarize(results_file):
+    # one row per key: median of times, mean of everything else over the repetitions
+    df = pd.read_csv(results_file)
+    df["options"] = df["options"].fillna("")     # runs without options are written as an empty field
+    df["failed"] = df["returncode"] != 0
+    summary = df.groupby(KEY).agg(wall_s=("wall_s", "median"), remaining_conflicts=("remaining_conflicts", "mean"),
+                                  success_rate=("success_rate", "mean"), failed=("failed", "max"))
+    return summary
+
+def compare(baseline_file, results_file, time_tolerance, min_time):
+    """ Prints the runs of results_file that regressed against the same runs of baseline_file
+
+    A run regresses when its wall time grows by more than time_tolerance (relative) and min_time seconds, when
+    more conflicts remain, when fewer subproblems are solved, or when the solver fails where it didn't before.
+    Returns 1 when there is a regression, 0 otherwise.
+    """
+    base = summarize(baseline_file)
+    new = summarize(results_file)
+    both = base.join(new, how="inner", lsuffix="_base", rsuffix="_new")
+
+    regressions = []
+    for key, r in both.iterrows():
+        reasons = []
+        if r.wall_s_new > r.wall_s_base * (1 + time_tolerance) and r.wall_s_new - r.wall_s_base > min_time:
+            reasons.append(f"wall time {r.wall_s_base:.2f} s -> {r.wall_s_new:.2f} s")
+        if r.remaining_conflicts_new > r.remaining_conflicts_base:
+            reasons.append(f"remaining conflicts {r.remaining_conflicts_base:g} -> {r.remaining_conflicts_new:g}")
+        if r.success_rate_new < r.success_rate_base:
+            reasons.append(f"success rate {r.success_rate_base:.2f} -> {r.success_rate_new:.2f}")
+        if r.failed_new and not r.failed_base:
+            reasons.append("solver failed")
+        if reasons:
+            regressions.append((key, reasons))
+
+    missing = base.index.difference(new.index)
+    print(f"Compared {len(both)} runs, {len(regressions)} regressed, {len(missing)} missing from {results_file}.")
+    for (scen, agents, options), reasons in regressions:
+        print(f"REGRESSION {scen} -n {agents} {options}: " + ", ".join(reasons))
+    for scen, agents, options in missing:
+        print(f"MISSING {scen} -n {agents} {options}")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the combined solver over the bundled maps and scenarios")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a sweep and write its results")
+    run_parser.add_argument("--scens", nargs="+", default=None)            # .scen files to run, all bundled ones by default
+    run_parser.add_argument("--agents", nargs="+", type=int, default=[10, 30])   # agent counts, passed as -n
+    run_parser.add_argument("--options", nargs="+", default=[""])          # solver option sets, one quoted string each
+    run_parser.add_argument("--repeat", type=int, default=1)               # runs of every configuration
+    run_parser.add_argument("--timeout", type=int, default=60)             # solver timeout of every run, passed as -t
+    run_parser.add_argument("--solver-backend", type=str, default=None)    # picat when installed, local otherwise
+    run_parser.add_argument("--output", type=str, default="benchmark_results.csv")
+    run_parser.add_argument("--runs-dir", type=str, default=None)          # keep the files of every run here
+    run_parser.add_argument("--baseline", type=str, default=None)          # compare the results with this file
+
+    compare_parser = commands.add_parser("compare", help="flag regressions of a results file against a baseline")
+    compare_parser.add_argument("baseline", type=str)
+    compare_parser.add_argument("results", type=str)
+
+    for p in (run_parser, compare_parser):
+        p.add_argument("--time-tolerance", type=float, default=0.2)   # relative wall time increase that is still fine
+        p.add_argument("--min-time", type=float, default=0.5)         # wall time differences below this are noise
+    args = parser.parse_args()
+
+    if args.command == "run":
+        sys.exit(run(args))
+    sys.exit(compare(args.baseline, args.results, args.time_tolerance, args.min_time))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import heapq
+from collections import deque
+
+def distances(neighbors, target):
+    """ Number of moves from every node of a submap to target, nodes that can't reach it are left out """
+    dist = {target: 0}
+    queue = deque([target])
+    while queue:
+        node = queue.popleft()
+        for n in neighbors[node]:
+            if n not in dist:
+                dist[n] = dist[node] + 1
+                queue.append(n)
+    return dist
+
+def avoid_tables(avoids):
+    """ (node, time) pairs and (node, node, time) moves that the avoids block for every agent
+
+    A move from time t to t + 1 is blocked in both directions when an avoided agent uses the same edge.
+    """
+    vertices = set()
+    edges = set()
+    for path in avoids:
+        positions = {}
+        for pos, t in path:
+            positions[t] = pos
+            vertices.add((pos, t))
+        for t, pos in positions.items():
+            if t + 1 in positions:
+                edges.add((pos, positions[t + 1], t))
+                edges.add((positions[t + 1], pos, t))
+    return vertices, edges
+
+def space_time_astar(neighbors, origin, dest, makespan, dist, blocked_vertices, blocked_edges, vertex_constraints = (), edge_constraints = ()):
+    """ Path of exactly makespan nodes from origin at time 1 to dest at time makespan, None if there is none
+
+    The agent reaches dest as early as possible and then waits there. Nodes from which dest can't be reached
+    in the remaining time are never expanded.
+    """
+    def free(node, t):
+        return (node, t) not in blocked_vertices and (node, t) not in vertex_constraints
+
+    def can_move(u, v, t):
+        return (u, v, t) not in blocked_edges and (u, v, t) not in edge_constraints
+
+    if not free(origin, 1) or dist.get(origin, makespan) > makespan - 1:
+        return None
+    # earliest time from which the agent can wait at dest until makespan
+    wait_from = makespan
+    while wait_from > 1 and free(dest, wait_from - 1) and can_move(dest, dest, wait_from - 1):
+        wait_from -= 1
+    if not free(dest, makespan):
+        return None
+
+    parents = {(origin, 1): None}
+    queue = [(1 + dist[origin], 1, origin)]
+    while queue:
+        f, t, node = heapq.heappop(queue)
+        if node == dest and t >= wait_from:
+            path = [dest] * (makespan - t)
+            state = (node, t)
+            while state is not None:
+                path.append(state[0])
+                state = parents[state]
+            path.reverse()
+            return path
+        if t == makespan:
+            continue
+        for n in neighbors[node]:
+            state = (n, t + 1)
+            if state in parents or dist.get(n, makespan) > makespan - t - 1:
+                continue
+            if not free(n, t + 1) or not can_move(node, n, t):
+                continue
+            parents[state] = (node, t)
+            heapq.heappush(queue, (t + 1 + dist[n], t + 1, n))
+    return None
+
+def arrival(path):
+    # time from which the agent stays at its destination
+    t = len(path)
+    while t > 1 and path[t - 2] == path[-1]:
+        t -= 1
+    return t
+
+def first_conflict(paths):
+    # earliest vertex conflict (a, b, node, t) or swap (a, b, u, v, t) where a moves u -> v and b moves v -> u
+    makespan = len(paths[0])
+    for t in range(1, makespan + 1):
+        at = {}
+        for a, path in enumerate(paths):
+            node = path[t - 1]
+            if node in at:
+                return (at[node], a, node, t)
+            at[node] = a
+        if t < makespan:
+            moves = {}
+            for a, path in enumerate(paths):
+                u, v = path[t - 1], path[t]
+                if u != v:
+                    if (v, u) in moves:
+                        return (moves[(v, u)], a, v, u, t)
+                    moves[(u, v)] = a
+    return None
+
+def cbs(neighbors, agents, makespan, blocked_vertices, blocked_edges, max_nodes = 2000):
+    """ Conflict-based search for paths of exactly makespan nodes, minimizing the sum of arrival times
+
+    Every node of the constraint tree replans one agent with space_time_astar. Returns the paths and the
+    number of expanded constraint tree nodes, paths is None when there is no plan or max_nodes was reached.
+    """
+    dist = [distances(neighbors, dest) for _, dest in agents]
+    paths = []
+    for a, (origin, dest) in enumerate(agents):
+        path = space_time_astar(neighbors, origin, dest, makespan, dist[a], blocked_vertices, blocked_edges)
+        if path is None:
+            return None, 0
+        paths.append(path)
+    constraints = [(frozenset(), frozenset()) for _ in agents]     # per agent: (node, t) and (u, v, t)
+    counter = 0
+    queue = [(sum(arrival(p) for p in paths), counter, paths, constraints)]
+    expanded = 0
+    while queue and expanded < max_nodes:
+        cost, _, paths, constraints = heapq.heappop(queue)
+        expanded += 1
+        conflict = first_conflict(paths)
+        if conflict is None:
+            return paths, expanded
+        if len(conflict) == 4:
+            a, b, node, t = conflict
+            branches = [(a, (node, t), None), (b, (node, t), None)]
+        else:
+            a, b, u, v, t = conflict
+            branches = [(a, None, (u, v, t)), (b, None, (v, u, t))]
+        for agent, vertex, edge in branches:
+            vertex_constraints, edge_constraints = constraints[agent]
+            if vertex is not None:
+                vertex_constraints = vertex_constraints | {vertex}
+            else:
+                edge_constraints = edge_constraints | {edge}
+            origin, dest = agents[agent]
+            path = space_time_astar(neighbors, origin, dest, makespan, dist[agent], blocked_vertices, blocked_edges,
+                                    vertex_constraints, edge_constraints)
+            if path is None:
+                continue
+            child_paths = list(paths)
+            child_paths[agent] = path
+            child_constraints = list(constraints)
+            child_constraints[agent] = (vertex_constraints, edge_constraints)
+            counter += 1
+            child_cost = cost - arrival(paths[agent]) + arrival(path)
+            heapq.heappush(queue, (child_cost, counter, child_paths, child_constraints))
+    return None, expanded
+
+def joint_search(neighbors, agents, makespan, dist, blocked_vertices, blocked_edges, max_states = 50000):
+    """ Breadth-first search over the joint positions of all agents, one layer of (positions) per timestep
+
+    Exact, but the number of joint states grows with the power of the number of agents, so it is used for
+    pairs of agents, where CBS can need thousands of nodes to prove that there is no plan. Returns the paths
+    (None if there is no plan) and whether the search finished within max_states states per layer.
+    """
+    k = len(agents)
+    origins = tuple(o for o, _ in agents)
+    dests = tuple(d for _, d in agents)
+    for a in range(k):
+        if (origins[a], 1) in blocked_vertices or dist[a].get(origins[a], makespan) > makespan - 1:
+            return None, True
+    if len(set(origins)) < k:
+        return None, True
+    layers = [{origins: None}]
+    for t in range(1, makespan):
+        remaining = makespan - t - 1
+        # moves every agent can make on its own
+        options = []
+        for a in range(k):
+            da = dist[a]
+            opts = {}
+            for u in {s[a] for s in layers[-1]}:
+                opts[u] = [v for v in neighbors[u] if da.get(v, makespan) <= remaining and (v, t + 1) not in blocked_vertices and (u, v, t) not in blocked_edges]
+            options.append(opts)
+        layer = {}
+        for state in layers[-1]:
+            if k == 2:
+                u0, u1 = state
+                for v0 in options[0][u0]:
+                    for v1 in options[1][u1]:
+                        if v0 == v1 or (v0 == u1 and v1 == u0):
+                            continue
+                        nxt = (v0, v1)
+                        if nxt not in layer:
+                            layer[nxt] = state
+            else:
+                partial = [()]
+                for a in range(k):
+                    ext = []
+                    for p in partial:
+                        for v in options[a][state[a]]:
+                            if v in p:
+                                continue
+                            # swap with an agent placed before
+                            if any(p[b] == state[a] and v == state[b] for b in range(len(p))):
+                                continue
+                            ext.append(p + (v,))
+                    partial = ext
+                for nxt in partial:
+                    if nxt not in layer:
+                        layer[nxt] = state
+        if not layer:
+            return None, True
+        if len(layer) > max_states:
+            return None, False
+        layers.append(layer)
+    if dests not in layers[-1]:
+        return None, True
+    states = [dests]
+    for t in range(makespan - 1, 0, -1):
+        states.append(layers[t][states[-1]])
+    states.reverse()
+    return [[s[a] for s in states] for a in range(k)], True
@@ -1,14 +1,16 @@
 import argparse
 import time
 import logging
-import copy
 import pandas as pd
 
-import informed_search
 import map
-import subproblem
-from conflicts import update_agents_from_solution, identify_conflicts, reorder_conflicts, print_conflict_info, agents_stay_at_destination
-from utils import update_edge_dict, animate_paths
+from conflict_queue import ORDERS as CONFLICT_ORDERS
+from conflicts import print_conflict_info
+from metrics import Metrics
+from prioritized_planning import ORDERINGS
+from solver_api import Problem, Config, solve
+from solver_backend import BACKENDS
+from utils import animate_paths
 
 logging.basicConfig(filename='mapf_solver.log', filemode='w', level=logging.DEBUG,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -27,9 +29,31 @@ def main():
     parser.add_argument("-t", "--timeout", type = int, default=200) 
     parser.add_argument("-c", "--concise", action='store_true', default=False)
     parser.add_argument("--animate-paths", action='store_true', default=False) 
+    parser.add_argument("--search-mode", type=str, choices=["modified", "astar", "jps", "prioritized"], default=None)  # initial search, overrides -m when given
+    parser.add_argument("--workers", type=int, default=1)                              # number of processes used for initial planning
+    parser.add_argument("--distance-heuristic", action='store_true', default=False)    # exact BFS distances instead of Manhattan distance in A*
+    parser.add_argument("--heuristic-cache-mb", type=int, default=256)                 # memory limit for cached distance tables
+    parser.add_argument("--heuristic-spill-dir", type=str, default=None)               # directory where evicted distance tables are kept
+    parser.add_argument("--solver-backend", type=str, choices=sorted(BACKENDS), default="picat")   # how subproblems are solved
+    parser.add_argument("--solve-workers", type=int, default=1)                        # number of processes solving independent subproblems at once
+    parser.add_argument("--solution-cache-size", type=int, default=10000)              # subproblem solutions kept in memory, 0 turns the cache off
+    parser.add_argument("--solution-cache-dir", type=str, default=None)                # directory where subproblem solutions are kept across runs
+    parser.add_argument("--map-cache-dir", type=str, default=None)                     # directory of compiled maps and scenarios, loaded memory-mapped
+    parser.add_argument("--window", type=int, default=None)                            # repair conflicts this many steps ahead at a time
+    parser.add_argument("--commit-steps", type=int, default=None)                      # steps the window moves on by, half the window by default
+    parser.add_argument("--priority-order", type=str, choices=ORDERINGS, default="longest")  # first ordering of prioritized planning
+    parser.add_argument("--restarts", type=int, default=10)                            # new orderings tried while agents fail
+    parser.add_argument("--planning-time", type=float, default=30)                     # seconds prioritized planning may take
+    parser.add_argument("--priority-seed", type=int, default=0)                        # seed of the random orderings
+    parser.add_argument("--conflict-order", type=str, choices=CONFLICT_ORDERS, default="time")     # which conflict is repaired next
+    parser.add_argument("--metrics-file", type=str, default=None)                      # JSON summary of counters and phase times
+    parser.add_argument("--metrics-trace", type=str, default=None)                     # JSON lines of phases and subproblems as they happen
+    parser.add_argument("--log-level", type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="DEBUG")
     args = parser.parse_args()                                  # read arguments from input
+    logging.getLogger().setLevel(args.log_level)
     
     logger.debug(f"Arguments received: {args}")
+    metrics = Metrics(args.metrics_file is not None, args.metrics_trace)    # does nothing unless asked for
     
     # change value of var only if user specified it
     if args.scen_file:
@@ -39,134 +63,19 @@ def main():
         logger.info(f"No scenario file specified. Using default: {s_filename}")
 
     # read map and agent information from files
-    main_map = map.map(s_filename, args.number_agents, args.percentage_agents)
+    start_time_load = time.time()
+    main_map = map.map(s_filename, args.number_agents, args.percentage_agents, args.map_cache_dir)
     logger.info("Map and agent information loaded.")
+    metrics.add_phase("load", time.time() - start_time_load)
+    metrics.count("agents_loaded", len(main_map.agents))
 
-    max_length = 0      # used in finding conflicts
-
-    # start time for measuring total length of A* calls
-    start_time_init = time.time()
-
-    if args.modified_search:
-        # find path for each agent using modified A*
-        logger.info("Using modified A* for pathfinding.")
-        edge_use_dict = {}
-        for agent in main_map.agents:
-            search_path = informed_search.modified_informed_search(main_map.nodes, agent.origin, agent.destination, edge_use_dict)
-            agent.path = search_path
-            if len(agent.path) > max_length:
-                max_length = len(agent.path)
-            edge_use_dict= update_edge_dict(search_path, edge_use_dict)
-    else:
-        # find path for each agent using A*
-        logger.info("Using standard A* for pathfinding.")
-        for agent in main_map.agents:
-            search_path = informed_search.informed_search(main_map.nodes, agent.origin, agent.destination) 
-            agent.path = search_path  
-            if len(agent.path) > max_length:
-                max_length = len(agent.path)     
-
-    finding_init_paths_time = time.time() - start_time_init
-    logger.info(f"Non-optimal solver took {finding_init_paths_time} seconds to find initial paths for agents")
-
-    # find conflicts from initially found paths
-    main_map.agents = agents_stay_at_destination(main_map.agents, max_length)
-    conflicts = identify_conflicts(main_map.agents, max_length)
-    conflicts = reorder_conflicts(conflicts)
-    pos_count, edge_count, path_count = print_conflict_info(conflicts)
-    logger.info(f"Initial conflicts identified: {len(conflicts)}")
-    logger.info(f"Initial number of position conflicts: {pos_count}")
-    logger.info(f"Initial number of edge conflicts: {edge_count}")
-    logger.info(f"Initial number of path conflicts: {path_count}")
-    logger.info(f"Maximum agent path legnth after non-optimal solver: {max_length}")
-
-    # track time for timeout
-    start_time = time.time()
-    current_time = time.time()
-
-    # Make a deep copy of initial agents
-    initial_agents = copy.deepcopy(main_map.agents)
-    #animate_paths(main_map.agents, max_length, (len(main_map.nodes), len(main_map.nodes[0])), main_map.nodes)
-
-    unsolveable_conflicts = []  
-    flagged_conflicts = {}      # conflicts that have been unsolveable mulitple times - they get extra extra time
-    conflict_counts_data = []   # initialize structure for storing conflict type distribution and counts
-    unsolveable_outputs = []
-    while len(conflicts) > 0 and current_time - start_time < args.timeout:
-        conflict = conflicts.pop(0)
-
-        if conflict in flagged_conflicts:
-            unsolveable = False
-            retry_count = flagged_conflicts[conflict]   
-            logging.info(f"Retrying conflict {conflict} for the {retry_count} time")
-
-            if retry_count > 30:     # giving up on the conflict 
-                unsolveable_conflicts.append(conflict)
-                unsolveable = True  
-                logging.info(f"Marking conflict {conflict} as unsolvable after {retry_count} attempts")
-
-            # increase size of area around conflict endpoints in the submap by retry_count
-            # and increase suggested minimum radius relative to retry count but no more than 10
-            sugg_radius = min(10, retry_count)
-            subproblem1 = subproblem.Subproblem(conflict, main_map.agents, main_map.nodes, size_inc=retry_count, sugg_min_radius=sugg_radius)
-            # increase makespan in a way that's proportional to retry_count
-            subproblem1.inc_ms_upd_avoids(main_map.agents, 4 * retry_count)
-
-            if unsolveable:
-                if not args.concise:
-                    unsolveable_outputs.append(subproblem1.print_subproblem(main_map.agents))
-                    print("unsolveable")
-                    
-                continue
-
-        else:
-            subproblem1 = subproblem.Subproblem(conflict, main_map.agents, main_map.nodes) 
-
-        logging.info(f"Created subproblem instance for conflict {conflict}")
-
-        # call optimal solver on created subproblem
-        output, exitcode = subproblem1.solve()
-        if exitcode != 0:
-            logging.info("Optimal solver was not successful the first time")
-            # optimal solver failed to solve the subproblem
-            subproblem1.inc_ms_upd_avoids(main_map.agents)  # increase available time
-            output, exitcode = subproblem1.solve()          # try to solve again
-        if exitcode == 0:
-            logging.info("Optimal solver was successful")
-            # optimal solver successfully solved the subproblem
-            main_map.agents, max_length = update_agents_from_solution(subproblem1, output, main_map.agents, max_length) # update agent paths based on optimal solver's solution
-            main_map.agents = agents_stay_at_destination(main_map.agents, max_length)
-            conflicts1 = identify_conflicts(main_map.agents, max_length)        
-            conflicts = []
-            for c in conflicts1:
-                if c not in unsolveable_conflicts:
-                    conflicts.append(c)
-            conflicts = reorder_conflicts(conflicts)
-            pos, edge, path = print_conflict_info(conflicts)
-            conflict_counts_data.append({'Position': pos, 'Edge': edge, 'Path': path, 'Total': pos+edge+path})
-        else:
-            logging.info("Optimal solver was not successful the second time")
-            # optimal solver wasn't successful even after 2nd attempt
-            if conflict in flagged_conflicts:
-                flagged_conflicts[conflict] += 1
-            else:
-                flagged_conflicts[conflict] = 1
-                conflicts.insert(0, conflict)
-
-        current_time = time.time()
-
-    if (current_time - start_time) > args.timeout:
-        logging.info("Timeout occurred")
-        print("Timeout occured")  
-
-    logger.info(f"Fixing conflicts took {current_time - start_time} seconds")
-    logger.info(f"Total combined solver runtime is {current_time - start_time_init} seconds")
-
-    logger.info(f"Number of conflicts at termination: {len(conflicts)}")
-    logger.info(f"Number of unsolveable conflicts at termination: {len(unsolveable_conflicts)}")
-
-    logger.info(f"Maximum agent path legnth after optimal solver: {max_length}")
+    problem = Problem.from_map(main_map)
+    result = solve(problem, Config.from_args(args), metrics)
+    conflicts = result.conflicts
+    unsolveable_conflicts = result.unsolveable_conflicts
 
+    if result.timed_out:
+        print("Timeout occured")  
 
     print("Current conflicts:")
     pos_count, edge_count, path_count = print_conflict_info(conflicts)
@@ -182,13 +91,17 @@ def main():
 
     # Animate final agent paths
     if args.animate_paths:
-        animate_paths(initial_agents, main_map.agents, max_length, (len(main_map.nodes), len(main_map.nodes[0])), main_map.nodes)
+        animate_paths(result.initial_agents, result.agents, result.makespan, (len(main_map.nodes), len(main_map.nodes[0])), main_map.nodes)
 
-    df = pd.DataFrame(conflict_counts_data)
+    df = pd.DataFrame(result.conflict_counts)
     df.to_csv('conflict_counts_df.csv')
 
     with open("unsolveable.txt", 'w') as f:
-        f.writelines(unsolveable_outputs)
+        f.writelines(result.unsolveable_outputs)
+
+    if args.metrics_file is not None:
+        metrics.write_summary(args.metrics_file)
+    metrics.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+import heapq
+
+from conflicts import ConflictType, sorting_key
+
+ORDERS = ("time", "impact")
+
+# estimated cardinality of a conflict, the order in which the classes are served
+CARDINAL = 0        # none of its agents can get around it without arriving later
+SEMI_CARDINAL = 1   # some of its agents can't
+NON_CARDINAL = 2    # every agent can take another cell at the same time
+
+# a repair keeps the positions before its subproblem, so conflicts are still repaired about in the order of their
+# times and impact only decides within bands of this many time units, serving later conflicts first took up to
+# twice the solver calls
+TIME_BAND = 10
+
+def has_bypass(agent, step, grid):
+    # whether the agent can leave out the cell of its path at step for another one without arriving later
+    path = agent.path
+    if step <= 0 or step + 1 >= len(path):
+        return False
+    prev, cell, nxt = path[step - 1], path[step], path[step + 1]
+    if nxt == cell:
+        # an agent that has arrived for good has to step aside, one that waits on the way can wait elsewhere
+        return cell != agent.destination or any(p != cell for p in path[step + 1:])
+    if prev == cell:
+        return True
+    adjacency = grid.adjacency
+    c, n = grid.cell_id(cell), grid.cell_id(nxt)
+    return any(m != c and n in adjacency[m] for m in adjacency[grid.cell_id(prev)])
+
+def cardinality(conflict, agents, grid):
+    """ Estimated cardinality of a conflict from the cells around it, a cheap stand-in for the MDDs of CBS
+
+    Agents that move together along a path conflict can only split up by one of them waiting or taking a longer
+    way, so path conflicts are cardinal.
+    """
+    if conflict.type == ConflictType.PATH:
+        return CARDINAL
+    step = conflict.time // 2 if conflict.type == ConflictType.POSITION else (conflict.time + 1) // 2
+    stuck = sum(1 for a in conflict.agents if not has_bypass(agents[a], step, grid))
+    if stuck == len(conflict.agents):
+        return CARDINAL
+    return SEMI_CARDINAL if stuck > 0 else NON_CARDINAL
+
+class ConflictQueue:
+    """ Conflicts waiting to be repaired, served from a heap
+
+    With order "impact" the most valuable conflict of the earliest TIME_BAND comes first: cardinal before
+    semi-cardinal before non-cardinal conflicts, then the conflicts whose agents have the most other queued
+    conflicts, then the ones with the most agents, then by sorting_key. With order "time" only sorting_key counts,
+    like reorder_conflicts.
+    Conflicts pushed to the front are served before all others, in their order. Entries are not removed from the
+    heap; an entry is skipped when its conflict was removed or queued again with another priority. When
+    conflicts come and go, only the conflicts that share agents with them get new priorities.
+    """
+    def __init__(self, grid, order = "time"):
+        if order not in ORDERS:
+            raise ValueError(f"Unknown conflict order {order}, expected one of {', '.join(ORDERS)}")
+        self.grid = grid
+        self.order = order
+        self.heap = []          # (priority, entry number, conflict)
+        self.entries = {}       # conflict -> entry number of its valid heap entry
+        self.front = []         # conflicts served before the heap
+        self.by_agent = {}      # agent index -> queued conflicts of the agent, front included
+        self.classes = {}       # conflict -> estimated cardinality
+        self.pushes = 0
+
+    def __len__(self):
+        return len(self.entries) + len(self.front)
+
+    def __contains__(self, conflict):
+        return conflict in self.entries or conflict in self.front
+
+    def priority(self, conflict):
+        key = sorting_key(conflict) + (conflict.key(),)
+        if self.order == "time":
+            return key
+        by_agent = self.by_agent
+        shared = sum(len(by_agent[a]) - 1 for a in conflict.agents)
+        return (key[0] // TIME_BAND, self.classes[conflict], -shared, -len(conflict.agents)) + key
+
+    def push_entry(self, conflict):
+        self.pushes += 1
+        self.entries[conflict] = self.pushes
+        heapq.heappush(self.heap, (self.priority(conflict), self.pushes, conflict))
+
+    def add(self, conflict, agents):
+        for a in conflict.agents:
+            self.by_agent.setdefault(a, set()).add(conflict)
+        if self.order == "impact":
+            self.classes[conflict] = cardinality(conflict, agents, self.grid)
+
+    def drop(self, conflict):
+        for a in conflict.agents:
+            queued = self.by_agent.get(a)
+            if queued is not None:
+                queued.discard(conflict)
+                if not queued:
+                    del self.by_agent[a]
+        self.classes.pop(conflict, None)
+
+    def reprioritize(self, touched, agents):
+        # conflicts that share an agent with conflicts that came or went have another number of shared conflicts
+        if self.order == "time" or not touched:
+            return
+        changed = set()
+        for a in touched:
+            changed.update(self.by_agent.get(a, ()))
+        for conflict in changed:
+            if conflict in self.entries:
+                self.classes[conflict] = cardinality(conflict, agents, self.grid)
+                self.push_entry(conflict)
+
+    def update(self, conflicts, agents):
+        """ Makes the queue hold exactly conflicts, the ones that were queued already keep their place unless
+        their priority changed """
+        new = set(conflicts)
+        touched = set()
+        gone = [c for c in self.entries if c not in new] + [c for c in self.front if c not in new]
+        for conflict in gone:
+            self.entries.pop(conflict, None)
+            self.drop(conflict)
+            touched.update(conflict.agents)
+        self.front = [c for c in self.front if c in new]
+        added = [c for c in conflicts if c not in self]
+        for conflict in added:
+            self.add(conflict, agents)
+            touched.update(conflict.agents)
+        for conflict in added:
+            self.push_entry(conflict)
+        self.reprioritize(touched, agents)
+        if len(self.heap) > 4 * len(self.entries) + 64:
+            self.compact()
+
+    def compact(self):
+        # drops the entries that are no longer valid
+        self.heap = [e for e in self.heap if self.entries.get(e[2]) == e[1]]
+        heapq.heapify(self.heap)
+
+    def push_front(self, conflicts, agents):
+        for conflict in conflicts:
+            if conflict in self.entries:
+                del self.entries[conflict]
+            elif conflict not in self.front:
+                self.add(conflict, agents)
+        self.front[0:0] = [c for c in conflicts if c not in self.front]
+
+    def pop(self):
+        if self.front:
+            conflict = self.front.pop(0)
+            self.drop(conflict)
+            return conflict
+        heap, entries = self.heap, self.entries
+        while heap:
+            _, number, conflict = heapq.heappop(heap)
+            if entries.get(conflict) == number:
+                del entries[conflict]
+                self.drop(conflict)
+                return conflict
+        raise IndexError("pop from an empty ConflictQueue")
+
+    def peek(self, n):
+        """ The next n conflicts in the order they are served, without removing them """
+        result = self.front[:n]
+        popped = []
+        heap, entries = self.heap, self.entries
+        while len(result) < n and heap:
+            entry = heapq.heappop(heap)
+            if entries.get(entry[2]) == entry[1]:
+                popped.append(entry)
+                result.append(entry[2])
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return result
+
+    def remove(self, conflict, agents):
+        if conflict in self.front:
+            self.front.remove(conflict)
+        elif conflict in self.entries:
+            del self.entries[conflict]
+        else:
+            return
+        self.drop(conflict)
+        self.reprioritize(conflict.agents, agents)
+
+    def conflicts(self):
+        """ All queued conflicts in the order they are served """
+        valid = sorted(e for e in self.heap if self.entries.get(e[2]) == e[1])
+        return self.front + [e[2] for e in valid]
@@ -1,5 +1,6 @@
 from enum import Enum 
-import hashlib
+from itertools import chain
+import numpy as np
 from edges import Edge
 
 class ConflictType(Enum):
@@ -15,24 +16,24 @@ class Conflict:
         self.position = position
         self.edge = edge
         self.path = path
+        self.cached_key = None  # see key()
+
+    def key(self):
+        # identity of the conflict as nested tuples of ints, built once on first use
+        # a conflict must not be changed after it has been hashed or compared
+        if self.cached_key is None:
+            self.cached_key = (self.type.value, self.time, tuple(self.agents), self.position,
+                               self.edge.edge if self.edge is not None else None,
+                               tuple(self.path) if self.path is not None else None)
+        return self.cached_key
 
     def __eq__(self, other):
         if not isinstance(other, Conflict):
             return False
-        return (self.type == other.type and
-                self.time == other.time and
-                self.agents == other.agents and
-                self.position == other.position and
-                self.edge == other.edge and
-                self.path == other.path)
+        return self.key() == other.key()
     
     def __hash__(self):
-        # Create a tuple of relevant attributes and convert it to a string
-        attributes = (self.type, self.time, tuple(self.agents), self.position, self.edge, self.path)
-        attributes_string = ",".join(map(str, attributes))
-        
-        # Use hashlib to create a hash from the string
-        return int(hashlib.sha256(attributes_string.encode()).hexdigest(), 16)
+        return hash(self.key())
     
     def __repr__(self):
         if self.type == ConflictType.EDGE:
@@ -64,16 +65,104 @@ def identify_conflicts(agents, max_length, start = 0):
     conflicts = update_conflicts(conflicts, agents)
     return conflicts
 
+def path_matrix(agents, max_length):
+    """ Dense agents x timesteps int32 matrix of cell ids, -1 after the end of a path
+
+    A cell (x,y) gets the id x * span + y, so comparing ids orders cells the same way as comparing coordinate
+    tuples and normalized edges match Edge. Returns the matrix and span.
+    """
+    lengths = np.fromiter((min(len(ag.path), max_length) for ag in agents), dtype=np.int64, count=len(agents))
+    full_lengths = np.fromiter((len(ag.path) for ag in agents), dtype=np.int64, count=len(agents))
+    total = int(full_lengths.sum())
+    coords = np.fromiter(chain.from_iterable(chain.from_iterable(ag.path for ag in agents)), dtype=np.int64, count=2 * total)
+    xs = coords[0::2]
+    ys = coords[1::2]
+    span = int(ys.max()) + 1 if total > 0 else 1
+    ids = xs * span + ys
+
+    steps = max(0, min(max_length, int(full_lengths.max()) if len(agents) > 0 else 0))
+    matrix = np.full((len(agents), steps), -1, dtype=np.int32)
+    if steps > 0 and total > 0:
+        offsets = np.zeros(len(agents), dtype=np.int64)
+        np.cumsum(full_lengths[:-1], out=offsets[1:])
+        t = np.arange(steps)
+        mask = t[None, :] < lengths[:, None]
+        matrix[mask] = ids[(offsets[:, None] + t[None, :])[mask]]
+    return matrix, span
+
+def duplicate_groups(keys, rows):
+    # keys that occur more than once, the row of their first occurrence and the rows of every group in ascending order
+    order = np.argsort(keys, kind="stable")     # keys are laid out with ascending rows, stable sort keeps that order
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(keys) > 0 else np.zeros(0, dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(keys)])
+    duplicate = counts > 1
+    sorted_rows = rows[order]
+    # only the rows of duplicated keys are converted to Python lists
+    row_lists = sorted_rows[np.repeat(duplicate, counts)].tolist()
+    ends = np.cumsum(counts[duplicate]).tolist()
+    groups = [row_lists[e - c:e] for e, c in zip(ends, counts[duplicate].tolist())]
+    starts = starts[duplicate]
+    return sorted_keys[starts], sorted_rows[starts], groups
+
+def identify_conflicts_vectorized(agents, max_length, start = 0):
+    """ Same list of conflicts as identify_conflicts, found with sorting on path_matrix instead of a dict per timestep """
+    matrix, span = path_matrix(agents, max_length)
+    steps = matrix.shape[1]
+    cells = (int(matrix.max()) + 1) if matrix.size > 0 else 1
+    indexes = [ag.index for ag in agents]
+
+    # position conflicts, step t has time 2t; entries are laid out step by step with ascending rows
+    by_step = matrix.T
+    step_ids, rows = np.nonzero(by_step >= 0)
+    keep = 2 * step_ids >= start
+    step_ids, rows = step_ids[keep], rows[keep]
+    keys = step_ids.astype(np.int64) * cells + by_step[step_ids, rows]
+    pos_keys, pos_first, pos_groups = duplicate_groups(keys, rows)
+    pos_times = 2 * (pos_keys // cells)
+    pos_cells = pos_keys % cells
+
+    # edge conflicts, the edge between steps t-1 and t has time 2t-1 and is used by every agent still on the map at t
+    step_ids, rows = np.nonzero(by_step[1:] >= 0)
+    keep = 2 * step_ids + 1 >= start
+    step_ids, rows = step_ids[keep], rows[keep]
+    a = by_step[step_ids, rows].astype(np.int64)
+    b = by_step[step_ids + 1, rows].astype(np.int64)
+    keys = step_ids.astype(np.int64) * (cells * cells) + np.minimum(a, b) * cells + np.maximum(a, b)
+    edge_keys, edge_first, edge_groups = duplicate_groups(keys, rows)
+    edge_times = 2 * (edge_keys // (cells * cells)) + 1
+    edge_p1 = edge_keys % (cells * cells) // cells
+    edge_p2 = edge_keys % cells
+
+    # identify_conflicts lists conflicts by time and, within a time, in the order their first agent appears
+    times = np.r_[pos_times, edge_times]
+    order = np.lexsort((np.r_[pos_first, edge_first], times)).tolist()
+    n_pos = len(pos_groups)
+    pos_x, pos_y = (pos_cells // span).tolist(), (pos_cells % span).tolist()
+    edge_x1, edge_y1 = (edge_p1 // span).tolist(), (edge_p1 % span).tolist()
+    edge_x2, edge_y2 = (edge_p2 // span).tolist(), (edge_p2 % span).tolist()
+    times = times.tolist()
+    conflicts = []
+    for i in order:
+        if i < n_pos:
+            conflicts.append(Conflict(ConflictType.POSITION, time = times[i], agents = [indexes[r] for r in pos_groups[i]],
+                                      position = (pos_x[i], pos_y[i])))
+        else:
+            j = i - n_pos
+            conflicts.append(Conflict(ConflictType.EDGE, time = times[i], agents = [indexes[r] for r in edge_groups[j]],
+                                      edge = Edge((edge_x1[j], edge_y1[j]), (edge_x2[j], edge_y2[j]))))
+    return update_conflicts(conflicts, agents)
+
 def update_conflicts(conflicts, agents):
     # get all edge conflicts and replicate as path conflicts - add to stack of "unfinished" path conflicts
     stack = []
-    edge_paths = []     # list of path conflicts which are created from existing path conflicts
+    edge_paths = []     # list of path conflicts which are created from existing path conflicts, in the order they are taken
+    starting_at = {}    # (start position, time) -> indexes into edge_paths of the path conflicts starting there, ascending
+    removed = set()     # indexes into edge_paths of path conflicts that were used up
     pos_conflicts = {}  # dictionary of (x,y,time) keys which are position conflicts where value is the actual conflict
     edge_conflicts = {} # dictionary of (x1, y1, x2, y2, time) 
-    i = 0
     confirmed_conflicts = []
-    while i < len(conflicts):
-        con = conflicts[i]
+    for con in conflicts:
         if con.type == ConflictType.EDGE:
             p1 = con.edge.first()
             p2 = con.edge.second()
@@ -87,66 +176,52 @@ def update_conflicts(conflicts, agents):
                 confirmed_conflicts.append(con) 
         else:
             pos_conflicts[(con.position[0], con.position[1], con.time)] = con
-        i += 1
+    for index, ec in enumerate(edge_paths):
+        starting_at.setdefault((ec.path[0], ec.time), []).append(index)
     
     conflicts = confirmed_conflicts
-    used_edges = [] # a set of used edges where elements are of the type (p1,p2,time,[agents]) 
-    while len(edge_paths) > 0 or len(stack) > 0:
+    # used edges as (p1,p2,time) -> list of agent lists; the lists are kept by reference like in a list of
+    # (p1,p2,time,[agents]) tuples, so agents added to a merged edge conflict later are seen by the membership test
+    used_edges = {}
+    next_edge_path = 0  # edge paths are taken in order, this is the first one not taken yet
+    while True:
         while len(stack) > 0:   # give priority to adding finishing paths that are in the process of being "built"
             con = stack.pop()   # take from back/top
             if len(con.path) >= 2:
                 p1 = con.path[-2]
                 p2 = con.path[-1]
                 time = con.time + (2 * (len(con.path) - 1)) - 1
-                key = (p1, p2, time, con.agents)
-                if key in used_edges:
+                used = used_edges.setdefault((p1, p2, time), [])
+                if con.agents in used:
                     continue
                 else:
-                    used_edges.append(key)
+                    used.append(con.agents)
             last_pos = con.path[-1]
             pos_time = con.time + (2 * (len(con.path) - 1))
-            indexes = [] # indexes of edge conflicts in edge_paths that start with pos at time pos_time and its agents are a subset of con.agents
-            updated_edge_paths = []
-            for ec in edge_paths:
-                if ec.path[0] == last_pos and ec.time == pos_time:
-                    indexes.append(edge_paths.index(ec))
-                    updated_edge_paths.append(ec)
-                else:
-                    updated_edge_paths.append(ec)
+            # edge conflicts that start with pos at time pos_time and have not been used up
+            indexes = [ind for ind in starting_at.get((last_pos, pos_time), ()) if ind not in removed and ind >= next_edge_path]
             extended = False
-            only_some_continuing = False
-            if len(indexes) > 0:
-                i = 0
-                while i < len(indexes) and not extended:
-                    ind = indexes[i]
-                    ec = edge_paths[ind]
-                    intersection = []           # agents in both ec and con
-                    con_remainder = []          # agents in con but not in ec
-                    ec_remainder = []           # agents in ec but not in con
-                    for ag in con.agents:   
-                        if ag in ec.agents:
-                            intersection.append(ag)
-                        else:
-                            con_remainder.append(ag)
-                    for ag in ec.agents:
-                        if ag not in intersection:
-                            ec_remainder.append(ag)
-                            
-                    if len(intersection) > 1:   # can extend path, add this extended path with agents from intersection to stack
-                        appended_path = con.path.copy()
-                        appended_path.append(ec.path[1])
-                        stack.append(Conflict(ConflictType.PATH, time = con.time, agents = intersection, path = appended_path))
-                        key = (ec.path[0], ec.path[1], ec.time, intersection)
-                        used_edges.append(key)
-                        extended = True
+            i = 0
+            while i < len(indexes) and not extended:
+                ec = edge_paths[indexes[i]]
+                intersection = []           # agents in both ec and con
+                ec_agents = set(ec.agents)
+                for ag in con.agents:
+                    if ag in ec_agents:
+                        intersection.append(ag)
+                        
+                if len(intersection) > 1:   # can extend path, add this extended path with agents from intersection to stack
+                    appended_path = con.path.copy()
+                    appended_path.append(ec.path[1])
+                    stack.append(Conflict(ConflictType.PATH, time = con.time, agents = intersection, path = appended_path))
+                    used_edges.setdefault((ec.path[0], ec.path[1], ec.time), []).append(intersection)
+                    extended = True
 
-                    if len(ec_remainder) == 0:  # whole edge path used
-                        updated_edge_paths.remove(ec)
-                    i += 1
-                
-                edge_paths = updated_edge_paths
+                if len(intersection) == len(ec_agents):  # whole edge path used
+                    removed.add(indexes[i])
+                i += 1
 
-            if len(indexes) == 0 or (len(indexes) > 0 and not extended) or only_some_continuing:
+            if not extended:
                 if len(con.path) > 2 and len(con.agents) > 1:       # finished path conflict
                     conflicts.append(con)
                 elif len(con.path) == 2 and len(con.agents) > 1:    # relevant edge conflict
@@ -178,11 +253,13 @@ def update_conflicts(conflicts, agents):
                         else:
                             pos_conflicts.pop(key)
                 
-        # when no more path conflicts waiting to be "finished"/made add one from edge_paths
-        if len(edge_paths) == 0:
+        # when no more path conflicts waiting to be "finished"/made add the first remaining one from edge_paths
+        while next_edge_path in removed:
+            next_edge_path += 1
+        if next_edge_path >= len(edge_paths):
             break
-        next_pc = edge_paths.pop(0)
-        stack.append(next_pc)
+        stack.append(edge_paths[next_edge_path])
+        next_edge_path += 1
 
     # add remaining edge and position conflicts to conflicts
     for pc_key in pos_conflicts.keys():
@@ -199,6 +276,18 @@ def update_conflicts(conflicts, agents):
       
     return conflicts
 
+def extend_path_conflict(conflict, agents):
+    # a path conflict found only up to some step goes on for as long as its agents keep moving together
+    paths = [agents[ag].path for ag in conflict.agents]
+    step = conflict.time // 2 + len(conflict.path) - 1
+    while all(len(p) > step + 1 for p in paths):
+        pos = paths[0][step + 1]
+        if pos == paths[0][step] or any(p[step + 1] != pos for p in paths[1:]):
+            break
+        conflict.path.append(pos)
+        step += 1
+    return conflict
+
 def get_conflict_pairs(agents, time, is_position=True):
     pairs = {}
     if is_position: # position conflict
@@ -220,22 +309,27 @@ def get_conflict_pairs(agents, time, is_position=True):
 
 def print_conflict_info(conflicts):
     print("Total conflicts: " + str(len(conflicts)))
+    pos_cs, edge_cs, path_cs = count_conflict_types(conflicts)
+    print("Edge conflicts: " + str(edge_cs))
+    print("Position conflicts: " + str(pos_cs))
+    print("Path conflicts: " + str(path_cs))
+    print()
+    return (pos_cs, edge_cs, path_cs)
+    
+def count_conflict_types(conflicts):
+    # numbers of position, edge and path conflicts
     edge_cs = 0
     pos_cs = 0
     path_cs = 0
-    for i in range(len(conflicts)):
-        if conflicts[i].type == ConflictType.EDGE:
+    for conflict in conflicts:
+        if conflict.type == ConflictType.EDGE:
             edge_cs += 1
-        elif conflicts[i].type == ConflictType.POSITION:
+        elif conflict.type == ConflictType.POSITION:
             pos_cs += 1
         else:
             path_cs += 1
-    print("Edge conflicts: " + str(edge_cs))
-    print("Position conflicts: " + str(pos_cs))
-    print("Path conflicts: " + str(path_cs))
-    print()
     return (pos_cs, edge_cs, path_cs)
-    
+
 def sorting_key(conflict):
     if conflict.type == ConflictType.PATH:
         time = conflict.time + 2 * len(conflict.path)
@@ -249,30 +343,34 @@ def reorder_conflicts(conflicts):
     sorted_conflicts = sorted(conflicts, key=sorting_key)
     return sorted_conflicts
 
-# using output from optimal solver update agent paths and also maximum path length
-def update_agents_from_solution(subproblem, solver_output, all_agents, max_length):
-    lines = solver_output.split("\r\n")
-    lines = lines[9:]
+# using the solution of the optimal solver (a SolverResult) update agent paths and also maximum path length
+# if an OccupancyIndex is given, the changed part of every updated path is re-indexed as well
+def update_agents_from_solution(subproblem, solution, all_agents, max_length, occupancy = None):
     agent_index = 1
-    if len(lines) < len(subproblem.agents):
+    if solution.paths is None or len(solution.paths) < len(subproblem.agents):
         print("insufficient number of agent paths")
-        return
+        return all_agents, max_length
     start_index = int(subproblem.start_time / 2)
     while agent_index <= len(subproblem.agents):
         agent_main_index = subproblem.agent_index_sub_to_main[agent_index]
-        line = lines[agent_index - 1]
-        path_orig = line.split()
         path = []
-        for p in path_orig:
-            path.append(subproblem.nodes_sub_to_main[int(p)])
+        for p in solution.paths[agent_index - 1]:
+            path.append(subproblem.nodes_sub_to_main[p])
         agent_index += 1
-        all_agents[agent_main_index].path = insert_new_subpath(all_agents[agent_main_index].path, path, start_index)
+        all_agents[agent_main_index].path = insert_new_subpath(all_agents[agent_main_index].path, path, start_index,
+                                                               subproblem.dest_steps.get(agent_main_index))
+        if occupancy is not None:
+            occupancy.update(agent_main_index, all_agents[agent_main_index].path, start_index)
         if len(all_agents[agent_main_index].path) > max_length:
             max_length = len(all_agents[agent_main_index].path)
     return all_agents, max_length
 
-def insert_new_subpath(path, subpath, start_index):
-    rem_start_index = path.index(subpath[-1], start_index) + 1
+# end_index is the step of path that subpath ends at, the rest of path follows from there at the same times
+def insert_new_subpath(path, subpath, start_index, end_index = None):
+    if end_index is None:
+        rem_start_index = path.index(subpath[-1], start_index) + 1
+    else:
+        rem_start_index = end_index + 1
     path = path[:start_index] + subpath + path[rem_start_index:]
     return path
 
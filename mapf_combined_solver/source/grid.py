@@ -0,0 +1,125 @@
+import numpy as np
+
+# all possible moves an agent can make, in the order informed_search.get_neighbors has always returned them
+DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+class Grid:
+    """ Array-backed view of a map with integer cell ids and a precomputed adjacency table
+
+    Cell (x,y) has id y * width + x. The adjacency table is stored CSR-style: the neighbors of cell c
+    are neighbor_ids[offsets[c]:offsets[c+1]], in the same order as informed_search.get_neighbors.
+    neighbor_matrix holds the same table padded to one column per direction, with -1 where a move is not possible.
+    """
+    def __init__(self, nodes):
+        height = len(nodes)
+        width = max((len(row) for row in nodes), default=0)
+
+        # free[y, x] is True when there is no obstacle at (x,y); rows that are too short are padded with obstacles
+        free = np.zeros((height, width), dtype=bool)
+        for y, row in enumerate(nodes):
+            free[y, :len(row)] = [c != "@" for c in row]
+        self.build(free)
+
+    @classmethod
+    def from_bitmap(cls, free):
+        grid = cls.__new__(cls)
+        grid.build(np.asarray(free, dtype=bool))
+        return grid
+
+    def __reduce__(self):
+        # only the bitmap is pickled, the tables are rebuilt on the other side
+        return (Grid.from_bitmap, (self.free,))
+
+    def build(self, free):
+        self.height, self.width = free.shape
+        self.size = self.width * self.height
+        self.free = free
+        self.passable = bytearray(free.tobytes())   # one byte per cell id, cheaper to index from Python than the array
+
+        self.offsets, self.neighbor_ids, self.neighbor_matrix = self.build_adjacency()
+
+        # the same table as Python tuples so that hot loops don't index numpy arrays element by element
+        offsets = self.offsets.tolist()
+        ids = self.neighbor_ids.tolist()
+        self.adjacency = [tuple(ids[offsets[c]:offsets[c + 1]]) for c in range(self.size)]
+        w = self.width
+        self.coords = [(c % w, c // w) for c in range(self.size)]
+        coords = self.coords
+        self.neighbor_coords = [tuple([coords[n] for n in adj]) for adj in self.adjacency]
+        self.components = None      # connected part of the map of every cell id, labeled on first use
+
+    def build_adjacency(self):
+        h, w = self.height, self.width
+        ys, xs = np.mgrid[0:h, 0:w]
+        ys = ys.ravel()
+        xs = xs.ravel()
+        flat_free = self.free.ravel()
+
+        # candidate[c, d] is the id of the neighbor of cell c in direction d, or -1 if the move is not possible
+        candidate = np.full((self.size, len(DIRECTIONS)), -1, dtype=np.int32)
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            nx = xs + dx
+            ny = ys + dy
+            inside = (nx >= 0) & (nx < w) & (ny >= 0) & (ny < h)
+            ids = np.where(inside, ny * w + nx, 0)
+            valid = inside & flat_free[ids]
+            candidate[valid, d] = ids[valid]
+
+        counts = (candidate >= 0).sum(axis=1)
+        offsets = np.zeros(self.size + 1, dtype=np.int32)
+        np.cumsum(counts, out=offsets[1:])
+        neighbor_ids = candidate[candidate >= 0]     # row-major, so direction order is kept within a cell
+        return offsets, neighbor_ids.astype(np.int32), candidate
+
+    def in_bounds(self, coord):
+        return 0 <= coord[0] < self.width and 0 <= coord[1] < self.height
+
+    def is_free(self, coord):
+        return self.in_bounds(coord) and self.passable[coord[1] * self.width + coord[0]] == 1
+
+    def cell_id(self, coord):
+        return coord[1] * self.width + coord[0]
+
+    def coord(self, cell):
+        return self.coords[cell]
+
+    def neighbors(self, coord):
+        if self.in_bounds(coord):
+            return self.neighbor_coords[coord[1] * self.width + coord[0]]
+        # coordinates outside of the map are never stored in the table, compute their neighbors directly
+        result = []
+        for dx, dy in DIRECTIONS:
+            n = (coord[0] + dx, coord[1] + dy)
+            if self.is_free(n):
+                result.append(n)
+        return tuple(result)
+
+    def neighbor_cells(self, cell):
+        return self.adjacency[cell]
+
+    def connected(self, a, b):
+        # whether there is a path between coordinates a and b
+        if self.components is None:
+            self.components = self.label_components()
+        return self.components[self.cell_id(a)] == self.components[self.cell_id(b)]
+
+    def label_components(self):
+        # breadth-first search from every free cell that has no label yet, obstacles keep -1
+        labels = [-1] * self.size
+        adjacency, passable = self.adjacency, self.passable
+        label = 0
+        for start in range(self.size):
+            if not passable[start] or labels[start] >= 0:
+                continue
+            labels[start] = label
+            frontier = [start]
+            while frontier:
+                nxt = []
+                for c in frontier:
+                    for n in adjacency[c]:
+                        if labels[n] < 0:
+                            labels[n] = label
+                            nxt.append(n)
+                frontier = nxt
+            label += 1
+        return labels
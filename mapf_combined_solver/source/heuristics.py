@@ -0,0 +1,90 @@
+import os
+import hashlib
+from array import array
+from collections import OrderedDict
+import numpy as np
+
+UNREACHABLE = -1
+
+def distance_field(grid, destination):
+    """ Backward BFS from cell destination, returns the distance of every cell to it (UNREACHABLE if there is none) """
+    dist = np.full(grid.size, UNREACHABLE, dtype=np.int32)
+    dist[destination] = 0
+    neighbor_matrix = grid.neighbor_matrix
+    frontier = np.array([destination], dtype=np.int32)
+    level = 0
+    while frontier.size > 0:
+        level += 1
+        nb = neighbor_matrix[frontier].ravel()
+        nb = nb[nb >= 0]
+        nb = np.unique(nb[dist[nb] == UNREACHABLE])
+        dist[nb] = level
+        frontier = nb
+    return dist
+
+class DistanceTableCache:
+    """ Exact distance-to-goal heuristic for A*, one BFS distance table per destination cell
+
+    Tables are kept as compact int arrays in an LRU cache bounded by max_bytes. When spill_dir is given, tables
+    evicted from memory are written there and loaded back instead of running the BFS again, which also lets
+    several runs on the same map share them.
+    """
+    def __init__(self, grid, max_bytes=256 * 1024 * 1024, spill_dir=None):
+        self.grid = grid
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.table_bytes = 4 * grid.size
+        self.tables = OrderedDict()     # destination cell -> array of distances, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        # tables on disk are only valid for the exact same map
+        self.map_key = hashlib.sha1(grid.free.tobytes() + str(grid.free.shape).encode()).hexdigest()[:16]
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def spill_path(self, destination):
+        return os.path.join(self.spill_dir, f"{self.map_key}_{destination}.npy")
+
+    def get(self, destination):
+        table = self.tables.get(destination)
+        if table is not None:
+            self.tables.move_to_end(destination)
+            self.hits += 1
+            return table
+
+        self.misses += 1
+        field = None
+        if self.spill_dir and os.path.exists(self.spill_path(destination)):
+            field = np.load(self.spill_path(destination))
+            self.disk_hits += 1
+        if field is None:
+            field = distance_field(self.grid, destination)
+        table = array("i")
+        table.frombytes(field.astype(np.int32, copy=False).tobytes())
+
+        self.tables[destination] = table
+        while len(self.tables) > 1 and len(self.tables) * self.table_bytes > self.max_bytes:
+            self.evict()
+        return table
+
+    def get_coord(self, destination_coord):
+        return self.get(self.grid.cell_id(destination_coord))
+
+    def distance(self, origin_coord, destination_coord):
+        return self.get_coord(destination_coord)[self.grid.cell_id(origin_coord)]
+
+    def evict(self):
+        destination, table = self.tables.popitem(last=False)
+        self.evictions += 1
+        if self.spill_dir and not os.path.exists(self.spill_path(destination)):
+            # write to a temporary file first so that other runs never load a partially written table
+            path = self.spill_path(destination)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.frombuffer(table, dtype=np.int32))
+            os.replace(path + ".tmp", path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                "evictions": self.evictions, "tables": len(self.tables)}
@@ -1,4 +1,5 @@
 import heapq
+from grid import Grid
 
 class Vertex:
     """ Additional data for every vertex visited by A* """
@@ -56,6 +57,8 @@ def get_path(origin, destination):
     return path1
 
 def valid_node(nodes, node):
+    if isinstance(nodes, Grid):
+        return nodes.is_free(node)
     if node[0] >= 0 and node[0] < len(nodes[0]): # x is within bounds
         if node[1] >= 0 and node[1] < len(nodes): # y is within bounds
             if nodes[node[1]][node[0]] != "@": # check for presence of obstacle
@@ -63,6 +66,8 @@ def valid_node(nodes, node):
     return False
 
 def get_neighbors(nodes, node):
+    if isinstance(nodes, Grid):
+        return nodes.neighbors(node)   # precomputed adjacency, no bounds checks needed
     nextNodes = []
     possibleDirections = [[0,1], [1,0], [0,-1], [-1,0]] # all possible moves agent can make
     for d in possibleDirections:
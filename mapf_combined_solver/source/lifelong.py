@@ -0,0 +1,308 @@
+import argparse
+import logging
+import time
+
+import map
+from conflicts import agents_stay_at_destination
+from heuristics import DistanceTableCache
+from metrics import DISABLED, Metrics, MeteredBackend
+from occupancy import OccupancyIndex
+from parallel_solving import SolverPool
+from search_engine import SearchEngine, JumpPointSearch
+from solution_cache import SolutionCache
+from solver_api import Problem, Config, ConflictRepair
+from solver_backend import BACKENDS, create_backend
+from utils import update_edge_dict
+
+logger = logging.getLogger(__name__)
+
+class LifelongSolver:
+    """ Keeps a plan for agents that get new goals while they move
+
+    Paths are indexed by the steps of the plan, self.now is the step the agents are at. assign gives agents new
+    goals: only those agents are replanned, from where the plan has them at step now, with the search of
+    config.search_mode, and then the conflicts of the plan after step now are repaired with the same subproblems
+    as solve. Conflicts that were repaired before are not found again, so an assignment costs the search of its
+    agents and the repair of the conflicts they bring in, not a new solve. advance moves the clock; the steps
+    before it can no longer change and are dropped once they are as many as the steps ahead, so the plan doesn't
+    grow while the solver runs.
+    """
+    def __init__(self, grid, positions, config = None, metrics = DISABLED, heuristic = None, backend = None,
+                 solution_cache = None, engine = None):
+        if config is None:
+            config = Config()
+        self.config = config
+        self.metrics = metrics
+        # agents start without a goal, waiting where they are
+        problem = Problem(grid, [(p, p) for p in positions])
+        self.grid = problem.grid
+        self.agents = problem.agents()
+        for agent in self.agents:
+            agent.path = [agent.origin]
+        self.now = 0                # step of the plan the agents are at
+        self.offset = 0             # steps dropped from the front of the plan, self.offset + self.now is the time
+        self.max_length = 1
+        self.occupancy = OccupancyIndex(self.agents)
+        self.busy = {}              # agent index -> step its current goal was assigned at, until it is reached
+        self.edge_use = {}          # edges of the planned paths for modified A*, as in the initial planning of solve
+        self.conflicts = []         # conflicts left by the last repair
+        self.collisions = 0         # conflicts the clock has passed without them being repaired
+
+        if heuristic is None and config.distance_heuristic:
+            heuristic = DistanceTableCache(self.grid, config.heuristic_cache_mb * 1024 * 1024, config.heuristic_spill_dir)
+        if engine is None:
+            engine = SearchEngine(self.grid, heuristic)
+        self.engine = engine
+        self.jps = JumpPointSearch(self.grid, heuristic) if config.search_mode == "jps" else None
+        self.own_backend = backend is None
+        if self.own_backend:
+            backend = create_backend(config.solver_backend)
+        self.backend = backend
+        if metrics.enabled:
+            backend = MeteredBackend(backend, metrics)
+        if solution_cache is None and config.solution_cache_size > 0:
+            solution_cache = SolutionCache(config.solution_cache_size, config.solution_cache_dir, config.solver_backend)
+        self.solution_cache = solution_cache
+        self.solver_pool = None
+        if config.solve_workers > 1:
+            self.solver_pool = SolverPool(config.solver_backend, config.solve_workers)
+        self.repair = ConflictRepair(self.grid, config, backend, solution_cache, self.solver_pool, metrics)
+
+    @property
+    def time(self):
+        # steps since the solver was created
+        return self.offset + self.now
+
+    def positions(self):
+        return [agent.path[self.now] for agent in self.agents]
+
+    def plan_ahead(self, index):
+        # the path of an agent from the current step on
+        return self.agents[index].path[self.now:]
+
+    def search(self, origin, destination):
+        if self.config.search_mode == "modified":
+            path = self.engine.modified_search(origin, destination, self.edge_use)
+        elif self.jps is not None:
+            path = self.jps.search(origin, destination)
+        else:
+            path = self.engine.search(origin, destination)
+        if not path:
+            raise ValueError(f"There is no path from {origin} to {destination}")
+        return path
+
+    def assign(self, goals):
+        """ Gives agents new goals, {agent index: (x, y)}, and repairs the conflicts their new paths bring in
+
+        An agent that still has a goal drops it. Returns the conflicts of the plan that are left, the ones the
+        repair gave up on or didn't get to within config.timeout seconds.
+        """
+        goals = {index: tuple(goal) for index, goal in goals.items()}
+        for index, goal in goals.items():
+            if not 0 <= index < len(self.agents):
+                raise ValueError(f"There is no agent {index}")
+            if not self.grid.is_free(goal):
+                raise ValueError(f"The goal {goal} of agent {index} is not a free cell of the map")
+        metrics = self.metrics
+
+        start_time = time.time()
+        now = self.now
+        modified = self.config.search_mode == "modified"
+        paths = {}
+        try:
+            for index, goal in goals.items():
+                path = self.search(self.agents[index].path[now], goal)
+                if modified:
+                    # later agents of the assignment avoid the edges of this one, like in the initial planning
+                    remove_edges(self.agents[index].path[now:], self.edge_use)
+                    update_edge_dict(path, self.edge_use)
+                paths[index] = path
+        except ValueError:
+            # the plan stays as it was
+            if modified:
+                for index, path in paths.items():
+                    remove_edges(path, self.edge_use)
+                    update_edge_dict(self.agents[index].path[now:], self.edge_use)
+            raise
+        for index, path in paths.items():
+            agent = self.agents[index]
+            agent.origin = path[0]
+            agent.destination = goals[index]
+            agent.path = agent.path[:now] + path
+            self.busy[index] = now
+            self.max_length = max(self.max_length, len(agent.path))
+        self.agents = agents_stay_at_destination(self.agents, self.max_length)
+        self.occupancy.sync(self.agents, goals.keys())
+        self.repair.paths_changed()
+        metrics.add_phase("replanning", time.time() - start_time)
+        metrics.count("tasks_assigned", len(goals))
+
+        # conflicts at step now have happened already, the first one that can be repaired is on the way to step now + 1
+        start_time = time.time()
+        self.repair.start = 2 * now + 1
+        conflicts = self.repair.detect(self.agents, self.occupancy)
+        metrics.add_phase("conflict_detection", time.time() - start_time)
+        metrics.observe("conflicts_per_assignment", len(conflicts))
+        # run drops a flagged conflict that fails again, run_range looks for the conflicts again until only those
+        # given up on are left
+        self.agents, self.conflicts, self.max_length, repair_time = self.repair.run_range(
+            self.agents, self.max_length, self.occupancy, self.config.timeout, conflicts)
+        metrics.add_phase("conflict_solving", repair_time)
+        self.trim()
+        if self.conflicts:
+            # the repair ran out of time, the conflicts it dropped are still in the plan
+            start_time = time.time()
+            self.conflicts = self.repair.detect(self.agents, self.occupancy)
+            metrics.add_phase("conflict_detection", time.time() - start_time)
+        logger.info(f"Assigned {len(goals)} goals at time {self.time}, {len(conflicts)} conflicts found, "
+                    f"{len(self.conflicts)} left after {repair_time} seconds")
+        return self.conflicts
+
+    def trim(self):
+        # a repaired path can end with more waits at its destination than before, the plan only has to be as long as
+        # the longest path without its final waits
+        length = self.now + 1
+        for agent in self.agents:
+            path = agent.path
+            i = len(path) - 1
+            while i >= length and path[i] == path[i - 1]:
+                i -= 1
+            length = max(length, i + 1)
+        if length < self.max_length:
+            self.max_length = length
+            self.agents = agents_stay_at_destination(self.agents, length)
+            self.occupancy.sync(self.agents, [])
+
+    def advance(self, steps = 1):
+        """ Moves the clock steps forward, returns (agent index, time) of every agent that reached its goal,
+        the time being when it got there """
+        old = self.now
+        self.now += steps
+        if self.now >= self.max_length:
+            # every agent has reached the end of its path and waits there
+            self.max_length = self.now + 1
+            self.agents = agents_stay_at_destination(self.agents, self.max_length)
+            self.occupancy.sync(self.agents, [])
+        self.count_collisions(old + 1, self.now)
+
+        arrived = []
+        for index, assigned in list(self.busy.items()):
+            path = self.agents[index].path
+            goal = self.agents[index].destination
+            if path[self.now] != goal or any(p != goal for p in path[self.now:]):
+                continue
+            step = self.now
+            while step > assigned and path[step - 1] == goal:
+                step -= 1
+            arrived.append((index, self.offset + step))
+            del self.busy[index]
+        arrived.sort(key=lambda a: (a[1], a[0]))
+        self.metrics.count("tasks_completed", len(arrived))
+
+        if 2 * self.now >= self.max_length:
+            self.drop_past()
+        return arrived
+
+    def count_collisions(self, first, last):
+        # conflicts at the steps the clock went past, they can't be repaired any more
+        occupancy = self.occupancy
+        n = sum(1 for _, step in occupancy.vertex_conflicts if first <= step <= last)
+        n += sum(1 for _, step in occupancy.edge_conflicts if first <= step <= last)
+        if n > 0:
+            logger.info(f"{n} conflicts were not repaired before time {self.offset + last}")
+            self.collisions += n
+            self.metrics.count("collisions", n)
+
+    def drop_past(self):
+        # the plan starts at the current step again, what the repair knew about conflicts has the old step numbers
+        now = self.now
+        for agent in self.agents:
+            agent.path = agent.path[now:]
+        self.busy = {index: max(0, assigned - now) for index, assigned in self.busy.items()}
+        self.offset += now
+        self.max_length -= now
+        self.now = 0
+        self.occupancy = OccupancyIndex(self.agents)
+        self.conflicts = []
+        self.repair.unsolveable_conflicts.clear()
+        self.repair.flagged_conflicts.clear()
+        self.repair.paths_changed()
+
+    def close(self):
+        if self.own_backend:
+            self.backend.close()
+        if self.solver_pool is not None:
+            self.solver_pool.close()
+        if self.solution_cache is not None:
+            logger.info(f"Solution cache: {self.solution_cache.stats()}")
+
+def remove_edges(path, diction):
+    # undoes update_edge_dict for a path that is replaced
+    for i in range(len(path) - 1):
+        edge = (path[i], path[i+1])
+        count = diction.get(edge, 0) - 1
+        if count > 0:
+            diction[edge] = count
+        else:
+            diction.pop(edge, None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a lifelong MAPF run: agents get a new goal whenever they reach one")
+    parser.add_argument("-s", "--scen-file", type=str, default="maze-32-32-4-even-2.scen")
+    parser.add_argument("-n", "--number-agents", type=int, default=30)
+    parser.add_argument("--steps", type=int, default=200)          # timesteps simulated
+    parser.add_argument("--search-mode", type=str, choices=["modified", "astar", "jps"], default="modified")
+    parser.add_argument("--solver-backend", type=str, choices=sorted(BACKENDS), default="picat")
+    parser.add_argument("--solve-workers", type=int, default=1)
+    parser.add_argument("--solution-cache-size", type=int, default=10000)
+    parser.add_argument("-t", "--timeout", type=int, default=10)   # seconds of conflict repair per assignment
+    parser.add_argument("--metrics-file", type=str, default=None)
+    parser.add_argument("--log-file", type=str, default=None)
+    parser.add_argument("--log-level", type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO")
+    args = parser.parse_args()
+    if args.log_file is not None:
+        logging.basicConfig(filename=args.log_file, level=args.log_level,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # the first n agents of the scenario start at their origins with their destinations as first goals, the
+    # destinations of all agents of the scenario in order are the tasks handed out after that
+    main_map = map.map(args.scen_file, -1)
+    scenario = main_map.agents
+    n = len(scenario) if args.number_agents == -1 else min(args.number_agents, len(scenario))
+    tasks = [agent.destination for agent in scenario]
+    next_task = n % len(tasks)
+
+    config = Config(search_mode=args.search_mode, solver_backend=args.solver_backend, solve_workers=args.solve_workers,
+                    solution_cache_size=args.solution_cache_size, timeout=args.timeout)
+    metrics = Metrics(args.metrics_file is not None)
+    solver = LifelongSolver(main_map.grid, [agent.origin for agent in scenario[:n]], config, metrics)
+    goals = {i: scenario[i].destination for i in range(n)}
+    completed = 0
+    assign_times = []
+    start = time.time()
+    try:
+        for _ in range(args.steps):
+            if goals:
+                t = time.time()
+                solver.assign(goals)
+                assign_times.append(time.time() - t)
+            goals = {}
+            for index, _ in solver.advance():
+                completed += 1
+                goals[index] = tasks[next_task]
+                next_task = (next_task + 1) % len(tasks)
+    finally:
+        solver.close()
+    elapsed = time.time() - start
+
+    print(f"Simulated {args.steps} steps of {n} agents in {elapsed:.2f} seconds")
+    print(f"Tasks completed: {completed} ({completed / args.steps:.2f} per step)")
+    if assign_times:
+        print(f"Assignments: {len(assign_times)}, mean {sum(assign_times) / len(assign_times):.3f} s, max {max(assign_times):.3f} s")
+    print(f"Conflicts left in the plan: {len(solver.conflicts)}")
+    print(f"Conflicts reached before they were repaired: {solver.collisions}")
+    if args.metrics_file is not None:
+        metrics.write_summary(args.metrics_file)
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,61 @@
 from agent import Agent
+from grid import Grid
 import random
+import map_cache
+
+MAPS_DIR = "./source/resources/maps/"
+SCENS_DIR = "./source/resources/scens/"
 
 class map:
-    def __init__(self, scen_file, n_of_agents = -1, percentage_of_agents=100):
+    def __init__(self, scen_file, n_of_agents = -1, percentage_of_agents=100, cache_dir = None):
+        if cache_dir is not None:
+            # compiled binary form of the map and scenario, only the selected agents are read from it
+            compiled = map_cache.load(scen_file, cache_dir, MAPS_DIR, SCENS_DIR)
+            self.map_file = compiled.map_file
+            indices = compiled.agent_indices(n_of_agents, percentage_of_agents)
+            rows = compiled.agent_rows[indices].tolist()
+            self.agents = [Agent((ox, oy), (dx, dy), i) for i, (ox, oy, dx, dy) in enumerate(rows)]
+            self.nodes = compiled.nodes()
+            self.grid = compiled.grid()
+            return
         self.agents, self.map_file = read_agents(scen_file, n_of_agents, percentage_of_agents)
         self.nodes = self.read_map()
+        self.grid = Grid(self.nodes)     # obstacle bitmap and adjacency table, built once per map
 
     def read_map(self):
-        fileReader = open("./source/resources/maps/" + self.map_file, "r")
+        return read_map_file(self.map_file)
+
+def read_map_file(map_file):
+    fileReader = open(MAPS_DIR + map_file, "r")
 
-        # read first lines of file which describe the map
-        line = fileReader.readline() # type of map 
-        line = fileReader.readline() # height 
-        tokens = line.split(" ")     # line looks like "height X" where X is an integer
-        height = int(tokens[1])
-        line = fileReader.readline() # width
-        tokens = line.split(" ")
-        width = int(tokens[1])
-        fileReader.readline() # line just says "map"
+    # read first lines of file which describe the map
+    line = fileReader.readline() # type of map 
+    line = fileReader.readline() # height 
+    tokens = line.split(" ")     # line looks like "height X" where X is an integer
+    height = int(tokens[1])
+    line = fileReader.readline() # width
+    tokens = line.split(" ")
+    width = int(tokens[1])
+    fileReader.readline() # line just says "map"
 
-        # read actual map into a 2D array
-        line = 1
-        nodes = []    
-        while line <= height:
-            s = fileReader.readline()
-            s = s.replace('T', '@')
-            row = list(s)
-            row.pop()     # remove '\n' which is the last element of the list
-            if len(row) != width:
-                print("Map defined incorecctly.") 
-            nodes.append(row)
-            line += 1
+    # read actual map into a 2D array
+    line = 1
+    nodes = []    
+    while line <= height:
+        s = fileReader.readline()
+        s = s.replace('T', '@')
+        row = list(s)
+        row.pop()     # remove '\n' which is the last element of the list
+        if len(row) != width:
+            print("Map defined incorecctly.") 
+        nodes.append(row)
+        line += 1
 
-        fileReader.close()
-        return nodes
+    fileReader.close()
+    return nodes
 
 def read_agents(filename, n_of_agents=-1, percentage_of_agents=100):
-    fileReader = open("./source/resources/scens/" + filename, "r")
+    fileReader = open(SCENS_DIR + filename, "r")
     
     if n_of_agents != -1:   # if number of agents to process was specified
         max_agents = True
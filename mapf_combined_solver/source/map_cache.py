@@ -0,0 +1,124 @@
+import os
+import struct
+import hashlib
+import random
+import numpy as np
+from grid import Grid
+
+MAGIC = b"MAPFBIN1"
+# magic, content hash of both files, content hash of the map, height, width, number of agents,
+# length of the map file name, size and modification time of the .map and the .scen file when the file was compiled
+HEADER = struct.Struct("<8s20s20sIIIIqqqq")
+
+grids = {}      # map content hash -> Grid, every map is turned into a Grid once per process
+
+def align(offset):
+    return (offset + 7) // 8 * 8
+
+def source_stats(map_path, scen_path):
+    stats = []
+    for path in (map_path, scen_path):
+        st = os.stat(path)
+        stats += [st.st_size, st.st_mtime_ns]
+    return stats
+
+def content_hash(*paths):
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.digest()
+
+class CompiledScenario:
+    """ A .scen file and its .map compiled into one binary file that is memory-mapped when loaded
+
+    The file holds a header with a content hash of both source files, the name of the map file, the map as one
+    byte per cell ('T' already replaced by '@') and the agents as an int32 array of rows (origin x, origin y,
+    destination x, destination y). Only the pages of the agents that are used are read from disk.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, self.hash, self.map_hash, height, width, n, name_len, *self.stats = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled scenario")
+        offset = HEADER.size
+        self.map_file = bytes(self.data[offset:offset + name_len]).decode()
+        offset = align(offset + name_len)
+        self.chars = self.data[offset:offset + height * width].reshape(height, width)
+        offset = align(offset + height * width)
+        self.agent_rows = self.data[offset:offset + 16 * n].view(np.int32).reshape(n, 4)
+
+    @staticmethod
+    def write(path, chars, agent_rows, map_file, digest, map_digest, stats):
+        # written to a temporary file first so that other runs never map a partially written file
+        name = map_file.encode()
+        height, width = chars.shape
+        with open(path + ".tmp", "wb") as f:
+            f.write(HEADER.pack(MAGIC, digest, map_digest, height, width, len(agent_rows), len(name), *stats))
+            f.write(name)
+            f.write(b"\0" * (align(f.tell()) - f.tell()))
+            f.write(np.ascontiguousarray(chars, dtype=np.uint8).tobytes())
+            f.write(b"\0" * (align(f.tell()) - f.tell()))
+            f.write(np.ascontiguousarray(agent_rows, dtype=np.int32).tobytes())
+        os.replace(path + ".tmp", path)
+
+    def nodes(self):
+        # the map as read_map returns it, a list of rows of characters
+        return [list(bytes(row).decode()) for row in self.chars]
+
+    def free(self):
+        return self.chars != ord("@")
+
+    def grid(self):
+        # Grids are never changed after they are built, so loads of the same map share one
+        grid = grids.get(self.map_hash)
+        if grid is None:
+            grid = Grid.from_bitmap(self.free())
+            grids[self.map_hash] = grid
+        return grid
+
+    def agent_indices(self, n_of_agents = -1, percentage_of_agents = 100):
+        """ Indices of the agents read_agents would return for the same arguments, drawing the same random sample """
+        count = len(self.agent_rows)
+        if n_of_agents != -1:
+            count = min(count, n_of_agents)
+        if percentage_of_agents < 100:
+            return random.sample(range(count), int(count * (percentage_of_agents / 100)))
+        return range(count)
+
+def load(scen_file, cache_dir, maps_dir, scens_dir):
+    """ Compiled form of scen_file from cache_dir, compiled again when a source file changed
+
+    A source file whose size and modification time are unchanged is trusted. Otherwise the content hash decides
+    whether the compiled file is still valid.
+    """
+    from map import read_agents, read_map_file     # map uses this module, imported here to avoid a cycle
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, scen_file + ".bin")
+    scen_path = os.path.join(scens_dir, scen_file)
+    compiled = None
+    if os.path.exists(path):
+        try:
+            compiled = CompiledScenario(path)
+        except (ValueError, struct.error):
+            compiled = None         # written by another version or truncated, compiled again
+    if compiled is not None:
+        map_path = os.path.join(maps_dir, compiled.map_file)
+        if os.path.exists(map_path) and source_stats(map_path, scen_path) == compiled.stats:
+            return compiled
+        if os.path.exists(map_path) and content_hash(map_path, scen_path) == compiled.hash:
+            # only touched, record the new times
+            CompiledScenario.write(path, compiled.chars, compiled.agent_rows, compiled.map_file, compiled.hash, compiled.map_hash, source_stats(map_path, scen_path))
+            return CompiledScenario(path)
+
+    agents, map_file = read_agents(scen_file, -1, 100)
+    map_path = os.path.join(maps_dir, map_file)
+    nodes = read_map_file(map_file)
+    width = max((len(row) for row in nodes), default=0)
+    chars = np.full((len(nodes), width), ord("@"), dtype=np.uint8)  # rows that are too short are padded with obstacles
+    for y, row in enumerate(nodes):
+        chars[y, :len(row)] = np.frombuffer("".join(row).encode(), dtype=np.uint8)
+    agent_rows = np.array([[a.origin[0], a.origin[1], a.destination[0], a.destination[1]] for a in agents], dtype=np.int32).reshape(-1, 4)
+    CompiledScenario.write(path, chars, agent_rows, map_file, content_hash(map_path, scen_path), content_hash(map_path), source_stats(map_path, scen_path))
+    return CompiledScenario(path)
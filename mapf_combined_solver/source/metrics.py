@@ -0,0 +1,114 @@
+import json
+import time
+
+class Metrics:
+    """ Counters, summaries of observed values and phase times of one solver run
+
+    count adds to a counter, observe adds a value to the count, total, minimum and maximum kept under its name,
+    and phase times a block of code; phases may be nested and a phase entered several times adds up. A disabled
+    Metrics returns from every method at once, so instrumented code needs no checks of its own. With a trace
+    file every finished phase and every event is also written to it as one JSON line when it happens.
+    """
+    def __init__(self, enabled = True, trace_file = None):
+        self.enabled = enabled or trace_file is not None
+        self.counters = {}
+        self.values = {}        # name -> [count, total, min, max]
+        self.phases = {}        # name -> [times entered, seconds]
+        self.start = time.time()
+        self.trace = open(trace_file, "w") if trace_file is not None else None
+
+    def count(self, name, n = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        v = self.values.get(name)
+        if v is None:
+            self.values[name] = [1, value, value, value]
+        else:
+            v[0] += 1
+            v[1] += value
+            v[2] = min(v[2], value)
+            v[3] = max(v[3], value)
+
+    def phase(self, name):
+        return Phase(self, name) if self.enabled else NO_PHASE
+
+    def add_phase(self, name, seconds):
+        # for phases whose time is measured by the code itself
+        if not self.enabled:
+            return
+        p = self.phases.setdefault(name, [0, 0.0])
+        p[0] += 1
+        p[1] += seconds
+        self.event("phase", name=name, seconds=seconds)
+
+    def event(self, kind, **fields):
+        if self.trace is not None:
+            record = {"time": round(time.time() - self.start, 6), "event": kind}
+            record.update(fields)
+            self.trace.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        values = {}
+        for name, (n, total, low, high) in self.values.items():
+            values[name] = {"count": n, "total": total, "mean": total / n, "min": low, "max": high}
+        phases = {name: {"entered": n, "seconds": seconds} for name, (n, seconds) in self.phases.items()}
+        return {"seconds": time.time() - self.start, "phases": phases, "counters": dict(sorted(self.counters.items())),
+                "values": values}
+
+    def write_summary(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def close(self):
+        if self.trace is not None:
+            self.event("summary", **self.summary())
+            self.trace.close()
+            self.trace = None
+
+class Phase:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_phase(self.name, time.perf_counter() - self.start)
+        return False
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_PHASE = NullPhase()
+DISABLED = Metrics(enabled=False)     # default of the functions that take a Metrics
+
+class MeteredBackend:
+    """ Solver backend that records every call of the backend it wraps: the number of calls and of each result
+    status, and the wall time of the solver """
+    def __init__(self, backend, metrics):
+        self.backend = backend
+        self.metrics = metrics
+
+    def solve(self, instance):
+        result = self.backend.solve(instance)
+        record_result(self.metrics, result)
+        return result
+
+    def close(self):
+        self.backend.close()
+
+def record_result(metrics, result):
+    # also used for results that come back from worker processes
+    metrics.count("solver_calls")
+    metrics.count("solver_" + result.status)
+    metrics.observe("solver_seconds", result.elapsed)
@@ -0,0 +1,153 @@
+from bisect import insort
+from conflicts import Conflict, ConflictType, update_conflicts
+from edges import Edge
+
+class OccupancyIndex:
+    """ Space-time index of agent paths used to find conflicts incrementally
+
+    Maps (position, step) and (edge, step) to the sorted list of agents that occupy them, where step is an index
+    into the paths and the edge at step i is the one between path[i-1] and path[i]. Keys with more than one agent
+    are kept in two sets, so after a path changes only its changed part is re-indexed and the conflict set is
+    known without rescanning all agents.
+    """
+    def __init__(self, agents):
+        self.paths = {}             # agent index -> path currently in the index
+        self.vertices = {}          # (position, step) -> sorted list of agent indices
+        self.positions = {}         # position -> {step: the same list as in vertices}, for queries by area
+        self.edges = {}             # ((p1, p2), step) -> sorted list of agent indices, edge stored like Edge.edge
+        self.vertex_conflicts = set()
+        self.edge_conflicts = set()
+        for agent in agents:
+            self.paths[agent.index] = list(agent.path)
+            self.add(agent.index, agent.path, 0)
+
+    def add(self, agent, path, start):
+        vertices, edges = self.vertices, self.edges
+        for i in range(start, len(path)):
+            key = (path[i], i)
+            occupants = vertices.get(key)
+            if occupants is None:
+                occupants = vertices[key] = [agent]
+                steps = self.positions.get(path[i])
+                if steps is None:
+                    self.positions[path[i]] = {i: occupants}
+                else:
+                    steps[i] = occupants
+            else:
+                insort(occupants, agent)
+                self.vertex_conflicts.add(key)
+            if i > 0:
+                p1, p2 = path[i - 1], path[i]
+                key = ((p1, p2) if p1 < p2 else (p2, p1), i)
+                occupants = edges.get(key)
+                if occupants is None:
+                    edges[key] = [agent]
+                else:
+                    insort(occupants, agent)
+                    self.edge_conflicts.add(key)
+
+    def remove(self, agent, path, start):
+        vertices, edges = self.vertices, self.edges
+        for i in range(start, len(path)):
+            key = (path[i], i)
+            occupants = vertices[key]
+            occupants.remove(agent)
+            if len(occupants) < 2:
+                self.vertex_conflicts.discard(key)
+                if not occupants:
+                    del vertices[key]
+                    steps = self.positions[path[i]]
+                    del steps[i]
+                    if not steps:
+                        del self.positions[path[i]]
+            if i > 0:
+                p1, p2 = path[i - 1], path[i]
+                key = ((p1, p2) if p1 < p2 else (p2, p1), i)
+                occupants = edges[key]
+                occupants.remove(agent)
+                if len(occupants) < 2:
+                    self.edge_conflicts.discard(key)
+                    if not occupants:
+                        del edges[key]
+
+    def update(self, agent, path, start=0):
+        """ Replaces the path of an agent, start is a step before which the new path is known to be unchanged
+
+        Returns the keys that became conflicts and the keys that stopped being conflicts.
+        """
+        old = self.paths[agent]
+        # first step where the paths differ
+        d = min(start, len(old), len(path))
+        end = min(len(old), len(path))
+        while d < end and old[d] == path[d]:
+            d += 1
+        if d == len(old) and d == len(path):
+            return set(), set()
+
+        before = self.conflict_keys_from(old, d) | self.conflict_keys_from(path, d)
+        # edges at step d use path[d - 1], so they change together with the position at step d
+        self.remove(agent, old, d)
+        self.paths[agent] = list(path)
+        self.add(agent, path, d)
+        after = self.conflict_keys_from(old, d) | self.conflict_keys_from(path, d)
+        return after - before, before - after
+
+    def conflict_keys_from(self, path, start):
+        # keys at or after step start of the path that are currently conflicts
+        keys = set()
+        for i in range(start, len(path)):
+            key = (path[i], i)
+            if key in self.vertex_conflicts:
+                keys.add(key)
+            if i > 0:
+                p1, p2 = path[i - 1], path[i]
+                key = ((p1, p2) if p1 < p2 else (p2, p1), i)
+                if key in self.edge_conflicts:
+                    keys.add(key)
+        return keys
+
+    def visits(self, positions, start, end):
+        """ (position, step, sorted agent indices) for every step from start to end at which one of the positions
+        is occupied, the cost depends on how busy the positions are and not on the number of agents """
+        window = end - start + 1
+        for pos in positions:
+            steps = self.positions.get(pos)
+            if steps is None:
+                continue
+            if len(steps) <= window:
+                for step, occupants in steps.items():
+                    if start <= step <= end:
+                        yield pos, step, occupants
+            else:
+                for step in range(start, end + 1):
+                    occupants = steps.get(step)
+                    if occupants is not None:
+                        yield pos, step, occupants
+
+    def sync(self, agents, changed):
+        """ Brings the index up to date after the agents in changed got new paths and all paths may have been
+        extended or cut to a new length by agents_stay_at_destination """
+        changed = set(changed)
+        for agent in agents:
+            old = self.paths[agent.index]
+            if agent.index in changed:
+                self.update(agent.index, agent.path)
+            elif len(old) != len(agent.path):
+                # only the end of the path moved, everything before it is unchanged
+                self.update(agent.index, agent.path, max(0, min(len(old), len(agent.path)) - 1))
+
+    def conflicts(self, agents, max_length=None, start=0):
+        """ Same list of conflicts identify_conflicts returns for the paths in the index, start is the earliest
+        conflict time as in identify_conflicts """
+        raw = []
+        for key in self.vertex_conflicts:
+            pos, step = key
+            if (max_length is None or step < max_length) and 2 * step >= start:
+                raw.append(Conflict(ConflictType.POSITION, time = 2 * step, agents = list(self.vertices[key]), position = pos))
+        for key in self.edge_conflicts:
+            edge, step = key
+            if (max_length is None or step < max_length) and 2 * step - 1 >= start:
+                raw.append(Conflict(ConflictType.EDGE, time = 2 * step - 1, agents = list(self.edges[key]), edge = Edge(edge[0], edge[1])))
+        # identify_conflicts lists conflicts by time and, within a time, in the order their first agent appears
+        raw.sort(key=lambda c: (c.time, c.agents[0]))
+        return update_conflicts(raw, agents)
@@ -1,36 +1,42 @@
 import subprocess
 
+MODEL = './source/picat/mks'
+INSTANCE_FILE = './source/picat/opt_solver_1.pi'
+
 class Optimal_Solver:
-    def __init__(self, agents, restrictions, local_nodes, neighbors, makespan = -1, sumCosts = -1):
+    # instance_file is where the Picat instance is written, None when it is only sent to a running solver
+    def __init__(self, agents, restrictions, local_nodes, neighbors, makespan = -1, sumCosts = -1, instance_file = INSTANCE_FILE):
         self.agents = self.list_to_string(agents, True)                # list of agents in the form (origin, destination)
         self.restrictions = restrictions    # list of restrictions/ paths to avoid, is a list of pairs (position, time)
         self.nodes = local_nodes            # list of nodes
         self.neighbors = neighbors          # dictionary with key node, value list of neighbors
         self.makespan = makespan
         self.sum_of_costs = sumCosts
-        self.create_translation()
+        self.instance_file = instance_file
+        if instance_file is not None:
+            self.create_translation()
 
     def list_to_string(self, arr, array_of_agents = False):
         result = "["
-        for el in arr:
+        for i, el in enumerate(arr):
             if array_of_agents:
                 origin = el[0]
                 dest = el[1]
                 result += "(" + str(origin) + "," + str(dest) + ")"
             else:
                 result += str(el)
-            if arr.index(el) != (len(arr) - 1):
+            if i != (len(arr) - 1):
                 result += ","
             else:
                 result += "]"
         return result
 
     def call_solver(self):
-        result = subprocess.run(['picat', './source/picat/mks', './source/picat/opt_solver_1.pi'], shell=True, capture_output= True)
+        result = subprocess.run(['picat', MODEL, self.instance_file], capture_output= True)
         return result
 
     def create_translation(self):
-        file = open('./source/picat/opt_solver_1.pi', "w")   
+        file = open(self.instance_file, "w")   
         file.write("ins(Graph, As, Avoid, Makespan, SumOfCosts) =>\n")      # header
         file.write("    Graph = [\n")                                         # start of graph
         file.writelines(self.get_neighbors_lines())
@@ -44,11 +50,11 @@ class Optimal_Solver:
 
     def get_neighbors_lines(self):
         result = []
-        for node in self.nodes:
+        for i, node in enumerate(self.nodes):
             if len(self.neighbors[node]) > 0:
                 neighbors_str = self.list_to_string(self.neighbors[node])
                 s = ("    $neibs(" + str(node) + "," + neighbors_str + ")")
-                if self.nodes.index(node) != len(self.nodes) - 1:
+                if i != len(self.nodes) - 1:
                     s += ","
                 s += "\n"
                 result.append(s)
@@ -62,21 +68,28 @@ class Optimal_Solver:
             max_len = self.makespan
             num_agents = len(self.restrictions)
             result = ["    Avoid = new_array(" + str(max_len) + "," + str(num_agents) + "),\n"]
-            i = 1
-            for path in self.restrictions:
-                positions = {}
-                for t in range(1, max_len + 1):
-                    positions[t] = 0
-                for pair in path:
-                    pos = pair[0]
-                    time = pair[1]
-                    positions[time] = pos
+            rows = self.get_avoid_rows()
+            for i in range(1, num_agents + 1):  # index of agent in avoids array
                 for t in range(1, max_len + 1):
-                    pos = positions[t]
+                    pos = rows[t - 1][i - 1]
                     result.append("    Avoid[" + str(t) + "," + str(i) + "] = " + str(pos) + ",\n")
-                i += 1  # index of agent in avoids array
-
 
         return result
+
+    def get_avoid_rows(self):
+        # Avoid array as one row per timestep with the position of every avoided agent, 0 when it is not in the submap
+        rows = [[0] * len(self.restrictions) for t in range(max(0, self.makespan))]
+        for i, path in enumerate(self.restrictions):
+            for pos, time in path:
+                if 1 <= time <= self.makespan:
+                    rows[time - 1][i] = pos
+        return rows
+
+    def get_instance_term(self):
+        # the whole instance as one Picat term ins(Graph, As, AvoidRows, Makespan, SumOfCosts) read by mks --serve
+        graph = ",".join("neibs(" + str(node) + "," + self.list_to_string(self.neighbors[node]) + ")"
+                         for node in self.nodes if len(self.neighbors[node]) > 0)
+        rows = ",".join("[" + ",".join(str(pos) for pos in row) + "]" for row in self.get_avoid_rows()) if len(self.restrictions) > 0 else ""
+        return ("ins([" + graph + "]," + self.agents + ",[" + rows + "]," + str(self.makespan) + "," + str(self.sum_of_costs) + ").")
         
     
\ No newline at end of file
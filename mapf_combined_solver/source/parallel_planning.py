@@ -0,0 +1,35 @@
+import multiprocessing
+from search_engine import SearchEngine, JumpPointSearch
+from heuristics import DistanceTableCache
+
+worker_search = None    # search function of a worker process, created once by init_worker
+
+def init_worker(grid, search_mode, heuristic_bytes, heuristic_spill_dir):
+    # runs once in every worker: the grid is received once and the search engine is reused for all its queries
+    global worker_search
+    heuristic = None
+    if heuristic_bytes:
+        heuristic = DistanceTableCache(grid, heuristic_bytes, heuristic_spill_dir)
+    if search_mode == "jps":
+        worker_search = JumpPointSearch(grid, heuristic).search
+    else:
+        worker_search = SearchEngine(grid, heuristic).search
+
+def plan_path(query):
+    origin, destination = query
+    return worker_search(origin, destination)
+
+def plan_paths(grid, queries, workers, search_mode="astar", heuristic_bytes=0, heuristic_spill_dir=None):
+    """ Finds a path for every (origin, destination) query in a pool of worker processes
+
+    The queries are independent and the searches deterministic, so the paths, returned in the order of the
+    queries, are the same as the ones a sequential run finds. heuristic_bytes > 0 makes every worker use its own
+    DistanceTableCache of that size.
+    """
+    if len(queries) == 0:
+        return []
+    # a few chunks per worker balance the load without paying for one round trip per query
+    chunksize = max(1, len(queries) // (workers * 4))
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(grid, search_mode, heuristic_bytes, heuristic_spill_dir)) as pool:
+        return pool.map(plan_path, queries, chunksize)
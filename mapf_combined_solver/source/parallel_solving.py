@@ -0,0 +1,133 @@
+import multiprocessing
+import subproblem
+from metrics import DISABLED, record_result
+from solver_backend import create_backend
+
+worker_backend = None   # solver backend of a worker process, created once by init_worker
+
+def init_worker(backend_name):
+    # every worker has its own backend, so a picat-server backend runs one picat process per worker
+    global worker_backend
+    worker_backend = create_backend(backend_name)
+
+def solve_instance(instance):
+    return worker_backend.solve(instance)
+
+class SolverPool:
+    """ Pool of worker processes that solve subproblem instances, each with its own backend
+
+    Processes instead of threads, so the in-process backends (local, cbs) also run in parallel.
+    """
+    def __init__(self, backend_name, workers):
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(backend_name,))
+
+    def solve(self, instances):
+        # results are returned in the order of the instances, whichever finishes first
+        if len(instances) == 0:
+            return []
+        return self.pool.map(solve_instance, instances, 1)
+
+    def solve_subproblems(self, subproblems, all_agents, cache = None, metrics = DISABLED):
+        """ Solves every subproblem like the main loop does: subproblems that fail get more time and are solved
+        once more. The second round starts when all first attempts are back. """
+        solutions = self.solve_cached(subproblems, cache, metrics)
+        retry = [i for i, solution in enumerate(solutions) if not solution.solved]
+        metrics.count("retries", len(retry))
+        for i in retry:
+            subproblems[i].inc_ms_upd_avoids(all_agents)
+        for i, solution in zip(retry, self.solve_cached([subproblems[i] for i in retry], cache, metrics)):
+            solutions[i] = solution
+        return solutions
+
+    def solve_cached(self, subproblems, cache, metrics = DISABLED):
+        # only instances the cache doesn't know are sent to the workers
+        with metrics.phase("instance_generation"):
+            instances = [s.instance() for s in subproblems]
+        if cache is None:
+            return self.solve_metered(instances, metrics)
+        keys = [cache.key(instance, s.nodes_sub_to_main) for instance, s in zip(instances, subproblems)]
+        solutions = [cache.get(key, order) for key, order in keys]
+        missing = [i for i, solution in enumerate(solutions) if solution is None]
+        for i, solution in zip(missing, self.solve_metered([instances[i] for i in missing], metrics)):
+            key, order = keys[i]
+            cache.put(key, order, solution)
+            solutions[i] = solution
+        return solutions
+
+    def solve_metered(self, instances, metrics):
+        # the workers' backends can't record their calls, their results are recorded here
+        results = self.solve(instances)
+        for result in results:
+            record_result(metrics, result)
+        return results
+
+    def close(self):
+        # workers exit when their input ends, a picat process of a worker then sees its stdin closed and stops too
+        self.pool.close()
+        self.pool.join()
+
+def touching_agents(sub, all_agents, occupancy = None):
+    """ Indices of the agents outside of the subproblem that are on its submap during its time window,
+    the agents its avoids come from """
+    start = int(sub.start_time / 2)
+    end = int(sub.end_time / 2)
+    nodes = sub.nodes_main_to_sub
+    touching = set()
+    if occupancy is not None:
+        for _, _, occupants in occupancy.visits(nodes, start, end):
+            touching.update(occupants)
+        return touching - sub.agent_index_main_to_sub.keys()
+    for ag in all_agents:
+        if ag.index in sub.agent_index_main_to_sub:
+            continue
+        for pos in ag.path[start:end + 1]:
+            if pos in nodes:
+                touching.add(ag.index)
+                break
+    return touching
+
+def independent(first, second):
+    """ Whether two subproblems can be solved at the same time and both solutions applied
+
+    first and second are (subproblem, touching agents) pairs. The subproblems must not share agents, neither
+    may change an agent the other one avoids, and their submaps may only overlap when their time windows don't.
+    """
+    sub1, touching1 = first
+    sub2, touching2 = second
+    agents1 = sub1.agent_index_main_to_sub.keys()
+    agents2 = sub2.agent_index_main_to_sub.keys()
+    if not agents1.isdisjoint(agents2) or not touching1.isdisjoint(agents2) or not touching2.isdisjoint(agents1):
+        return False
+    if sub1.end_time < sub2.start_time or sub2.end_time < sub1.start_time:
+        return True
+    return sub1.nodes_main_to_sub.keys().isdisjoint(sub2.nodes_main_to_sub.keys())
+
+def select_batch(first, conflicts, all_agents, main_map, flagged_conflicts, size, scan = None, occupancy = None, min_start_time = 0):
+    """ Subproblems for up to size - 1 conflicts from conflicts that are independent of first and of each other
+
+    Conflicts are taken in order, the first scan of them are considered (4 * size by default). Flagged conflicts
+    are skipped, they are retried with their own submap size when they reach the front. The selected conflicts
+    are removed from conflicts, returns a list of (conflict, subproblem) pairs. With an OccupancyIndex of the
+    agent paths the subproblems find their avoids through it. min_start_time is passed on to the subproblems.
+    """
+    if scan is None:
+        scan = 4 * size
+    selected = [(first, touching_agents(first, all_agents, occupancy))]
+    batch = []
+    for conflict in conflicts[:scan]:
+        if len(selected) == size:
+            break
+        if conflict in flagged_conflicts:
+            continue
+        # conflicts sharing an agent with the batch can't be independent, skip them before building a submap
+        if any(not sub.agent_index_main_to_sub.keys().isdisjoint(conflict.agents) for sub, _ in selected):
+            continue
+        sub = subproblem.Subproblem(conflict, all_agents, main_map, occupancy=occupancy, min_start_time=min_start_time)
+        candidate = (sub, touching_agents(sub, all_agents, occupancy))
+        if all(independent(candidate, other) for other in selected):
+            selected.append(candidate)
+            batch.append((conflict, sub))
+    for conflict, _ in batch:
+        conflicts.remove(conflict)
+    return batch
@@ -0,0 +1,204 @@
+import heapq
+import logging
+import random
+import time
+
+from heuristics import DistanceTableCache
+from search_engine import SearchEngine
+
+logger = logging.getLogger(__name__)
+
+ORDERINGS = ("longest", "shortest", "index", "random")
+
+# a space-time search gives up after this many expansions per step of the agent's shortest path and of the reserved
+# paths, an agent may have to wait for them to pass its destination, but one that is boxed in would otherwise search
+# the whole space-time
+EXPANSIONS_PER_STEP = 50
+
+class ReservationTable:
+    """ Cells and moves of the agents planned so far, as cell ids and timesteps
+
+    An agent stays at its destination once its path ends, so the cell is reserved from that step on for good.
+    """
+    def __init__(self):
+        self.vertices = set()   # (cell, step)
+        self.edges = set()      # (from cell, to cell, step the move ends at), waits are not moves
+        self.stays = {}         # cell -> step from which an agent stays there
+        self.last_step = {}     # cell -> last step at which a path is at the cell
+        self.horizon = 0        # last step of the longest path, after it only the stays are reserved
+
+    def reserve(self, cells):
+        vertices, edges, last_step = self.vertices, self.edges, self.last_step
+        for step, c in enumerate(cells):
+            vertices.add((c, step))
+            if step > 0 and cells[step - 1] != c:
+                edges.add((cells[step - 1], c, step))
+            if last_step.get(c, -1) < step:
+                last_step[c] = step
+        end = len(cells) - 1
+        destination = cells[-1]
+        self.stays[destination] = min(self.stays.get(destination, end), end)
+        self.horizon = max(self.horizon, end)
+
+    def is_free(self, cell, step):
+        stay = self.stays.get(cell)
+        return (stay is None or step < stay) and (cell, step) not in self.vertices
+
+    def can_stay(self, cell, step):
+        # an agent can end its path at cell at step if no other path comes by later
+        return cell not in self.stays and self.last_step.get(cell, -1) < step
+
+class SpaceTimeSearch:
+    """ A* over (cell, timestep) states that avoids the cells and moves of a ReservationTable
+
+    An agent may wait in its cell or move to a neighbor every step. Every state is reached at its timestep, so
+    the first path to a state is a shortest one and the open list only needs the time as distance. After the
+    horizon of the table nothing changes any more, so states of the same cell from then on are the same state
+    and a search that can't reach the destination ends. The heuristic is the Manhattan distance or, with a
+    DistanceTableCache, the exact distance.
+    """
+    def __init__(self, grid, heuristic = None):
+        self.grid = grid
+        self.heuristic = heuristic
+        self.expansions = 0     # total number of expanded states over all queries
+        self.heap_pushes = 0    # total number of heap pushes over all queries
+
+    def search_cells(self, origin, destination, reservations, max_expansions):
+        """ Path from cell origin to cell destination as a list of cell ids, one per step, that doesn't meet the
+        reserved paths and ends where the agent can stay; [] if none was found within max_expansions """
+        adjacency = self.grid.adjacency
+        width = self.grid.width
+        dx, dy = destination % width, destination // width
+        table = self.heuristic.get(destination) if self.heuristic else None
+        if table is not None and table[origin] < 0:
+            return []
+        horizon = reservations.horizon + 1
+        is_free, edges = reservations.is_free, reservations.edges
+        push, pop = heapq.heappush, heapq.heappop
+
+        # the agent can't stay at its destination before the last reserved path has passed it, every state that
+        # is estimated to arrive earlier has the same estimate then and the ones furthest along are expanded first
+        earliest = reservations.last_step.get(destination, -1) + 1
+        h = table[origin] if table is not None else abs(dx - origin % width) + abs(dy - origin // width)
+        # entries (estimate, -time, cell, time), ties go to the state that is furthest along
+        queue = [(max(h, earliest), 0, origin, 0)]
+        parent = {(origin, 0): None}
+        closed = set()
+        expansions = 0
+        pushes = 1
+        try:
+            while queue and expansions < max_expansions:
+                _, _, c, step = pop(queue)
+                key = (c, min(step, horizon))
+                if key in closed:
+                    continue
+                closed.add(key)
+                expansions += 1
+                if c == destination and reservations.can_stay(c, step):
+                    path = []
+                    state = (c, step)
+                    while state is not None:
+                        path.append(state[0])
+                        state = parent[state]
+                    path.reverse()
+                    return path
+                t = step + 1
+                for n in adjacency[c] + (c,):
+                    if (n, min(t, horizon)) in closed or (n, t) in parent:
+                        continue
+                    if not is_free(n, t) or (n != c and (n, c, t) in edges):
+                        continue
+                    parent[(n, t)] = (c, step)
+                    h = table[n] if table is not None else abs(dx - n % width) + abs(dy - n // width)
+                    push(queue, (max(t + h, earliest), -t, n, t))
+                    pushes += 1
+            return []
+        finally:
+            self.expansions += expansions
+            self.heap_pushes += pushes
+
+class PrioritizedPlanner:
+    """ Prioritized planning: agents are planned one after another, each in space-time around the paths of the
+    agents planned before it
+
+    The first attempt plans the agents in the given ordering: "longest" (longest distance first), "shortest",
+    "index" (the order of the scenario) or "random", distances being the lengths of the A* paths. An agent for
+    which no path is found gets its A* path, which ignores the others, and counts as failed. While agents fail, the planner starts over with the failed agents
+    first and the others in random order, up to restarts times or until time_budget seconds have passed, and
+    keeps the attempt with the fewest failed agents. An attempt that fails more agents than the best one so far
+    is given up early. When the budget runs out during the first attempt, the agents left get their A* paths.
+    The space-time search always uses exact distances, from heuristic or from its own DistanceTableCache of
+    heuristic_bytes.
+    """
+    def __init__(self, grid, heuristic = None, engine = None, ordering = "longest", restarts = 10, time_budget = 30,
+                 seed = 0, heuristic_bytes = 256 * 1024 * 1024, heuristic_spill_dir = None):
+        if ordering not in ORDERINGS:
+            raise ValueError(f"Unknown priority ordering {ordering}, expected one of {', '.join(ORDERINGS)}")
+        self.grid = grid
+        self.engine = engine if engine is not None else SearchEngine(grid, heuristic)
+        if heuristic is None:
+            # with the Manhattan distance a space-time search expands every cell of a detour once per timestep
+            heuristic = DistanceTableCache(grid, heuristic_bytes, heuristic_spill_dir)
+        self.search = SpaceTimeSearch(grid, heuristic)
+        self.ordering = ordering
+        self.restarts = restarts
+        self.time_budget = time_budget
+        self.random = random.Random(seed)
+        self.attempts = 0       # attempts of the last plan, the first one included
+        self.failed = []        # agents of the kept attempt that got their A* path
+
+    def initial_order(self, shortest):
+        indexes = list(range(len(shortest)))
+        if self.ordering == "random":
+            self.random.shuffle(indexes)
+        elif self.ordering != "index":
+            indexes.sort(key=lambda i: len(shortest[i]), reverse=self.ordering == "longest")
+        return indexes
+
+    def plan(self, queries):
+        """ Paths for a list of (origin, destination) coordinate pairs, in the order of the queries """
+        grid = self.grid
+        deadline = time.time() + self.time_budget
+        # the A* paths give the distances of the orderings and the expansion limits, and are the paths of failed agents
+        shortest = []
+        for origin, destination in queries:
+            cells = self.engine.search_cells(grid.cell_id(origin), grid.cell_id(destination))
+            if not cells:
+                raise ValueError(f"There is no path from {origin} to {destination}")
+            shortest.append(cells)
+        best = None             # paths of the attempt with the fewest failed agents
+        best_failed = None
+        order = self.initial_order(shortest)
+        self.attempts = 0
+
+        while True:
+            self.attempts += 1
+            reservations = ReservationTable()
+            paths = [None] * len(queries)
+            failed = []
+            for i in order:
+                if best is not None and (len(failed) >= len(best_failed) or time.time() > deadline):
+                    break
+                cells = []
+                if time.time() <= deadline:
+                    cells = self.search.search_cells(shortest[i][0], shortest[i][-1], reservations,
+                                                     EXPANSIONS_PER_STEP * (len(shortest[i]) + reservations.horizon))
+                if not cells:
+                    failed.append(i)
+                    cells = shortest[i]
+                paths[i] = cells
+                reservations.reserve(cells)
+            else:
+                best, best_failed = paths, failed
+                logger.debug(f"Prioritized planning attempt {self.attempts}: {len(failed)} agents failed")
+            if not best_failed or self.attempts > self.restarts or time.time() > deadline:
+                break
+            # the agents that failed go first, the others in a new random order
+            first = set(best_failed)
+            rest = [i for i in order if i not in first]
+            self.random.shuffle(rest)
+            order = best_failed + rest
+
+        self.failed = best_failed
+        coords = grid.coords
+        return [[coords[c] for c in cells] for cells in best]
@@ -0,0 +1,387 @@
+import heapq
+
+class SearchEngine:
+    """ A* over the integer cell ids of a Grid
+
+    All per-cell state lives in arrays that are allocated once and reused between queries. A cell's g-value and
+    parent are only valid if its stamp equals the id of the current query, so nothing has to be cleared between
+    queries except the closed set, which is a bitset cleared with a single slice assignment.
+    Heap entries are plain tuples (estimate, distance, tie, cell). tie is a NaN object owned by the cell: two
+    different NaNs never compare equal or less, so entries with the same estimate and distance are left in the
+    order heapq puts them, exactly like the Vertex comparisons in informed_search. This keeps the search
+    deterministic and its paths identical to informed_search and modified_informed_search.
+    If a heuristic provider (heuristics.DistanceTableCache) is given, its exact distances replace the Manhattan
+    distance. Paths are then still shortest paths but may differ from informed_search when there are several.
+    """
+    def __init__(self, grid, heuristic=None):
+        self.grid = grid
+        self.heuristic = heuristic
+        size = grid.size
+        self.xs = [c % grid.width for c in range(size)]
+        self.ys = [c // grid.width for c in range(size)]
+        self.g = [0] * size             # distance from origin
+        self.parent = [-1] * size       # predecessor of the cell on the best known path
+        self.stamp = [0] * size         # id of the last query that reached the cell
+        self.priority = [0] * size      # priority the cell was first queued with (modified search only)
+        self.tie = [float("nan") for _ in range(size)]
+        self.closed = bytearray((size + 7) >> 3)
+        self.empty_closed = bytes(len(self.closed))
+        self.query = 0
+        self.expansions = 0         # total number of expanded cells over all queries
+        self.heap_pushes = 0        # total number of heap pushes over all queries
+
+    def start_query(self):
+        self.query += 1
+        self.closed[:] = self.empty_closed
+        return self.query
+
+    def get_path(self, destination):
+        cells = []
+        c = destination
+        parent = self.parent
+        while c != -1:
+            cells.append(c)
+            c = parent[c]
+        cells.reverse()
+        return cells
+
+    def to_coords(self, cells):
+        coords = self.grid.coords
+        return [coords[c] for c in cells]
+
+    def search_cells(self, origin, destination):
+        """ Shortest path from cell origin to cell destination as a list of cell ids, same as informed_search """
+        q = self.start_query()
+        adjacency = self.grid.adjacency
+        xs, ys = self.xs, self.ys
+        g, parent, stamp, closed = self.g, self.parent, self.stamp, self.closed
+        dx, dy = xs[destination], ys[destination]
+        push, pop = heapq.heappush, heapq.heappop
+
+        table = self.heuristic.get(destination) if self.heuristic else None
+        if table is not None and table[origin] < 0:
+            return []   # destination can't be reached from origin
+
+        # with exact distances every cell on a shortest path has the same estimate, preferring the one that is
+        # furthest from the origin then walks straight along a shortest path instead of expanding all of them
+        sign = -1 if table is not None else 1
+
+        g[origin] = 0
+        parent[origin] = -1
+        stamp[origin] = q
+        tie = self.tie
+        h = table[origin] if table is not None else abs(dx - xs[origin]) + abs(dy - ys[origin])
+        queue = [(h, 0, tie[origin], origin)]
+        expansions = 0
+        pushes = 1
+
+        try:
+            while queue:
+                _, dist, _, c = pop(queue)
+                dist *= sign
+                if c == destination:
+                    return self.get_path(c)
+                byte = c >> 3
+                bit = 1 << (c & 7)
+                if closed[byte] & bit or dist != g[c]:
+                    continue        # stale entry of a cell that was reached by a shorter path
+                closed[byte] |= bit
+                expansions += 1
+                dist += 1
+                for n in adjacency[c]:
+                    if stamp[n] != q:
+                        stamp[n] = q
+                    elif g[n] <= dist or closed[n >> 3] & (1 << (n & 7)):
+                        continue
+                    g[n] = dist
+                    parent[n] = c
+                    h = table[n] if table is not None else abs(dx - xs[n]) + abs(dy - ys[n])
+                    push(queue, (dist + h, sign * dist, tie[n], n))
+                    pushes += 1
+            return []   # no path was found
+        finally:
+            # counted in locals and added once per query, attribute updates in the loop would cost more
+            self.expansions += expansions
+            self.heap_pushes += pushes
+
+    def search(self, origin_coord, destination_coord):
+        grid = self.grid
+        cells = self.search_cells(grid.cell_id(origin_coord), grid.cell_id(destination_coord))
+        return self.to_coords(cells)
+
+    def modified_search_cells(self, origin, destination, used_edges_dict):
+        """ Same as modified_informed_search: neighbors are ranked by their heuristic and by how often the edge
+        leading to them was used already, and a cell keeps the priority it was first discovered with """
+        q = self.start_query()
+        adjacency = self.grid.adjacency
+        xs, ys = self.xs, self.ys
+        g, parent, stamp, closed = self.g, self.parent, self.stamp, self.closed
+        priority, tie = self.priority, self.tie
+        coords = self.grid.coords
+        dx, dy = xs[destination], ys[destination]
+        push, pop = heapq.heappush, heapq.heappop
+
+        table = self.heuristic.get(destination) if self.heuristic else None
+        if table is not None and table[origin] < 0:
+            return []
+
+        g[origin] = 0
+        parent[origin] = -1
+        stamp[origin] = q
+        h = table[origin] if table is not None else abs(dx - xs[origin]) + abs(dy - ys[origin])
+        queue = [(h, tie[origin], origin)]
+        expansions = 0
+        pushes = 1
+
+        try:
+            while queue:
+                _, _, c = pop(queue)
+                if c == destination:
+                    return self.get_path(c)
+                byte = c >> 3
+                bit = 1 << (c & 7)
+                if closed[byte] & bit:
+                    continue
+                closed[byte] |= bit
+                expansions += 1
+                dist = g[c] + 1
+                neighbors = adjacency[c]
+                if not neighbors:
+                    continue
+                # rank the neighbors the same way informed_search.rank_neighbors does: position of the neighbor's
+                # heuristic among the distinct heuristics of all neighbors plus position of its edge use count among
+                # the distinct use counts. On a 4-connected grid a neighbor is either one step closer to the
+                # destination or one step further, so the heuristic position is 0 or 1.
+                if table is not None:
+                    hs = [table[n] for n in neighbors]
+                else:
+                    hs = [abs(dx - xs[n]) + abs(dy - ys[n]) for n in neighbors]
+                min_h = min(hs)
+                if used_edges_dict:
+                    pos = coords[c]
+                    uses = [used_edges_dict.get((pos, coords[n]), 0) for n in neighbors]
+                    distinct_uses = sorted(set(uses))
+                for i, n in enumerate(neighbors):
+                    if stamp[n] != q:
+                        stamp[n] = q
+                        g[n] = dist
+                        parent[n] = c
+                        h = hs[i]
+                        p = dist + h + (h != min_h)
+                        if used_edges_dict:
+                            p += distinct_uses.index(uses[i])
+                        priority[n] = p
+                        push(queue, (p, tie[n], n))
+                        pushes += 1
+                    elif g[n] > dist and not closed[n >> 3] & (1 << (n & 7)):
+                        # the path to the cell is updated but it is queued again with the priority it was discovered with
+                        g[n] = dist
+                        parent[n] = c
+                        push(queue, (priority[n], tie[n], n))
+                        pushes += 1
+            return []
+        finally:
+            self.expansions += expansions
+            self.heap_pushes += pushes
+
+    def modified_search(self, origin_coord, destination_coord, used_edges_dict):
+        grid = self.grid
+        cells = self.modified_search_cells(grid.cell_id(origin_coord), grid.cell_id(destination_coord), used_edges_dict)
+        return self.to_coords(cells)
+
+class JumpPointSearch:
+    """ A* with jump-point symmetry pruning for 4-connected grids
+
+    Of all shortest paths only the canonical ones are searched: paths that move horizontally as early as possible.
+    A horizontal move may be followed by a move in any direction except back, a vertical move may only be followed
+    by a horizontal one if the horizontal move couldn't have been made one step earlier because of an obstacle
+    (a forced neighbor). Only jump points - cells where a canonical path can change direction, and the destination
+    - are put on the heap; the straight segments between them are skipped without touching it. Where the next
+    jump point is doesn't depend on the destination except for the destination itself, so it is precomputed for
+    every cell and direction once per grid and a jump only has to check whether it passes the destination.
+    Search states are (cell, direction of arrival) so that a cell reached from different directions keeps all of
+    its successors. The returned path is a shortest path, but not necessarily the one informed_search returns.
+    """
+    RIGHT, LEFT, DOWN, UP, START = 0, 1, 2, 3, 4     # y grows downwards in the map files
+
+    def __init__(self, grid, heuristic=None):
+        self.grid = grid
+        self.heuristic = heuristic
+        states = 5 * grid.size
+        self.g = [0] * states
+        self.parent = [-1] * states
+        self.stamp = [0] * states
+        self.closed = [0] * states
+        self.query = 0
+        self.expansions = 0         # total number of expanded states over all queries
+        self.heap_pushes = 0        # total number of heap pushes over all queries
+        self.precompute_jumps()
+
+    def precompute_jumps(self):
+        # vertical_jump[dy][c] is the next cell below (dy = 1) or above (dy = -1) c that has a forced neighbor,
+        # -1 if an obstacle comes first, and vertical_end[dy][c] is the y of the last free cell in that direction.
+        # horizontal_jump[dx][c] is the next cell in the row from which a vertical jump finds a jump point and
+        # horizontal_end[dx][c] the x of the last free cell in that direction.
+        grid = self.grid
+        width, height, passable = grid.width, grid.height, grid.passable
+        self.vertical_jump = {1: [-1] * grid.size, -1: [-1] * grid.size}
+        self.vertical_end = {1: [0] * grid.size, -1: [0] * grid.size}
+        self.horizontal_jump = {1: [-1] * grid.size, -1: [-1] * grid.size}
+        self.horizontal_end = {1: [0] * grid.size, -1: [0] * grid.size}
+
+        for dy in (1, -1):
+            jump, end = self.vertical_jump[dy], self.vertical_end[dy]
+            rows = range(height - 1, -1, -1) if dy == 1 else range(height)
+            for y in rows:
+                for x in range(width):
+                    c = y * width + x
+                    n = c + dy * width
+                    if y + dy < 0 or y + dy >= height or not passable[n]:
+                        jump[c] = -1
+                        end[c] = y
+                        continue
+                    end[c] = end[n]
+                    forced = (x > 0 and passable[n - 1] and not passable[c - 1]) or \
+                             (x < width - 1 and passable[n + 1] and not passable[c + 1])
+                    jump[c] = n if forced else jump[n]
+
+        down, up = self.vertical_jump[1], self.vertical_jump[-1]
+        for dx in (1, -1):
+            jump, end = self.horizontal_jump[dx], self.horizontal_end[dx]
+            columns = range(width - 1, -1, -1) if dx == 1 else range(width)
+            for x in columns:
+                for y in range(height):
+                    c = y * width + x
+                    n = c + dx
+                    if x + dx < 0 or x + dx >= width or not passable[n]:
+                        jump[c] = -1
+                        end[c] = x
+                        continue
+                    end[c] = end[n]
+                    jump[c] = n if down[n] != -1 or up[n] != -1 else jump[n]
+
+    def jump_vertical(self, c, x, y, dy, destination):
+        """ First jump point moving from c in direction dy, or -1 """
+        n = self.vertical_jump[dy][c]
+        width = self.grid.width
+        if destination % width == x:
+            dest_y = destination // width
+            # the destination is a jump point as well if it comes before the precomputed one
+            if 0 < (dest_y - y) * dy <= (self.vertical_end[dy][c] - y) * dy:
+                if n == -1 or (dest_y - n // width) * dy < 0:
+                    return destination
+        return n
+
+    def jump_horizontal(self, c, x, y, dx, destination):
+        """ First jump point moving from c in direction dx, or -1 """
+        n = self.horizontal_jump[dx][c]
+        width = self.grid.width
+        dest_x = destination % width
+        if 0 < (dest_x - x) * dx <= (self.horizontal_end[dx][c] - x) * dx:
+            # the cell of this row in the destination's column is a jump point if the destination is in the row
+            # or a vertical jump from it reaches the destination
+            candidate = y * width + dest_x
+            if candidate == destination or self.jump_vertical(candidate, dest_x, y, 1 if destination > candidate else -1, destination) == destination:
+                if n == -1 or (dest_x - n % width) * dx < 0:
+                    return candidate
+        return n
+
+    def successors(self, c, direction, destination):
+        """ Jump points reachable from cell c when it was entered moving in direction, as (cell, direction) """
+        grid = self.grid
+        width = grid.width
+        passable = grid.passable
+        x, y = c % width, c // width
+        result = []
+        if direction == self.START:
+            horizontal = (1, -1)
+            vertical = (1, -1)
+        elif direction == self.RIGHT or direction == self.LEFT:
+            horizontal = (1,) if direction == self.RIGHT else (-1,)
+            vertical = (1, -1)
+        else:
+            dy = 1 if direction == self.DOWN else -1
+            vertical = (dy,)
+            prev = c - dy * width       # the cell the agent came from
+            horizontal = [dx for dx in (1, -1) if 0 <= x + dx < width and passable[c + dx] and not passable[prev + dx]]
+        for dx in horizontal:
+            n = self.jump_horizontal(c, x, y, dx, destination)
+            if n != -1:
+                result.append((n, self.RIGHT if dx == 1 else self.LEFT))
+        for dy in vertical:
+            n = self.jump_vertical(c, x, y, dy, destination)
+            if n != -1:
+                result.append((n, self.DOWN if dy == 1 else self.UP))
+        return result
+
+    def search_cells(self, origin, destination):
+        """ Shortest path from cell origin to cell destination as a list of cell ids """
+        self.query += 1
+        q = self.query
+        grid = self.grid
+        width = grid.width
+        g, parent, stamp, closed = self.g, self.parent, self.stamp, self.closed
+        dx, dy = destination % width, destination // width
+        table = self.heuristic.get(destination) if self.heuristic else None
+        if table is not None and table[origin] < 0:
+            return []
+        if origin == destination:
+            return [origin]
+
+        def estimate(c):
+            if table is not None:
+                return table[c]
+            return abs(dx - c % width) + abs(dy - c // width)
+
+        start = origin * 5 + self.START
+        g[start] = 0
+        parent[start] = -1
+        stamp[start] = q
+        counter = 0
+        queue = [(estimate(origin), 0, counter, start)]
+        self.heap_pushes += 1
+
+        while queue:
+            _, dist, _, state = heapq.heappop(queue)
+            dist = -dist
+            c, direction = divmod(state, 5)
+            if c == destination:
+                return self.get_path(state)
+            if closed[state] == q or dist != g[state]:
+                continue
+            closed[state] = q
+            self.expansions += 1
+            for n, n_direction in self.successors(c, direction, destination):
+                n_state = n * 5 + n_direction
+                n_dist = dist + abs(n % width - c % width) + abs(n // width - c // width)
+                if stamp[n_state] == q and (g[n_state] <= n_dist or closed[n_state] == q):
+                    continue
+                stamp[n_state] = q
+                g[n_state] = n_dist
+                parent[n_state] = state
+                counter += 1
+                heapq.heappush(queue, (n_dist + estimate(n), -n_dist, counter, n_state))
+                self.heap_pushes += 1
+        return []
+
+    def get_path(self, state):
+        # walk back over the jump points and fill in the straight segments between them
+        width = self.grid.width
+        jump_points = []
+        while state != -1:
+            jump_points.append(state // 5)
+            state = self.parent[state]
+        jump_points.reverse()
+        cells = [jump_points[0]]
+        for a, b in zip(jump_points, jump_points[1:]):
+            step = (1 if b > a else -1) if a // width == b // width else (width if b > a else -width)
+            c = a
+            while c != b:
+                c += step
+                cells.append(c)
+        return cells
+
+    def search(self, origin_coord, destination_coord):
+        grid = self.grid
+        cells = self.search_cells(grid.cell_id(origin_coord), grid.cell_id(destination_coord))
+        return [grid.coords[c] for c in cells]
@@ -0,0 +1,262 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+
+import map
+from grid import Grid
+from heuristics import DistanceTableCache
+from metrics import Metrics
+from search_engine import SearchEngine, JumpPointSearch
+from solution_cache import SolutionCache
+from solver_api import Problem, Config, solve
+from solver_backend import create_backend
+
+logger = logging.getLogger(__name__)
+
+def check_file_name(name):
+    # maps and scenarios are read from source/resources, a name with a path in it could read any file
+    if "/" in name or "\\" in name or os.sep in name or ".." in name:
+        raise ValueError(f"Invalid file name {name}, expected the name of a file in source/resources")
+
+# Config keywords a query may set; directories and the size of the distance tables are options of the service
+QUERY_CONFIG = {"search_mode", "workers", "distance_heuristic", "solver_backend", "solve_workers",
+                "solution_cache_size", "timeout", "concise", "verbose", "window", "commit_steps", "priority_order",
+                "restarts", "planning_time", "priority_seed", "conflict_order"}
+
+def query_config(options, max_workers, heuristic_cache_mb, heuristic_spill_dir, solution_cache_dir):
+    """ Config of a query's config dictionary, with the settings of the service for what queries can't set """
+    if not isinstance(options, dict):
+        raise ValueError("The config of a query must be an object")
+    rejected = sorted(set(options) - QUERY_CONFIG)
+    if rejected:
+        raise ValueError(f"A query can't set {', '.join(rejected)}, expected only {', '.join(sorted(QUERY_CONFIG))}")
+    for key in ("workers", "solve_workers"):
+        value = options.get(key, 1)
+        if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= max_workers:
+            raise ValueError(f"Invalid {key} {value}, expected a number from 1 to {max_workers}")
+    return Config(**options, heuristic_cache_mb=heuristic_cache_mb, heuristic_spill_dir=heuristic_spill_dir,
+                  solution_cache_dir=solution_cache_dir)
+
+class Service:
+    """ Answers MAPF queries against maps that stay loaded between queries
+
+    Every map is read and turned into a Grid once. Search engines, jump point tables, distance tables, solver
+    backends and solution caches are created on first use and kept, so a query only pays for its own search. A map
+    has one DistanceTableCache, used as the A* heuristic and by prioritized planning. Queries are handled one at
+    a time (handle takes a lock), the kept objects are not safe to use from two solves at once.
+
+    A query is a dictionary:
+        {"id": ..., "map": "<file in source/resources/maps>" or "map_rows": ["..@.", ...],
+         "agents": [[[x, y], [x, y]], ...] or "scen": "<file in source/resources/scens>" with an optional "n",
+         "config": {Config keyword arguments in QUERY_CONFIG}, "metrics": true}
+    and the answer {"id": ..., "ok": true, "solved": ..., "paths": [[[x, y], ...], ...], ...} or
+    {"id": ..., "ok": false, "error": "..."}. {"command": "load", "map": ...} loads a map ahead of the first query
+    on it, {"command": "stats"} describes what is kept, {"command": "shutdown"} stops the service.
+    A query can't choose directories or the size of the distance tables, those are given to the service, and it
+    can't use more than max_workers processes for either pool.
+    """
+    def __init__(self, solution_cache_size = 10000, heuristic_cache_mb = 256, heuristic_spill_dir = None,
+                 solution_cache_dir = None, max_workers = 1):
+        self.solution_cache_size = solution_cache_size
+        self.heuristic_cache_mb = heuristic_cache_mb
+        self.heuristic_spill_dir = heuristic_spill_dir
+        self.solution_cache_dir = solution_cache_dir
+        self.max_workers = max_workers
+        self.grids = {}             # map name -> (Grid, map characters)
+        self.engines = {}           # (map name, distance heuristic) -> SearchEngine
+        self.jump_searches = {}     # (map name, distance heuristic) -> JumpPointSearch
+        self.heuristics = {}        # map name -> DistanceTableCache
+        self.backends = {}          # backend name -> backend
+        self.solution_caches = {}   # backend name -> SolutionCache
+        self.queries = 0
+        self.running = True
+        self.lock = threading.Lock()
+
+    def load_map(self, name):
+        if name not in self.grids:
+            check_file_name(name)
+            nodes = map.read_map_file(name)
+            self.grids[name] = (Grid(nodes), nodes)
+            logger.info(f"Loaded map {name}")
+        return self.grids[name]
+
+    def problem(self, query):
+        """ Problem of a query and the name its map is kept under, None for a map given in the query """
+        name = query.get("map")
+        if "scen" in query:
+            check_file_name(query["scen"])
+            agents, name = map.read_agents(query["scen"], query.get("n", -1))
+        else:
+            agents = query["agents"]
+        if name is not None:
+            grid, nodes = self.load_map(name)
+            return Problem(grid, agents, nodes), name
+        if "map_rows" in query:
+            return Problem([list(row) for row in query["map_rows"]], agents), None
+        raise ValueError("A query needs a map, map_rows or scen")
+
+    def resources(self, name, grid, config):
+        # the kept objects a solve on the map uses, those of a map given in the query are not kept
+        tables = self.heuristics.get(name)
+        if tables is None and (config.distance_heuristic or config.search_mode == "prioritized"):
+            tables = DistanceTableCache(grid, self.heuristic_cache_mb * 1024 * 1024, self.heuristic_spill_dir)
+            if name is not None:
+                self.heuristics[name] = tables
+        heuristic = tables if config.distance_heuristic else None
+        engine = jump_search = None
+        if name is not None:
+            key = (name, heuristic is not None)
+            engine = self.engines.get(key)
+            if engine is None:
+                engine = SearchEngine(grid, heuristic)
+                self.engines[key] = engine
+            if config.search_mode == "jps":
+                jump_search = self.jump_searches.get(key)
+                if jump_search is None:
+                    jump_search = JumpPointSearch(grid, heuristic)
+                    self.jump_searches[key] = jump_search
+        backend = self.backends.get(config.solver_backend)
+        if backend is None:
+            backend = create_backend(config.solver_backend)
+            self.backends[config.solver_backend] = backend
+        solution_cache = None
+        if config.solution_cache_size > 0 and self.solution_cache_size > 0:
+            solution_cache = self.solution_caches.get(config.solver_backend)
+            if solution_cache is None:
+                solution_cache = SolutionCache(self.solution_cache_size, self.solution_cache_dir,
+                                               config.solver_backend)
+                self.solution_caches[config.solver_backend] = solution_cache
+        return heuristic, engine, jump_search, tables, backend, solution_cache
+
+    def query(self, query):
+        config = query_config(query.get("config", {}), self.max_workers, self.heuristic_cache_mb,
+                              self.heuristic_spill_dir, self.solution_cache_dir)
+        problem, name = self.problem(query)
+        heuristic, engine, jump_search, tables, backend, solution_cache = self.resources(name, problem.grid, config)
+        metrics = Metrics(bool(query.get("metrics", False)))
+        result = solve(problem, config, metrics, heuristic, backend, solution_cache, engine, jump_search, tables)
+        self.queries += 1
+        return {"solved": result.solved, "paths": result.paths, "makespan": result.makespan,
+                "initial_makespan": result.initial_makespan, "initial_conflicts": result.initial_conflicts,
+                "remaining_conflicts": len(result.conflicts), "unsolveable_conflicts": len(result.unsolveable_conflicts),
+                "timed_out": result.timed_out, "times": result.times, "stats": result.stats}
+
+    def stats(self):
+        return {"queries": self.queries, "maps": sorted(self.grids), "engines": len(self.engines),
+                "jump_searches": len(self.jump_searches),
+                "heuristics": {name: h.stats() for name, h in self.heuristics.items()},
+                "backends": sorted(self.backends),
+                "solution_caches": {name: c.stats() for name, c in self.solution_caches.items()}}
+
+    def handle(self, request):
+        """ Answer to one request, errors of the request are reported in the answer """
+        answer = {"id": request.get("id")} if isinstance(request, dict) else {"id": None}
+        with self.lock:
+            try:
+                command = request.get("command", "solve")
+                if command == "solve":
+                    answer.update(self.query(request))
+                elif command == "load":
+                    self.load_map(request["map"])
+                elif command == "stats":
+                    answer.update(self.stats())
+                elif command == "shutdown":
+                    self.running = False
+                else:
+                    raise ValueError(f"Unknown command {command}")
+                answer["ok"] = True
+            except Exception as e:
+                logger.exception("Request failed")
+                answer = {"id": answer["id"], "ok": False, "error": f"{type(e).__name__}: {e}"}
+        return answer
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({"id": None, "ok": False, "error": f"Invalid JSON: {e}"})
+        return json.dumps(self.handle(request))
+
+    def close(self):
+        for backend in self.backends.values():
+            backend.close()
+
+def serve_stdio(service, out):
+    # answers go to out, the real stdout, while main sends anything the solver prints to stderr
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        out.write(service.handle_line(line) + "\n")
+        out.flush()
+        if not service.running:
+            break
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    # one connection, any number of requests, one JSON object per line each way
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write((service.handle_line(line.decode()) + "\n").encode())
+            self.wfile.flush()
+            if not service.running:
+                # shutdown waits for serve_forever to return, so it can't be called from its thread
+                threading.Thread(target=self.server.shutdown).start()
+                break
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer MAPF queries as JSON lines with maps kept loaded")
+    parser.add_argument("--socket", type=str, default=None)     # path of a Unix socket to listen on instead of stdin
+    parser.add_argument("--port", type=int, default=None)       # TCP port on localhost to listen on instead of stdin
+    parser.add_argument("--maps", nargs="+", default=[])        # maps loaded before the first query
+    parser.add_argument("--solution-cache-size", type=int, default=10000)
+    parser.add_argument("--heuristic-cache-mb", type=int, default=256)
+    parser.add_argument("--heuristic-spill-dir", type=str, default=None)
+    parser.add_argument("--solution-cache-dir", type=str, default=None)
+    parser.add_argument("--max-workers", type=int, default=1)  # most processes a query may ask for in either pool
+    parser.add_argument("--log-file", type=str, default=None)
+    parser.add_argument("--log-level", type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO")
+    args = parser.parse_args()
+    if args.log_file is not None:
+        logging.basicConfig(filename=args.log_file, level=args.log_level,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    service = Service(args.solution_cache_size, args.heuristic_cache_mb, args.heuristic_spill_dir,
+                      args.solution_cache_dir, args.max_workers)
+    for name in args.maps:
+        service.load_map(name)
+    # anything the solver prints goes to stderr so it can't break the protocol; sys.stdout is one global for all
+    # threads, so it is redirected once here and not per connection
+    out = sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.socket is not None or args.port is not None:
+                if args.socket is not None:
+                    if os.path.exists(args.socket):
+                        os.remove(args.socket)
+                    server = UnixServer(args.socket, RequestHandler)
+                else:
+                    server = TCPServer(("127.0.0.1", args.port), RequestHandler)
+                server.service = service
+                with server:
+                    server.serve_forever()
+            else:
+                serve_stdio(service, out)
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
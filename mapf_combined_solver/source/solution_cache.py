@@ -0,0 +1,106 @@
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+from solver_backend import SolverResult, SOLVED, UNSOLVED, format_plan
+
+def signature(instance, coords, namespace = ""):
+    """ Canonical form of a solver instance: the key under which its solution is cached
+
+    Nodes are relabeled in the order of their map coordinates relative to the top left corner of the submap
+    (coords maps a node to its main map position), so the same local situation gives the same key wherever on the
+    map it is and in whichever order the submap was built. The key holds the relabeled graph, the agent endpoints,
+    the avoids and the makespan. Returns the key and the nodes of the instance in canonical order.
+    """
+    min_x = min(coords[n][0] for n in instance.nodes)
+    min_y = min(coords[n][1] for n in instance.nodes)
+    order = sorted(instance.nodes, key=lambda n: (coords[n][0] - min_x, coords[n][1] - min_y))
+    label = {n: i + 1 for i, n in enumerate(order)}
+    graph = tuple(tuple(sorted(label[m] for m in instance.neighbors[n])) for n in order)
+    agents = tuple((label[origin], label[dest]) for origin, dest in instance.agents)
+    # every row is the path of one avoided agent, only the order of the rows is free
+    avoids = tuple(sorted(tuple((label[pos], t) for pos, t in row) for row in instance.avoids))
+    return (namespace, graph, agents, avoids, instance.makespan), order
+
+class SolutionCache:
+    """ Solutions of solved and unsolvable instances keyed by their signature
+
+    The most recently used max_entries solutions are kept in memory. When cache_dir is given every solution is
+    also written there, so later runs on the same map start with them. Results with status ERROR are never
+    cached, the solver may succeed when it is run again. Paths are stored with canonical node labels.
+    """
+    def __init__(self, max_entries = 10000, cache_dir = None, namespace = ""):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.namespace = namespace      # keeps solutions of different backends apart
+        self.entries = OrderedDict()    # key -> (status, paths), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, instance, coords):
+        return signature(instance, coords, self.namespace)
+
+    def disk_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".pkl")
+
+    def get(self, key, order):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        elif self.cache_dir and os.path.exists(self.disk_path(key)):
+            with open(self.disk_path(key), "rb") as f:
+                stored_key, entry = pickle.load(f)
+            if stored_key != key:   # hash collision
+                entry = None
+            else:
+                self.disk_hits += 1
+                self.remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        status, paths = entry
+        if status != SOLVED:
+            return SolverResult(UNSOLVED, output = "no plan\n")
+        paths = [[order[v - 1] for v in path] for path in paths]
+        return SolverResult(SOLVED, paths, len(paths[0]) if paths else 0, 0, format_plan(paths))
+
+    def put(self, key, order, result):
+        if result.status == SOLVED:
+            label = {n: i + 1 for i, n in enumerate(order)}
+            entry = (SOLVED, [[label[v] for v in path] for path in result.paths])
+        elif result.status == UNSOLVED:
+            entry = (UNSOLVED, None)
+        else:
+            return
+        self.remember(key, entry)
+        if self.cache_dir and not os.path.exists(self.disk_path(key)):
+            # write to a temporary file first so that other runs never load a partially written solution
+            path = self.disk_path(key)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump((key, entry), f)
+            os.replace(path + ".tmp", path)
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def solve(self, instance, coords, backend):
+        """ Cached result of the instance, or the result of backend which is then cached """
+        key, order = self.key(instance, coords)
+        result = self.get(key, order)
+        if result is None:
+            result = backend.solve(instance)
+            self.put(key, order, result)
+        return result
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                "evictions": self.evictions, "entries": len(self.entries)}
@@ -0,0 +1,549 @@
+import copy
+import logging
+import time
+
+import numpy as np
+
+import subproblem
+from agent import Agent
+from conflict_queue import ConflictQueue
+from conflicts import (ConflictType, update_agents_from_solution, identify_conflicts_vectorized, reorder_conflicts,
+                       print_conflict_info, count_conflict_types, agents_stay_at_destination, extend_path_conflict)
+from grid import Grid
+from heuristics import DistanceTableCache
+from metrics import DISABLED, MeteredBackend
+from occupancy import OccupancyIndex
+from parallel_planning import plan_paths
+from parallel_solving import SolverPool, select_batch
+from prioritized_planning import PrioritizedPlanner
+from search_engine import SearchEngine, JumpPointSearch
+from solution_cache import SolutionCache
+from solver_backend import create_backend
+from utils import update_edge_dict
+
+logger = logging.getLogger(__name__)
+
+class Problem:
+    """ Map and agents of a MAPF problem held in memory
+
+    grid is a Grid, an obstacle bitmap (True where a cell is free) or rows of map characters as map.read_map returns
+    them. agents are Agent objects or (origin, destination) pairs of (x, y) coordinates; solve works on copies and
+    never changes them. nodes, the map characters, are only needed to animate the paths.
+    """
+    def __init__(self, grid, agents, nodes = None):
+        if isinstance(grid, Grid):
+            self.grid = grid
+        elif isinstance(grid, np.ndarray):
+            self.grid = Grid.from_bitmap(grid)
+        else:
+            self.grid = Grid(grid)
+            if nodes is None:
+                nodes = grid
+        self.nodes = nodes
+        self.queries = []
+        for i, a in enumerate(agents):
+            origin, destination = (a.origin, a.destination) if isinstance(a, Agent) else (tuple(a[0]), tuple(a[1]))
+            for name, coord in (("origin", origin), ("destination", destination)):
+                if not self.grid.is_free(coord):
+                    raise ValueError(f"The {name} {coord} of agent {i} is not a free cell of the map")
+            if not self.grid.connected(origin, destination):
+                raise ValueError(f"There is no path from {origin} to {destination}")
+            self.queries.append((origin, destination))
+
+    @classmethod
+    def from_map(cls, main_map):
+        # a map.map loaded from a scenario file
+        return cls(main_map.grid, main_map.agents, main_map.nodes)
+
+    def agents(self):
+        # new Agent objects without paths, indexed in the order of the queries
+        return [Agent(origin, destination, i) for i, (origin, destination) in enumerate(self.queries)]
+
+class Config:
+    """ Options of a solve, named like the command-line options of combined_solver.py and with the same defaults,
+    except that by default nothing is printed: verbose prints the conflict information combined_solver.py prints
+    during the search, and concise=False keeps the description of every subproblem given up on. """
+    def __init__(self, search_mode = "modified", workers = 1, distance_heuristic = False, heuristic_cache_mb = 256,
+                 heuristic_spill_dir = None, solver_backend = "picat", solve_workers = 1, solution_cache_size = 10000,
+                 solution_cache_dir = None, timeout = 200, concise = True, verbose = False, keep_initial_paths = False,
+                 window = None, commit_steps = None, priority_order = "longest", restarts = 10, planning_time = 30,
+                 priority_seed = 0, conflict_order = "time"):
+        self.search_mode = search_mode              # "modified", "astar", "jps" or "prioritized"
+        self.workers = workers
+        self.distance_heuristic = distance_heuristic
+        self.heuristic_cache_mb = heuristic_cache_mb
+        self.heuristic_spill_dir = heuristic_spill_dir
+        self.solver_backend = solver_backend
+        self.solve_workers = solve_workers
+        self.solution_cache_size = solution_cache_size
+        self.solution_cache_dir = solution_cache_dir
+        self.timeout = timeout
+        self.concise = concise
+        self.verbose = verbose
+        self.keep_initial_paths = keep_initial_paths    # copies of the agents with their initial paths, for animate_paths
+        self.window = window                # steps ahead whose conflicts are repaired at a time, None for the whole plan
+        self.commit_steps = commit_steps    # steps the window moves on by, half the window by default
+        # prioritized planning: first ordering of the agents, restarts with a new ordering while agents fail, seconds
+        # all attempts may take and seed of the random orderings
+        self.priority_order = priority_order
+        self.restarts = restarts
+        self.planning_time = planning_time
+        self.priority_seed = priority_seed
+        self.conflict_order = conflict_order    # order of the ConflictQueue, "time" or "impact"
+
+    @classmethod
+    def from_args(cls, args):
+        # parsed command-line arguments of combined_solver.py
+        search_mode = args.search_mode
+        if search_mode is None:
+            search_mode = "modified" if args.modified_search else "astar"
+        return cls(search_mode, args.workers, args.distance_heuristic, args.heuristic_cache_mb, args.heuristic_spill_dir,
+                   args.solver_backend, args.solve_workers, args.solution_cache_size, args.solution_cache_dir,
+                   args.timeout, args.concise, verbose=True, keep_initial_paths=args.animate_paths,
+                   window=args.window, commit_steps=args.commit_steps, priority_order=args.priority_order,
+                   restarts=args.restarts, planning_time=args.planning_time, priority_seed=args.priority_seed,
+                   conflict_order=args.conflict_order)
+
+class Result:
+    """ Outcome of a solve
+
+    agents hold the final paths (paths lists them by agent index), conflicts are the conflicts of the final paths
+    that weren't given up on and unsolveable_conflicts the ones given up on. conflict_counts has the numbers of conflicts by
+    type after every solved batch, stats the metrics summary if the solve was given an enabled Metrics.
+    """
+    def __init__(self, agents, makespan, initial_makespan, initial_conflicts, conflicts, unsolveable_conflicts,
+                 conflict_counts, unsolveable_outputs, timed_out, times, stats = None, initial_agents = None):
+        self.agents = agents
+        self.paths = [agent.path for agent in agents]
+        self.makespan = makespan
+        self.initial_makespan = initial_makespan
+        self.initial_conflicts = initial_conflicts
+        self.conflicts = conflicts
+        self.unsolveable_conflicts = unsolveable_conflicts
+        self.conflict_counts = conflict_counts
+        self.unsolveable_outputs = unsolveable_outputs
+        self.timed_out = timed_out
+        self.times = times          # seconds of the initial planning, of conflict solving and in total
+        self.stats = stats
+        self.initial_agents = initial_agents
+
+    @property
+    def solved(self):
+        return len(self.conflicts) == 0 and len(self.unsolveable_conflicts) == 0
+
+def plan_initial_paths(agents, grid, config, heuristic, metrics, engine = None, jump_search = None,
+                       distance_tables = None):
+    """ Initial path of every agent found with the search of config.search_mode, returns the longest path length
+
+    engine is a SearchEngine and jump_search a JumpPointSearch of grid with the same heuristic that are kept
+    between solves, new ones by default. distance_tables is a DistanceTableCache of grid that prioritized planning
+    uses when heuristic is None, instead of building its own.
+    """
+    max_length = 0      # used in finding conflicts
+    if engine is None:
+        engine = SearchEngine(grid, heuristic)
+    searcher = engine       # the engine whose counters are reported, the searches of worker processes aren't counted
+    expansions, heap_pushes = engine.expansions, engine.heap_pushes    # a kept engine has counted earlier solves
+    search_mode = config.search_mode
+
+    if search_mode == "modified":
+        # find path for each agent using modified A*
+        logger.info("Using modified A* for pathfinding.")
+        if config.workers > 1:
+            logger.info("Modified A* depends on the paths of previous agents, planning sequentially.")
+        edge_use_dict = {}
+        for agent in agents:
+            search_path = engine.modified_search(agent.origin, agent.destination, edge_use_dict)
+            agent.path = search_path
+            if len(agent.path) > max_length:
+                max_length = len(agent.path)
+            edge_use_dict = update_edge_dict(search_path, edge_use_dict)
+    elif search_mode == "prioritized":
+        # every agent is planned around the paths of the agents before it
+        logger.info(f"Using prioritized planning in space-time, {config.priority_order} distance first.")
+        if config.workers > 1:
+            logger.info("Prioritized planning depends on the paths of previous agents, planning sequentially.")
+        planner = PrioritizedPlanner(grid, heuristic if heuristic is not None else distance_tables, engine, config.priority_order, config.restarts, config.planning_time,
+                                     config.priority_seed, config.heuristic_cache_mb * 1024 * 1024,
+                                     config.heuristic_spill_dir)
+        search_paths = planner.plan([(agent.origin, agent.destination) for agent in agents])
+        for agent, search_path in zip(agents, search_paths):
+            agent.path = search_path
+            if len(agent.path) > max_length:
+                max_length = len(agent.path)
+        logger.info(f"Prioritized planning took {planner.attempts} attempts, {len(planner.failed)} agents were "
+                    f"planned without the paths of the others.")
+        metrics.count("planning_attempts", planner.attempts)
+        metrics.count("planning_failed_agents", len(planner.failed))
+        metrics.count("astar_expansions", planner.search.expansions)
+        metrics.count("astar_heap_pushes", planner.search.heap_pushes)
+    else:
+        # find path for each agent using A*
+        if search_mode == "jps":
+            logger.info("Using A* with jump point pruning for pathfinding.")
+        else:
+            logger.info("Using standard A* for pathfinding.")
+        if config.workers > 1:
+            # agents are planned independently, so the queries can be split between processes
+            logger.info(f"Planning paths in {config.workers} worker processes.")
+            queries = [(agent.origin, agent.destination) for agent in agents]
+            heuristic_bytes = config.heuristic_cache_mb * 1024 * 1024 if config.distance_heuristic else 0
+            search_paths = plan_paths(grid, queries, config.workers, search_mode, heuristic_bytes, config.heuristic_spill_dir)
+        else:
+            if search_mode == "jps":
+                searcher = jump_search if jump_search is not None else JumpPointSearch(grid, heuristic)
+                expansions, heap_pushes = searcher.expansions, searcher.heap_pushes
+            search = searcher.search
+            search_paths = [search(agent.origin, agent.destination) for agent in agents]
+        for agent, search_path in zip(agents, search_paths):
+            agent.path = search_path
+            if len(agent.path) > max_length:
+                max_length = len(agent.path)
+
+    metrics.count("astar_expansions", searcher.expansions - expansions)
+    metrics.count("astar_heap_pushes", searcher.heap_pushes - heap_pushes)
+    return max_length
+
+class ConflictRepair:
+    """ Repairs conflicts between agent paths one subproblem at a time with the optimal solver
+
+    What is learned about conflicts is kept between calls of run: conflicts given up on are never scheduled again
+    and flagged conflicts keep their retry counts. start is the earliest conflict time that is repaired, agents
+    keep their positions before it; a lifelong solve moves it forward with its clock. Conflicts at steps from end
+    on are not looked for, with None the whole plan is repaired.
+    """
+    def __init__(self, grid, config, backend, solution_cache = None, solver_pool = None, metrics = DISABLED):
+        self.grid = grid
+        self.config = config
+        self.backend = backend
+        self.solution_cache = solution_cache
+        self.solver_pool = solver_pool
+        self.metrics = metrics
+        self.start = 0
+        self.end = None
+        self.unsolveable_conflicts = set()   # conflicts given up on, never scheduled again
+        self.flagged_conflicts = {}      # conflicts that have been unsolveable mulitple times - they get extra extra time
+        self.grown_subproblems = {}      # subproblems of the last failed attempts, valid until agent paths change
+        self.conflict_counts = []       # conflict type distribution and counts after every solved batch
+        self.unsolveable_outputs = []
+
+    def paths_changed(self):
+        # agent paths were changed by someone else, grown subproblems may no longer fit them
+        self.grown_subproblems.clear()
+
+    def run(self, agents, conflicts, max_length, occupancy, timeout):
+        """ Repairs conflicts in the order of a ConflictQueue until none are left or timeout seconds have passed
+
+        occupancy is an OccupancyIndex of the agent paths and is kept up to date. Returns the agents, the
+        conflicts left in the order they would have been repaired in, the new max_length and the seconds spent.
+        """
+        min_start_time = max(0, self.start - 1)     # the window of a subproblem starts at the last fixed positions
+        start_time = time.time()
+        current_time = time.time()
+        queue = ConflictQueue(self.grid, self.config.conflict_order)
+        queue.update(conflicts, agents)
+        while len(queue) > 0 and current_time - start_time < timeout:
+            conflict = queue.pop()
+
+            if conflict in self.flagged_conflicts:
+                unsolveable = False
+                retry_count = self.flagged_conflicts[conflict]
+                logger.info(f"Retrying conflict {conflict} for the {retry_count} time")
+                self.metrics.count("flagged_retries")
+
+                if retry_count > 30:     # giving up on the conflict
+                    self.unsolveable_conflicts.add(conflict)
+                    unsolveable = True
+                    logger.info(f"Marking conflict {conflict} as unsolvable after {retry_count} attempts")
+                    self.metrics.count("unsolveable_conflicts")
+
+                # increase size of area around conflict endpoints in the submap by retry_count
+                # and increase suggested minimum radius relative to retry count but no more than 10
+                sugg_radius = min(10, retry_count)
+                # the subproblem of the last attempt is grown in place while no agent paths changed since
+                with self.metrics.phase("subproblem_generation"):
+                    subproblem1 = self.grown_subproblems.pop(conflict, None)
+                    if subproblem1 is not None and subproblem1.grow(self.grid, agents, retry_count, sugg_radius, 4 * retry_count):
+                        self.metrics.count("subproblems_grown")
+                    else:
+                        subproblem1 = subproblem.Subproblem(conflict, agents, self.grid, size_inc=retry_count, sugg_min_radius=sugg_radius,
+                                                          occupancy=occupancy, min_start_time=min_start_time)
+                        # increase makespan in a way that's proportional to retry_count
+                        subproblem1.inc_ms_upd_avoids(agents, 4 * retry_count)
+
+                if unsolveable:
+                    if not self.config.concise:
+                        self.unsolveable_outputs.append(subproblem1.print_subproblem(agents))
+                        if self.config.verbose:
+                            print("unsolveable")
+
+                    continue
+
+            else:
+                with self.metrics.phase("subproblem_generation"):
+                    subproblem1 = subproblem.Subproblem(conflict, agents, self.grid, occupancy=occupancy, min_start_time=min_start_time)
+
+            logger.info(f"Created subproblem instance for conflict {conflict}")
+            batch = [(conflict, subproblem1)]
+
+            if self.solver_pool is None:
+                # call optimal solver on created subproblem
+                with self.metrics.phase("solving"):
+                    solution = subproblem1.solve(self.backend, self.solution_cache, self.metrics)
+                    if not solution.solved:
+                        logger.info("Optimal solver was not successful the first time")
+                        self.metrics.count("retries")
+                        # optimal solver failed to solve the subproblem
+                        subproblem1.inc_ms_upd_avoids(agents)  # increase available time
+                        solution = subproblem1.solve(self.backend, self.solution_cache, self.metrics)   # try to solve again
+                solutions = [solution]
+            else:
+                # add conflicts that can be solved next to this one, their solutions are merged in the order of the batch
+                with self.metrics.phase("batch_selection"):
+                    batch += select_batch(subproblem1, queue.peek(4 * self.config.solve_workers), agents, self.grid,
+                                          self.flagged_conflicts, self.config.solve_workers, occupancy=occupancy,
+                                          min_start_time=min_start_time)
+                    for selected, _ in batch[1:]:
+                        queue.remove(selected, agents)
+                logger.info(f"Solving a batch of {len(batch)} independent subproblems")
+                self.metrics.observe("batch_size", len(batch))
+                with self.metrics.phase("solving"):
+                    solutions = self.solver_pool.solve_subproblems([sub for _, sub in batch], agents, self.solution_cache, self.metrics)
+
+            retry_first = []    # conflicts flagged for the first time, they are retried next
+            solved_any = False
+            for (conflict, subproblem1), solution in zip(batch, solutions):
+                record_subproblem(self.metrics, conflict, subproblem1, solution)
+                if solution.solved:
+                    logger.info("Optimal solver was successful")
+                    # optimal solver successfully solved the subproblem
+                    with self.metrics.phase("merge"):
+                        agents, max_length = update_agents_from_solution(subproblem1, solution, agents, max_length, occupancy) # update agent paths based on optimal solver's solution
+                    solved_any = True
+                else:
+                    logger.info("Optimal solver was not successful the second time")
+                    # optimal solver wasn't successful even after 2nd attempt
+                    if conflict in self.flagged_conflicts:
+                        self.flagged_conflicts[conflict] += 1
+                    else:
+                        self.flagged_conflicts[conflict] = 1
+                        retry_first.append(conflict)
+                    self.grown_subproblems[conflict] = subproblem1
+
+            if solved_any:
+                self.grown_subproblems.clear()
+                start_time_detection = time.time()
+                agents = agents_stay_at_destination(agents, max_length)
+                occupancy.sync(agents, [])   # solved agents are already re-indexed, only path lengths may have changed
+                conflicts = self.detect(agents, occupancy)
+                self.metrics.add_phase("conflict_detection", time.time() - start_time_detection)
+                pos, edge, path = conflict_info(conflicts, self.config)
+                record_conflicts(self.metrics, pos, edge, path)
+                self.conflict_counts.append({'Position': pos, 'Edge': edge, 'Path': path, 'Total': pos+edge+path})
+                # only the conflicts that came or went, and those sharing agents with them, get new priorities
+                queue.update(conflicts, agents)
+                # failed conflicts that still exist keep their place at the front
+                retry_first = [c for c in retry_first if c in queue]
+            queue.push_front(retry_first, agents)
+
+            current_time = time.time()
+
+        self.metrics.count("conflict_queue_pushes", queue.pushes)
+        return agents, queue.conflicts(), max_length, current_time - start_time
+
+    def detect(self, agents, occupancy):
+        """ The conflicts from start to end that weren't given up on, in time order
+
+        Agents that move together past end would be cut off there in the same cell, which no subproblem can
+        repair, so path conflicts that reach end are followed along the paths of their agents until they split.
+        """
+        conflicts = occupancy.conflicts(agents, self.end, start=self.start)
+        if self.end is not None:
+            for c in conflicts:
+                if c.type == ConflictType.PATH and c.time // 2 + len(c.path) == self.end:
+                    extend_path_conflict(c, agents)
+        conflicts = [c for c in conflicts if c not in self.unsolveable_conflicts]
+        return reorder_conflicts(conflicts)
+
+    def run_range(self, agents, max_length, occupancy, timeout, conflicts = None):
+        """ Finds the conflicts from start to end and repairs them until only conflicts given up on are left or
+        timeout seconds have passed
+
+        run stops when it is done with the conflicts it was given, while conflicts that failed again can still be
+        there, so the conflicts are looked for again until there are none. conflicts, if given, are those detect
+        just found. Returns the same as run.
+        """
+        spent = 0
+        while spent < timeout:
+            if conflicts is None:
+                start_time = time.time()
+                conflicts = self.detect(agents, occupancy)
+                self.metrics.add_phase("conflict_detection", time.time() - start_time)
+                spent += time.time() - start_time
+            if not conflicts:
+                break
+            agents, conflicts, max_length, seconds = self.run(agents, conflicts, max_length, occupancy, timeout - spent)
+            spent += seconds
+            if spent < timeout:
+                conflicts = None    # looked for again
+        return agents, conflicts if conflicts is not None else [], max_length, spent
+
+    def run_windows(self, agents, max_length, occupancy, timeout, window, commit_steps = None):
+        """ Repairs the conflicts of the next window steps only, then commits the first commit_steps of them and moves
+        on, until the window reaches the end of the plan or timeout seconds have passed
+
+        Conflicts further ahead are neither looked for nor repaired until the window gets to them, so every
+        conflict detection only deals with the conflicts of one window. A conflict left in a committed step stays
+        in the plan. Returns the same as run, the conflicts left are those of the whole plan.
+        """
+        if commit_steps is None:
+            commit_steps = max(1, window // 2)
+        spent = 0
+        step = 0        # first step of the window, positions at it are committed unless it is 0
+        windows = 1
+        self.start = 0
+        self.end = window + 1
+        while True:
+            agents, conflicts, max_length, seconds = self.run_range(agents, max_length, occupancy, timeout - spent)
+            spent += seconds
+            if spent >= timeout or step + window >= max_length - 1:
+                break
+            step += commit_steps
+            windows += 1
+            self.start = 2 * step + 1
+            self.end = step + window + 1
+            logger.info(f"Committed the plan up to step {step}")
+        self.metrics.count("windows", windows)
+
+        self.start = 0
+        self.end = None
+        return agents, self.detect(agents, occupancy), max_length, spent
+
+def solve(problem, config = None, metrics = DISABLED, heuristic = None, backend = None, solution_cache = None, engine = None,
+          jump_search = None, distance_tables = None):
+    """ Finds paths for the agents of problem: initial paths by A*, then conflicts are repaired one subproblem at a
+    time until only conflicts given up on are left or config.timeout seconds have passed; conflicts are looked for
+    again after every pass (ConflictRepair.run_range). Returns a Result.
+
+    Nothing is written to files unless config asks for a solution cache directory or a heuristic spill directory.
+    A heuristic (DistanceTableCache of problem.grid), backend, solution_cache or engine (SearchEngine of
+    problem.grid with that heuristic) that is given is used instead of creating one and is left open, so that
+    several solves can share them; the same goes for jump_search and distance_tables of plan_initial_paths.
+    """
+    if config is None:
+        config = Config()
+    agents = problem.agents()
+    grid = problem.grid
+
+    # start time for measuring total length of A* calls
+    start_time_init = time.time()
+    if heuristic is None and config.distance_heuristic:
+        logger.info("Using exact distance tables as the A* heuristic.")
+        heuristic = DistanceTableCache(grid, config.heuristic_cache_mb * 1024 * 1024, config.heuristic_spill_dir)
+    max_length = plan_initial_paths(agents, grid, config, heuristic, metrics, engine, jump_search, distance_tables)
+
+    finding_init_paths_time = time.time() - start_time_init
+    logger.info(f"Non-optimal solver took {finding_init_paths_time} seconds to find initial paths for agents")
+    metrics.add_phase("initial_planning", finding_init_paths_time)
+    if heuristic:
+        logger.info(f"Distance table cache: {heuristic.stats()}")
+
+    # find conflicts from initially found paths
+    start_time_detection = time.time()
+    agents = agents_stay_at_destination(agents, max_length)
+    occupancy = OccupancyIndex(agents)     # kept up to date with agent paths, so conflicts are found incrementally
+    conflicts = identify_conflicts_vectorized(agents, max_length)
+    conflicts = reorder_conflicts(conflicts)
+    metrics.add_phase("conflict_detection", time.time() - start_time_detection)
+    pos_count, edge_count, path_count = conflict_info(conflicts, config)
+    record_conflicts(metrics, pos_count, edge_count, path_count)
+    initial_conflicts = len(conflicts)
+    initial_makespan = max_length
+    logger.info(f"Initial conflicts identified: {len(conflicts)}")
+    logger.info(f"Initial number of position conflicts: {pos_count}")
+    logger.info(f"Initial number of edge conflicts: {edge_count}")
+    logger.info(f"Initial number of path conflicts: {path_count}")
+    logger.info(f"Maximum agent path legnth after non-optimal solver: {max_length}")
+
+    initial_agents = copy.deepcopy(agents) if config.keep_initial_paths else None
+
+    own_backend = backend is None
+    if own_backend:
+        backend = create_backend(config.solver_backend)
+    solver_pool = None
+    try:
+        if metrics.enabled:
+            backend = MeteredBackend(backend, metrics)
+        logger.info(f"Solving subproblems with the {config.solver_backend} backend.")
+        if solution_cache is None and config.solution_cache_size > 0:
+            # instances that were solved before, also as part of another retry or another run, are not solved again
+            solution_cache = SolutionCache(config.solution_cache_size, config.solution_cache_dir, config.solver_backend)
+        if config.solve_workers > 1:
+            # conflicts whose subproblems don't interact are solved at the same time
+            logger.info(f"Solving independent subproblems in {config.solve_workers} worker processes.")
+            solver_pool = SolverPool(config.solver_backend, config.solve_workers)
+        repair = ConflictRepair(grid, config, backend, solution_cache, solver_pool, metrics)
+        if config.window is None:
+            agents, conflicts, max_length, repair_time = repair.run_range(agents, max_length, occupancy, config.timeout,
+                                                                          conflicts)
+            if conflicts:
+                # the time ran out with conflicts queued, the ones the final paths still have are reported
+                start_time_detection = time.time()
+                conflicts = repair.detect(agents, occupancy)
+                metrics.add_phase("conflict_detection", time.time() - start_time_detection)
+        else:
+            logger.info(f"Repairing conflicts {config.window} steps ahead at a time.")
+            agents, conflicts, max_length, repair_time = repair.run_windows(agents, max_length, occupancy, config.timeout,
+                                                                            config.window, config.commit_steps)
+    finally:
+        # also when the repair raises, so that a long-running caller doesn't keep worker processes around
+        if own_backend:
+            backend.close()
+        if solver_pool is not None:
+            solver_pool.close()
+    end_time = time.time()
+    unsolveable_conflicts = repair.unsolveable_conflicts
+
+    if solution_cache is not None:
+        logger.info(f"Solution cache: {solution_cache.stats()}")
+        for name, value in solution_cache.stats().items():
+            metrics.count("solution_cache_" + name, value)
+
+    timed_out = repair_time > config.timeout
+    if timed_out:
+        logger.info("Timeout occurred")
+
+    logger.info(f"Fixing conflicts took {repair_time} seconds")
+    logger.info(f"Total combined solver runtime is {end_time - start_time_init} seconds")
+
+    logger.info(f"Number of conflicts at termination: {len(conflicts)}")
+    logger.info(f"Number of unsolveable conflicts at termination: {len(unsolveable_conflicts)}")
+    metrics.add_phase("conflict_solving", repair_time)
+    metrics.count("remaining_conflicts", len(conflicts))
+
+    logger.info(f"Maximum agent path legnth after optimal solver: {max_length}")
+
+    times = {"initial_planning": finding_init_paths_time, "conflict_solving": repair_time,
+             "total": end_time - start_time_init}
+    stats = metrics.summary() if metrics.enabled else None
+    return Result(agents, max_length, initial_makespan, initial_conflicts, conflicts, unsolveable_conflicts,
+                  repair.conflict_counts, repair.unsolveable_outputs, timed_out, times, stats, initial_agents)
+
+def conflict_info(conflicts, config):
+    # numbers of position, edge and path conflicts, printed as well in verbose mode
+    if config.verbose:
+        return print_conflict_info(conflicts)
+    return count_conflict_types(conflicts)
+
+def record_conflicts(metrics, pos_count, edge_count, path_count):
+    # conflicts found by one conflict detection, by type
+    metrics.count("conflicts_position", pos_count)
+    metrics.count("conflicts_edge", edge_count)
+    metrics.count("conflicts_path", path_count)
+
+def record_subproblem(metrics, conflict, sub, solution):
+    metrics.count("subproblems")
+    metrics.observe("subproblem_nodes", len(sub.nodes_sub_to_main))
+    metrics.observe("subproblem_agents", len(sub.agent_index_main_to_sub))
+    metrics.event("subproblem", conflict=conflict.type.name, nodes=len(sub.nodes_sub_to_main),
+                  agents=len(sub.agent_index_main_to_sub), makespan=int((sub.end_time - sub.start_time) / 2), status=solution.status)
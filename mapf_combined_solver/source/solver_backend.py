@@ -0,0 +1,257 @@
+import os
+import subprocess
+import tempfile
+import time
+
+import cbs
+import optimal_solver
+
+SOLVED = "solved"
+UNSOLVED = "unsolved"   # the solver ran but found no plan
+ERROR = "error"         # the solver could not be run or stopped abnormally
+
+END_OF_PLAN = "end"     # line written by mks --serve after every instance
+
+class SolverInstance:
+    """ A subproblem in the form the optimal solver takes it
+
+    Nodes are submap indices starting at 1 and neighbors[node] lists the nodes reachable in one step, including
+    node itself. Agents are (origin, destination) pairs and avoids has one list of (node, time) pairs per agent
+    outside of the subproblem, with time starting at 1. A makespan of -1 lets the solver find the smallest one.
+    """
+    def __init__(self, agents, avoids, nodes, neighbors, makespan = -1, sum_of_costs = -1):
+        self.agents = agents
+        self.avoids = avoids
+        self.nodes = nodes
+        self.neighbors = neighbors
+        self.makespan = makespan
+        self.sum_of_costs = sum_of_costs
+
+    def translation(self, instance_file = None):
+        return optimal_solver.Optimal_Solver(self.agents, self.avoids, self.nodes, self.neighbors, self.makespan, self.sum_of_costs, instance_file)
+
+class SolverResult:
+    """ Outcome of one solve: status, one path of submap nodes per agent of the instance and the raw solver output """
+    def __init__(self, status, paths = None, makespan = -1, returncode = 0, output = "", elapsed = 0.0):
+        self.status = status
+        self.paths = paths
+        self.makespan = makespan
+        self.returncode = returncode
+        self.output = output
+        self.elapsed = elapsed
+
+    @property
+    def solved(self):
+        return self.status == SOLVED
+
+def parse_plan(output):
+    """ Paths from the output of mks.pi, None if the output contains no complete plan
+
+    The plan starts with a line "agents | timesteps" followed by "K M" and one line of M nodes per agent, whatever
+    the solver printed before it and whichever line endings it used.
+    """
+    lines = output.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip() == "agents | timesteps":
+            break
+    else:
+        return None
+    try:
+        k, m = (int(v) for v in lines[i + 1].split())
+        paths = [[int(v) for v in line.split()] for line in lines[i + 2:i + 2 + k]]
+    except (IndexError, ValueError):
+        return None
+    if len(paths) < k or any(len(path) != m for path in paths):
+        return None
+    return paths
+
+def format_plan(paths):
+    # the same text mks.pi prints for a plan
+    lines = ["agents | timesteps", str(len(paths)) + " " + str(len(paths[0]) if paths else 0)]
+    lines += [" ".join(str(v) for v in path) + " " for path in paths]
+    return "\n".join(lines) + "\n"
+
+def result_from_output(output, returncode, elapsed):
+    if returncode != 0:
+        return SolverResult(ERROR, returncode = returncode, output = output, elapsed = elapsed)
+    paths = parse_plan(output)
+    if paths is None:
+        return SolverResult(UNSOLVED, returncode = returncode, output = output, elapsed = elapsed)
+    return SolverResult(SOLVED, paths, len(paths[0]) if paths else 0, returncode, output, elapsed)
+
+class PicatBackend:
+    """ Starts one picat process per instance, the instance is written to its own temporary file """
+    def __init__(self, work_dir = None):
+        self.work_dir = work_dir
+
+    def solve(self, instance):
+        start = time.time()
+        fd, instance_file = tempfile.mkstemp(prefix="opt_solver_", suffix=".pi", dir=self.work_dir)
+        os.close(fd)
+        try:
+            result = instance.translation(instance_file).call_solver()
+            output = result.stdout.decode(errors="replace")
+            returncode = result.returncode
+        except OSError as e:
+            output = str(e)
+            returncode = 127       # what a shell reports when the command is not found
+        finally:
+            os.remove(instance_file)
+        return result_from_output(output, returncode, time.time() - start)
+
+    def close(self):
+        pass
+
+class PicatServerBackend:
+    """ Keeps one picat process running (mks --serve) and sends it every instance as a term over its stdin
+
+    Each plan is read back up to the END_OF_PLAN line. If the process dies it is restarted for the next instance.
+    """
+    def __init__(self, model = optimal_solver.MODEL):
+        self.model = model
+        self.process = None
+        self.restarts = 0       # number of times the process stopped and had to be started again
+
+    def start(self):
+        self.process = subprocess.Popen(['picat', self.model, '--serve'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+
+    def solve(self, instance):
+        start = time.time()
+        if self.process is None or self.process.poll() is not None:
+            if self.process is not None:
+                self.restarts += 1      # stopped while idle
+            try:
+                self.start()
+            except OSError as e:
+                self.process = None
+                return SolverResult(ERROR, returncode = 127, output = str(e), elapsed = time.time() - start)
+        lines = []
+        try:
+            self.process.stdin.write(instance.translation().get_instance_term() + "\n")
+            self.process.stdin.flush()
+            for line in self.process.stdout:
+                line = line.rstrip("\r\n")
+                if line == END_OF_PLAN:
+                    return result_from_output("\n".join(lines), 0, time.time() - start)
+                lines.append(line)
+        except OSError:
+            pass
+        # the process ended before finishing the plan, it is started again for the next instance
+        returncode = self.process.wait()
+        self.process = None
+        self.restarts += 1
+        return SolverResult(ERROR, returncode = returncode if returncode != 0 else 1, output = "\n".join(lines), elapsed = time.time() - start)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+            self.process = None
+
+class LocalBackend:
+    """ Stand-in for the Picat solver written in Python, for running and testing without a Picat binary
+
+    Agents are planned one after another, each with a breadth-first search over (node, time) that keeps clear of
+    the avoids and of the agents planned before it, with the same rules as mks.pi: every agent is at its origin
+    at time 1 and at its destination at time M, no two agents share a node and an edge is used by at most one
+    agent in either direction. It is not complete, so it can fail on instances Picat solves.
+    """
+    def solve(self, instance):
+        start = time.time()
+        dist = [cbs.distances(instance.neighbors, dest) for _, dest in instance.agents]
+        for m in makespans(instance, dist):
+            paths = self.plan(instance, m, dist)
+            if paths is not None:
+                return SolverResult(SOLVED, paths, m, 0, format_plan(paths), time.time() - start)
+        return SolverResult(UNSOLVED, output = "no plan\n", elapsed = time.time() - start)
+
+    def plan(self, instance, makespan, dist):
+        vertices, edges = cbs.avoid_tables(instance.avoids)    # extended with the agents planned so far
+        paths = []
+        for a, (origin, dest) in enumerate(instance.agents):
+            path = self.space_time_search(instance, origin, dest, makespan, dist[a], vertices, edges)
+            if path is None:
+                return None
+            for t in range(1, makespan + 1):
+                vertices.add((path[t - 1], t))
+                if t < makespan:
+                    edges.add((path[t - 1], path[t], t))
+                    edges.add((path[t], path[t - 1], t))
+            paths.append(path)
+        return paths
+
+    def space_time_search(self, instance, origin, dest, makespan, dist, vertices, edges):
+        if (origin, 1) in vertices:
+            return None
+        parents = [{origin: None}]    # parents[t - 1][node] is the node at time t - 1 on a path to node at time t
+        for t in range(1, makespan):
+            layer = {}
+            for node in parents[-1]:
+                for n in instance.neighbors[node]:
+                    # n must still be able to reach dest by time makespan
+                    if n in layer or dist.get(n, makespan) > makespan - t - 1:
+                        continue
+                    if (n, t + 1) in vertices or (node, n, t) in edges:
+                        continue
+                    layer[n] = node
+            if not layer:
+                return None
+            parents.append(layer)
+        if dest not in parents[-1]:
+            return None
+        path = [dest]
+        for t in range(makespan - 1, 0, -1):
+            path.append(parents[t][path[-1]])
+        path.reverse()
+        return path
+
+    def close(self):
+        pass
+
+class CBSBackend:
+    """ Solves instances in-process with conflict-based search over space-time A* (see cbs.py)
+
+    Instances with at most joint_agents agents are searched jointly instead, which is exact and much faster
+    at showing that a pair of agents can't pass each other. Unlike LocalBackend it is complete for a fixed
+    makespan, up to max_nodes expanded constraint tree nodes.
+    """
+    def __init__(self, max_nodes = 2000, joint_agents = 2):
+        self.max_nodes = max_nodes
+        self.joint_agents = joint_agents
+        self.expanded = 0       # constraint tree nodes over all instances
+
+    def solve(self, instance):
+        start = time.time()
+        dist = [cbs.distances(instance.neighbors, dest) for _, dest in instance.agents]
+        vertices, edges = cbs.avoid_tables(instance.avoids)
+        for m in makespans(instance, dist):
+            paths, finished = None, False
+            if len(instance.agents) <= self.joint_agents:
+                paths, finished = cbs.joint_search(instance.neighbors, instance.agents, m, dist, vertices, edges)
+            if not finished:
+                paths, expanded = cbs.cbs(instance.neighbors, instance.agents, m, vertices, edges, self.max_nodes)
+                self.expanded += expanded
+            if paths is not None:
+                return SolverResult(SOLVED, paths, m, 0, format_plan(paths), time.time() - start)
+        return SolverResult(UNSOLVED, output = "no plan\n", elapsed = time.time() - start)
+
+    def close(self):
+        pass
+
+def makespans(instance, dist):
+    # makespans to try: the given one, or from the lower bound up when the solver has to find it (makespan -1)
+    if any(d.get(origin) is None for d, (origin, _) in zip(dist, instance.agents)):
+        return []
+    if instance.makespan != -1:
+        return [instance.makespan]
+    lower_bound = max([d[origin] for d, (origin, _) in zip(dist, instance.agents)], default=0) + 1
+    return range(lower_bound, lower_bound + len(instance.nodes) + 1)
+
+BACKENDS = {"picat": PicatBackend, "picat-server": PicatServerBackend, "local": LocalBackend, "cbs": CBSBackend}
+
+def create_backend(name):
+    return BACKENDS[name]()
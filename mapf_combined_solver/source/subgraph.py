@@ -0,0 +1,93 @@
+from array import array
+import numpy as np
+
+class SubgraphBFS:
+    """ Breadth-first search over the cells of a Grid that collects the cells of a submap and their induced subgraph
+
+    The search is done level by level with a visited bitmap over the grid, so no queue is ever scanned. Within a
+    level cells are numbered in the order of their (x, y) coordinates, which gives every cell the same submap
+    number as the heap-based search of Subproblem.make_submap_other did. Cell number i + 1 is cells[i], the
+    numbering nodes_sub_to_main follows. The search can be continued with a larger radius by calling expand
+    again; cells found before keep their numbers.
+    """
+    def __init__(self, grid, sources):
+        self.grid = grid
+        self.visited = bytearray(grid.size)     # 1 for cells in the submap or waiting for their level
+        self.cells = array("i")                 # cell ids in the order of their submap numbers
+        self.levels = array("i")                # BFS level of every cell in cells
+        self.expanded = bytearray()             # 1 for cells in cells whose neighbors were visited
+        self.pending = {}                       # level -> cells found but not numbered yet
+        self.radius = 0
+        for cell in sources:
+            if not self.visited[cell]:
+                self.visited[cell] = 1
+                self.pending.setdefault(0, []).append(cell)
+
+    def expand(self, min_radius, min_size, max_radius):
+        """ Extends the submap until min_radius levels, or more while it has fewer than min_size cells, but never
+        beyond max_radius. Returns the number of cells it had before. """
+        first_new = len(self.cells)
+        size = 0
+        # cells found before are replayed, the larger radius may expand some of them
+        for i in range(first_new):
+            level = self.levels[i]
+            size += 1
+            if level == min_radius and size < min_size:
+                min_radius += 1
+            if level < min_radius and level < max_radius and not self.expanded[i]:
+                self.expand_cell(i)
+        coords = self.grid.coords
+        while self.pending:
+            level = min(self.pending)
+            for cell in sorted(self.pending.pop(level), key=coords.__getitem__):
+                i = len(self.cells)
+                self.cells.append(cell)
+                self.levels.append(level)
+                self.expanded.append(0)
+                size += 1
+                if level == min_radius and size < min_size:
+                    min_radius += 1
+                if level < min_radius and level < max_radius:
+                    self.expand_cell(i)
+        if len(self.cells) > first_new:
+            self.radius = self.levels[-1]
+        return first_new
+
+    def expand_cell(self, i):
+        self.expanded[i] = 1
+        visited = self.visited
+        found = None
+        for n in self.grid.adjacency[self.cells[i]]:
+            if not visited[n]:
+                visited[n] = 1
+                if found is None:
+                    found = self.pending.setdefault(self.levels[i] + 1, [])
+                found.append(n)
+
+    def numbers(self):
+        # cell id -> submap number
+        return {cell: i + 1 for i, cell in enumerate(self.cells)}
+
+    def neighbor_list(self, i, numbers):
+        # submap node i + 1 followed by its neighbors in the submap, in the order of Grid.neighbor_cells
+        result = [i + 1]
+        for n in self.grid.adjacency[self.cells[i]]:
+            m = numbers.get(n)
+            if m is not None:
+                result.append(m)
+        return result
+
+    def induced(self):
+        """ Induced subgraph of the cells as relabeled CSR arrays: the list of submap node n is
+        targets[offsets[n - 1]:offsets[n]], the same list neighbor_list gives """
+        n = len(self.cells)
+        cells = np.frombuffer(self.cells, dtype=np.int32) if n > 0 else np.zeros(0, dtype=np.int32)
+        numbers = np.zeros(self.grid.size + 1, dtype=np.int32)   # the extra last entry stays 0 for the -1 padding
+        numbers[cells] = np.arange(1, n + 1, dtype=np.int32)
+        lists = np.empty((n, 5), dtype=np.int32)
+        lists[:, 0] = np.arange(1, n + 1, dtype=np.int32)
+        lists[:, 1:] = numbers[self.grid.neighbor_matrix[cells]]
+        present = lists > 0
+        offsets = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(present.sum(axis=1), out=offsets[1:])
+        return offsets, lists[present]
@@ -1,29 +1,58 @@
-import optimal_solver
+import solver_backend
 import informed_search
 from conflicts import ConflictType
-import heapq
+from subgraph import SubgraphBFS
+from metrics import DISABLED
 
 class Subproblem:
     # all_agents is a list of all of the agents in the main problem
-    def __init__(self, conflict, all_agents, main_map, size_inc = 0, map_size=10, sugg_min_radius = 2):
+    # occupancy is an OccupancyIndex of all agent paths, with it avoids are found without scanning every agent
+    # the time window never starts before min_start_time, agent positions before it are fixed (the past of a lifelong solve)
+    def __init__(self, conflict, all_agents, main_map, size_inc = 0, map_size=10, sugg_min_radius = 2, occupancy = None, min_start_time = 0):
         self.conflict = conflict
+        self.occupancy = occupancy
+        self.min_start_time = min_start_time
         self.extra_time = len(conflict.agents)   
         self.radius = -1   
         self.increased_makespan = 0
+        self.size_inc = size_inc
+        self.map_size = map_size
+        self.sugg_min_radius = sugg_min_radius
 
         if conflict.type == ConflictType.PATH:
-            self.start_time = max(0, self.conflict.time - 2)
+            self.start_time = max(min_start_time, self.conflict.time - 2)
             if self.start_time < 0:
                 self.start_time = 0
                 print("Multiple agents have the same origin")
             self.end_time = conflict.time + (2 * len(conflict.path)) + (2 * len(conflict.agents))
             self.map, self.nodes_main_to_sub, self.nodes_sub_to_main = self.make_submap_path(main_map, all_agents, size_inc)
-            self.agents = []
-            self.agent_index_main_to_sub = {}
-            self.agent_index_sub_to_main = {}
+        else:
+            max_radius = max(int((self.conflict.time - min_start_time) / 2), sugg_min_radius + 1)
+            self.map, self.nodes_main_to_sub, self.nodes_sub_to_main, radius = self.make_submap_other(main_map, all_agents, sugg_min_radius, map_size, max_radius)
+            self.set_radius(radius)
+        self.find_agents(all_agents)
+        self.avoids = self.find_avoids(all_agents)    # list of (position, time) pairs which other agents occupy (need all times that exist starting with start_time)
+
+    def set_radius(self, radius):
+        # time window of a position or edge conflict with a submap of the given radius
+        self.radius = radius
+        if self.conflict.type == ConflictType.POSITION:
+            self.start_time = max(self.min_start_time, self.conflict.time - (2 * radius))
+            self.end_time = self.conflict.time + (2 * radius)
+        else:   # edge conflict
+            self.start_time = max(self.min_start_time, self.conflict.time - 1 - (2 * radius))
+            self.end_time = self.conflict.time + 1 + (2 * radius)
+
+    def find_agents(self, all_agents):
+        # origins and destinations of the conflict agents in the submap at the start and end of the time window
+        self.agents = []
+        self.agent_index_main_to_sub = {}
+        self.agent_index_sub_to_main = {}
+        self.dest_steps = {}    # main agent index -> step of its path the destination was taken from
+        if self.conflict.type == ConflictType.PATH:
             i = 1
             # end_time_index = int(self.end_time / 2)
-            end_time_index = int(conflict.time/2) + len(conflict.path) + 2 # 2 because at least two positions post path were added
+            end_time_index = int(self.conflict.time/2) + len(self.conflict.path) + 2 # 2 because at least two positions post path were added
 
             for ag in self.conflict.agents:
                 agent = all_agents[ag]
@@ -32,57 +61,80 @@ class Subproblem:
                 ag_origin = agent.path[int(self.start_time / 2)]
                 origin = self.nodes_main_to_sub[ag_origin]
                 # end_time_index = int(self.start_time / 2) + len(self.conflict.path) + 1
-                if end_time_index < len(agent.path):
-                    ag_dest = agent.path[end_time_index]
-                else:
-                    ag_dest = agent.path[-1]
+                self.dest_steps[agent.index] = min(end_time_index, len(agent.path) - 1)
+                ag_dest = agent.path[self.dest_steps[agent.index]]
                 dest = self.nodes_main_to_sub[ag_dest]
                 self.agents.append((origin, dest))
                 i += 1
-
         else:
-            max_radius = max(int(self.conflict.time / 2), sugg_min_radius + 1)
-            self.map, self.nodes_main_to_sub, self.nodes_sub_to_main, radius = self.make_submap_other(main_map, all_agents, sugg_min_radius, map_size, max_radius)
-            self.radius = radius
-            if self.conflict.type == ConflictType.POSITION:
-                self.start_time = max(0, self.conflict.time - (2 * radius))
-                self.end_time = self.conflict.time + (2 * radius)
-            else:   # edge conflict
-                self.start_time = max(0, self.conflict.time - 1 - (2 * radius))
-                self.end_time = self.conflict.time + 1 + (2 * radius)
-            self.agents = []
-            self.agent_index_main_to_sub = {}
-            self.agent_index_sub_to_main = {}
             agent_i = 1
             for a in self.conflict.agents:
                 ag = all_agents[a]
                 origin = ag.path[int(self.start_time / 2)]
-                if int(self.end_time / 2) >= len(ag.path):
-                    dest = ag.path[-1]
-                else:
-                    dest = ag.path[int(self.end_time / 2)]
+                self.dest_steps[a] = min(int(self.end_time / 2), len(ag.path) - 1)
+                dest = ag.path[self.dest_steps[a]]
                 origin = self.nodes_main_to_sub[origin]
                 dest = self.nodes_main_to_sub[dest]
                 self.agents.append((origin, dest))
                 self.agent_index_main_to_sub[a] = agent_i
                 self.agent_index_sub_to_main[agent_i] = a
                 agent_i += 1
-        self.avoids = self.find_avoids(all_agents)    # list of (position, time) pairs which other agents occupy (need all times that exist starting with start_time)
 
-    def solve(self):
-        # create optimal solver instance
+    def instance(self):
+        # optimal solver instance of the subproblem with its current makespan and avoids
         ms = int((self.end_time - self.start_time) / 2)
-        os = optimal_solver.Optimal_Solver(self.agents, self.avoids, list(self.nodes_sub_to_main.keys()), self.map, makespan = ms) 
-        result = os.call_solver()
-        output = result.stdout.decode()
-        return output, result.returncode
+        return solver_backend.SolverInstance(self.agents, self.avoids, list(self.nodes_sub_to_main.keys()), self.map, makespan = ms)
+
+    def solve(self, backend = None, cache = None, metrics = DISABLED):
+        # solve the optimal solver instance with the given backend, a new picat process by default
+        # a SolutionCache is checked first, the solver only runs for instances it has not seen
+        if backend is None:
+            backend = solver_backend.PicatBackend()
+        with metrics.phase("instance_generation"):
+            instance = self.instance()
+        if cache is not None:
+            return cache.solve(instance, self.nodes_sub_to_main, backend)
+        return backend.solve(instance)
     
     def inc_ms_upd_avoids(self, all_agents, extra_time = 0):
+        # agent paths must not have changed since the avoids were found, only the new time layers are added
         self.end_time += extra_time
         self.increased_makespan += extra_time
-        self.avoids = self.find_avoids(all_agents)
+        self.extend_avoids(all_agents)
+        self.avoids = self.make_avoids()
         return
 
+    def grow(self, main_map, all_agents, size_inc = 0, sugg_min_radius = 2, increased_makespan = 0):
+        """ Turns the subproblem into the one a new Subproblem with size_inc and sugg_min_radius followed by
+        inc_ms_upd_avoids(all_agents, increased_makespan) would give, for agent paths that did not change since
+        it was built
+
+        Only the new ring of cells and the new time layers are added: existing nodes keep their numbers and
+        existing avoid entries are kept. Returns False, leaving the subproblem unchanged, when the new one would
+        not contain this one.
+        """
+        if increased_makespan < self.increased_makespan:
+            return False
+        if self.conflict.type == ConflictType.PATH:
+            # the submap of a path conflict only depends on size_inc
+            if size_inc < self.size_inc:
+                return False
+            self.end_time -= self.increased_makespan
+            self.grow_submap_path(main_map, all_agents, size_inc)
+        else:
+            if sugg_min_radius < self.sugg_min_radius:
+                return False
+            max_radius = max(int((self.conflict.time - self.min_start_time) / 2), sugg_min_radius + 1)
+            self.set_radius(self.grow_submap_other(main_map, sugg_min_radius, self.map_size, max_radius))
+        self.size_inc = size_inc
+        self.sugg_min_radius = sugg_min_radius
+        self.find_agents(all_agents)    # endpoints are taken before the makespan is increased
+        self.end_time += increased_makespan
+        self.increased_makespan = increased_makespan
+        self.extend_avoids(all_agents)
+        self.avoids = self.make_avoids()
+        return True
+
     def add_pos_and_neighbors(self, pos, i, nodes_main_to_sub, nodes_sub_to_main, submap, neighbors):
         pos_index = i
         if pos not in nodes_main_to_sub.keys():
@@ -165,6 +217,24 @@ class Subproblem:
         loop_end = time + 3
         if increase_size != 0:
             loop_end += increase_size
+        self.path_time = time
+        self.add_path_positions(main_map, all_agents, submap, nodes_main_to_sub, nodes_sub_to_main, i, loop_end)
+
+        for n in submap.keys():
+            node = nodes_sub_to_main[n]
+            possible_neighbors = informed_search.get_neighbors(main_map, node)
+            for pn in possible_neighbors:
+                if pn in nodes_main_to_sub.keys():
+                    pn_sub = nodes_main_to_sub[pn]
+                    if pn_sub not in submap[n]:
+                        submap[n].append(pn_sub)
+
+        return submap, nodes_main_to_sub, nodes_sub_to_main
+
+    def add_path_positions(self, main_map, all_agents, submap, nodes_main_to_sub, nodes_sub_to_main, i, loop_end):
+        # positions of the conflict agents from self.path_time up to loop_end and their best neighbors
+        conflict_path = self.conflict.path
+        time = self.path_time
         while time < loop_end:   
             for a in self.conflict.agents:
                 if time < len(all_agents[a].path):
@@ -177,93 +247,127 @@ class Subproblem:
                     i, nodes_main_to_sub, nodes_sub_to_main, submap = self.add_pos_and_neighbors(p, i, nodes_main_to_sub, nodes_sub_to_main, submap, neighbors_ranked)
 
             time += 1
+        self.path_time = time
+        return i
 
-        for n in submap.keys():
-            node = nodes_sub_to_main[n]
-            possible_neighbors = informed_search.get_neighbors(main_map, node)
-            for pn in possible_neighbors:
-                if pn in nodes_main_to_sub.keys():
-                    pn_sub = nodes_main_to_sub[pn]
-                    if pn_sub not in submap[n]:
-                        submap[n].append(pn_sub)
+    def grow_submap_path(self, main_map, all_agents, increase_size):
+        # follow the agents increase_size - size_inc steps further and connect the new nodes to their neighbors
+        first_new = len(self.nodes_sub_to_main) + 1
+        loop_end = self.path_time + increase_size - self.size_inc
+        i = self.add_path_positions(main_map, all_agents, self.map, self.nodes_main_to_sub, self.nodes_sub_to_main, first_new, loop_end)
+        for n in range(first_new, i):
+            for pn in informed_search.get_neighbors(main_map, self.nodes_sub_to_main[n]):
+                pn_sub = self.nodes_main_to_sub.get(pn)
+                if pn_sub is not None:
+                    if pn_sub not in self.map[n]:
+                        self.map[n].append(pn_sub)
+                    if n not in self.map[pn_sub]:
+                        self.map[pn_sub].append(n)
 
-        return submap, nodes_main_to_sub, nodes_sub_to_main
-        
     def make_submap_other(self, main_map, all_agents, min_radius = 2, min_size = 7, max_radius = 200):
-        queue = []
-        submap = {}
-        nodes_main_to_sub = {}
-        nodes_sub_to_main = {}
+        # want to do bfs from position or edge positions and go out to the minimum radius or minimum number of positions
         if self.conflict.type == ConflictType.EDGE:
-            heapq.heappush(queue, (0, self.conflict.edge.first()))
-            heapq.heappush(queue, (0, self.conflict.edge.second()))
+            sources = [main_map.cell_id(self.conflict.edge.first()), main_map.cell_id(self.conflict.edge.second())]
         else:
-            heapq.heappush(queue, (0, self.conflict.position))
-        
-        i = 1
-        # want to do bfs from position or edge positions and go out to the minimum radius or minimum number of positions
-        while len(queue) > 0:
-            level, pos = heapq.heappop(queue)
-            if pos not in nodes_main_to_sub:
-                # don't re-explore already visited nodes
-                pos_i = i 
-                i += 1
-                submap[pos_i] = [pos_i]
-                nodes_main_to_sub[pos] = pos_i 
-                nodes_sub_to_main[pos_i] = pos
-                if level == min_radius and len(submap) < min_size:
-                    min_radius += 1   
-                if level < min_radius and level < max_radius:
-                    for n in informed_search.get_neighbors(main_map, pos):
-                        if n not in nodes_main_to_sub and (level + 1, n) not in queue:
-                            heapq.heappush(queue, (level + 1, n))
-            if len(queue) == 0:
-                max_level = level
-
-        # update neighbor lists
-        for n in submap.keys():
-            node = nodes_sub_to_main[n]
-            possible_neighbors = informed_search.get_neighbors(main_map, node)
-            for pn in possible_neighbors:
-                if pn in nodes_main_to_sub.keys():
-                    pn_sub = nodes_main_to_sub[pn]
-                    if pn_sub not in submap[n]:
-                        submap[n].append(pn_sub)
+            sources = [main_map.cell_id(self.conflict.position)]
+        self.bfs = SubgraphBFS(main_map, sources)     # kept for growing the submap
+        self.bfs.expand(min_radius, min_size, max_radius)
 
-        return submap, nodes_main_to_sub, nodes_sub_to_main, max_level   
+        # relabeled induced subgraph, node n is the cell self.bfs.cells[n - 1]
+        coords = main_map.coords
+        nodes_sub_to_main = {i + 1: coords[cell] for i, cell in enumerate(self.bfs.cells)}
+        nodes_main_to_sub = {pos: n for n, pos in nodes_sub_to_main.items()}
+        offsets, targets = self.bfs.induced()
+        offsets = offsets.tolist()
+        targets = targets.tolist()
+        submap = {n: targets[offsets[n - 1]:offsets[n]] for n in nodes_sub_to_main}
+        return submap, nodes_main_to_sub, nodes_sub_to_main, self.bfs.radius
+
+    def grow_submap_other(self, main_map, min_radius, min_size, max_radius):
+        """ Continues the BFS of make_submap_other with a larger radius, existing nodes keep their numbers and
+        only the neighbor lists of new nodes and of the nodes next to them are built """
+        bfs = self.bfs
+        first_new = bfs.expand(min_radius, min_size, max_radius)
+        coords = main_map.coords
+        changed = set()
+        for i in range(first_new, len(bfs.cells)):
+            pos = coords[bfs.cells[i]]
+            self.nodes_sub_to_main[i + 1] = pos
+            self.nodes_main_to_sub[pos] = i + 1
+        numbers = bfs.numbers()
+        for i in range(first_new, len(bfs.cells)):
+            changed.add(i)
+            for n in main_map.neighbor_cells(bfs.cells[i]):
+                if n in numbers:
+                    changed.add(numbers[n] - 1)
+        for i in changed:
+            self.map[i + 1] = bfs.neighbor_list(i, numbers)
+        return bfs.radius
 
-    def make_avoid(self, path, pos_time_pairs):
-        result = []
-        start = 0
-    
-        for pos in path:
-            if pos in self.nodes_main_to_sub.keys():
-                pair = (self.nodes_main_to_sub[pos], path.index(pos, start) + 1)
-                start = path.index(pos, start) + 1
-                if pair not in pos_time_pairs:
-                    result.append(pair)
-                    pos_time_pairs.append(pair)
-        return result, pos_time_pairs
-    
     def find_avoids(self, all_agents):
-        pos_time_pairs = []     # a list of position time pairs that are already in the list avoids
-        avoids = [] 
+        # (position, step) pairs of the other agents are collected in avoid_table, which can be extended when
+        # the submap or the time window grows
+        self.avoid_table = {}       # (submap node, step) -> index of the first agent there
+        self.avoid_nodes = set()    # main map positions the table covers
+        self.avoid_window = (0, -1) # steps the table covers
+        self.extend_avoids(all_agents)
+        return self.make_avoids()
+
+    def extend_avoids(self, all_agents):
+        # adds the pairs for nodes and steps the table doesn't cover yet, a pair belongs to the first agent there
+        start_pos_time = int(self.start_time / 2)
         end_pos_time = int(self.end_time / 2)
+        old_start, old_end = self.avoid_window
+        nodes = self.nodes_main_to_sub
+        new_nodes = {pos: n for pos, n in nodes.items() if pos not in self.avoid_nodes}
+        if self.occupancy is not None:
+            if old_end < old_start:
+                self.add_visits(nodes, start_pos_time, end_pos_time)
+            else:
+                self.add_visits(new_nodes, max(start_pos_time, old_start), min(end_pos_time, old_end))
+                self.add_visits(nodes, start_pos_time, min(end_pos_time, old_start - 1))
+                self.add_visits(nodes, max(start_pos_time, old_end + 1), end_pos_time)
+        else:
+            table = self.avoid_table
+            for i in range(len(all_agents)):
+                if i in self.agent_index_main_to_sub:    # only want agents not present in the conflict
+                    continue
+                path = all_agents[i].path
+                for step in range(start_pos_time, min(end_pos_time + 1, len(path))):
+                    if old_start <= step <= old_end:
+                        n = new_nodes.get(path[step])
+                    else:
+                        n = nodes.get(path[step])
+                    if n is not None and (n, step) not in table:
+                        table[(n, step)] = i
+        self.avoid_nodes = set(nodes)
+        if old_end < old_start:
+            self.avoid_window = (start_pos_time, end_pos_time)
+        else:
+            self.avoid_window = (min(start_pos_time, old_start), max(end_pos_time, old_end))
+
+    def add_visits(self, positions, start, end):
+        # the same pairs as the scan over all agents, taken from the occupancy index for positions and steps start..end
+        table = self.avoid_table
+        nodes = self.nodes_main_to_sub
+        for pos, step, occupants in self.occupancy.visits(positions, start, end):
+            key = (nodes[pos], step)
+            if key in table:
+                continue
+            for i in occupants:     # sorted, so the first agent outside of the conflict has the lowest index
+                if i not in self.agent_index_main_to_sub:
+                    table[key] = i
+                    break
+
+    def make_avoids(self):
+        # one list of (node, time) per agent, time counted from 1 at start_time, agents and times in increasing order
         start_pos_time = int(self.start_time / 2)
-        for i in range(len(all_agents)):
-            ag = all_agents[i]
-            if not i in self.agent_index_main_to_sub.keys() and start_pos_time < len(ag.path):        # only want agents not present in the conflict
-                    if len(ag.path) < end_pos_time:                 # agent ends before end of conflict
-                        rel_path = ag.path[start_pos_time:]         
-                    else:                                           # conflict ends before agent ends
-                        rel_path = ag.path[start_pos_time: (end_pos_time + 1)]
-                    # path in map has to change to return a list of tuples (start in map, end in map)
-                    # because the agent can have multiple paths in the map but also leaves the map 
-                    # in betweeen those sections
-                    result, pos_time_pairs = self.make_avoid(rel_path, pos_time_pairs)
-                    if len(result) > 0:
-                        avoids.append(result)
-        return avoids
+        end_pos_time = int(self.end_time / 2)
+        rows = {}
+        for (n, step), i in self.avoid_table.items():
+            if start_pos_time <= step <= end_pos_time:
+                rows.setdefault(i, []).append((n, step - start_pos_time + 1))
+        return [sorted(rows[i], key=lambda pair: pair[1]) for i in sorted(rows)]
 
     def print_subproblem(self, all_agents):
         output_string_lines = []
@@ -1,7 +1,3 @@
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import numpy as np
-
 def update_edge_dict(path, diction):
     for i in range(len(path) - 1):
         edge = (path[i], path[i+1])
@@ -12,6 +8,10 @@ def update_edge_dict(path, diction):
     return diction 
 
 def animate_paths(initial_agents, final_agents, max_length, map_size, map_data):
+    # imported here, loading matplotlib takes longer than many solves
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    import numpy as np
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 8))
     
     # Colors for agents
@@ -0,0 +1,103 @@
+import os
+import sys
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, "source"))
+
+import cbs
+from solver_backend import CBSBackend, SolverInstance, UNSOLVED
+
+def submap(edges, nodes):
+    # neighbors of a submap with nodes 1..nodes, every node is its own neighbor like in a SolverInstance
+    neighbors = {n: [n] for n in range(1, nodes + 1)}
+    for u, v in edges:
+        neighbors[u].append(v)
+        neighbors[v].append(u)
+    return neighbors
+
+# 1 - 2 - 3 - 4 - 5
+#     |
+#     6
+CORRIDOR = submap([(1, 2), (2, 3), (3, 4), (4, 5), (2, 6)], 6)
+SWAP = [(1, 5), (5, 1)]
+SWAP_MAKESPAN = 8   # one agent waits in the pocket while the other passes
+
+class CBSTest(unittest.TestCase):
+    """ Plans of the in-process solver are valid: adjacent moves, no shared nodes or edges, exactly makespan nodes """
+    def check_plan(self, neighbors, agents, makespan, paths, vertices = (), edges = ()):
+        self.assertEqual(len(paths), len(agents))
+        for (origin, dest), path in zip(agents, paths):
+            self.assertEqual(len(path), makespan)
+            self.assertEqual((path[0], path[-1]), (origin, dest))
+            for t in range(1, makespan):
+                self.assertIn(path[t], neighbors[path[t - 1]])
+                self.assertNotIn((path[t - 1], path[t], t), edges)
+            for t, node in enumerate(path, 1):
+                self.assertNotIn((node, t), vertices)
+        for t in range(makespan):
+            positions = [path[t] for path in paths]
+            self.assertEqual(len(set(positions)), len(paths))
+            if t + 1 < makespan:
+                moves = {(path[t], path[t + 1]) for path in paths if path[t] != path[t + 1]}
+                self.assertFalse(any((v, u) in moves for u, v in moves))
+
+    def test_swap_with_pocket(self):
+        dist = [cbs.distances(CORRIDOR, dest) for _, dest in SWAP]
+        for m in range(5, SWAP_MAKESPAN):
+            self.assertEqual(cbs.joint_search(CORRIDOR, SWAP, m, dist, set(), set()), (None, True))
+            self.assertIsNone(cbs.cbs(CORRIDOR, SWAP, m, set(), set())[0])
+        paths, expanded = cbs.cbs(CORRIDOR, SWAP, SWAP_MAKESPAN, set(), set())
+        self.assertGreater(expanded, 1)
+        self.check_plan(CORRIDOR, SWAP, SWAP_MAKESPAN, paths)
+        paths, finished = cbs.joint_search(CORRIDOR, SWAP, SWAP_MAKESPAN, dist, set(), set())
+        self.assertTrue(finished)
+        self.check_plan(CORRIDOR, SWAP, SWAP_MAKESPAN, paths)
+
+    def test_backend_finds_smallest_makespan(self):
+        for joint_agents in (0, 2):
+            result = CBSBackend(joint_agents=joint_agents).solve(SolverInstance(SWAP, [], list(CORRIDOR), CORRIDOR))
+            self.assertTrue(result.solved)
+            self.assertEqual(result.makespan, SWAP_MAKESPAN)
+            self.check_plan(CORRIDOR, SWAP, SWAP_MAKESPAN, result.paths)
+
+    def test_max_nodes(self):
+        # the first constraint tree node has the swap, so one node isn't enough
+        self.assertEqual(cbs.cbs(CORRIDOR, SWAP, SWAP_MAKESPAN, set(), set(), max_nodes=1), (None, 1))
+        instance = SolverInstance(SWAP, [], list(CORRIDOR), CORRIDOR, SWAP_MAKESPAN)
+        self.assertEqual(CBSBackend(max_nodes=1, joint_agents=0).solve(instance).status, UNSOLVED)
+        dist = [cbs.distances(CORRIDOR, dest) for _, dest in SWAP]
+        self.assertEqual(cbs.joint_search(CORRIDOR, SWAP, SWAP_MAKESPAN, dist, set(), set(), max_states=1),
+                         (None, False))
+
+    def test_avoided_vertex(self):
+        line = submap([(1, 2), (2, 3)], 3)
+        dist = cbs.distances(line, 3)
+        vertices, edges = cbs.avoid_tables([[(2, 2)]])
+        self.assertEqual(cbs.space_time_astar(line, 1, 3, 3, dist, set(), set()), [1, 2, 3])
+        self.assertIsNone(cbs.space_time_astar(line, 1, 3, 3, dist, vertices, edges))
+        path = cbs.space_time_astar(line, 1, 3, 4, dist, vertices, edges)
+        self.assertEqual(path, [1, 1, 2, 3])
+        self.check_plan(line, [(1, 3)], 4, [path], vertices, edges)
+
+    def test_avoided_edge(self):
+        # the avoided agent moves 2 -> 1 while the agent would move 1 -> 2, so it goes around through 3
+        triangle = submap([(1, 2), (1, 3), (2, 3)], 3)
+        dist = cbs.distances(triangle, 2)
+        vertices, edges = cbs.avoid_tables([[(2, 1), (1, 2)]])
+        self.assertIn((1, 2, 1), edges)
+        self.assertIn((2, 1, 1), edges)
+        self.assertEqual(cbs.space_time_astar(triangle, 1, 2, 3, dist, set(), set()), [1, 2, 2])
+        path = cbs.space_time_astar(triangle, 1, 2, 3, dist, vertices, edges)
+        self.assertEqual(path, [1, 3, 2])
+        self.check_plan(triangle, [(1, 2)], 3, [path], vertices, edges)
+        paths, expanded = cbs.cbs(triangle, [(1, 2)], 3, vertices, edges)
+        self.check_plan(triangle, [(1, 2)], 3, paths, vertices, edges)
+
+    def test_first_conflict(self):
+        self.assertIsNone(cbs.first_conflict([[1, 2, 3], [4, 4, 4]]))
+        self.assertEqual(cbs.first_conflict([[1, 2, 3], [3, 2, 1]]), (0, 1, 2, 2))
+        self.assertEqual(cbs.first_conflict([[1, 2, 2], [2, 1, 1]]), (0, 1, 1, 2, 1))
+
+if __name__ == "__main__":
+    unittest.main()
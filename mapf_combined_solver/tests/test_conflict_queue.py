@@ -0,0 +1,124 @@
+import logging
+import os
+import random
+import sys
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, "source"))
+
+import map
+from conflict_queue import ConflictQueue
+from conflicts import identify_conflicts, agents_stay_at_destination, reorder_conflicts
+from metrics import DISABLED
+from solver_api import Problem, Config, plan_initial_paths
+
+class ListModel:
+    """ What the queue has to hold: conflicts pushed to the front in front, the others in the order of
+    reorder_conflicts, ties broken by Conflict.key like the queue does """
+    def __init__(self):
+        self.front = []
+        self.rest = set()
+
+    def update(self, conflicts):
+        new = set(conflicts)
+        self.front = [c for c in self.front if c in new]
+        self.rest = new - set(self.front)
+
+    def push_front(self, conflicts):
+        self.rest -= set(conflicts)
+        self.front = [c for c in conflicts if c not in self.front] + self.front
+
+    def remove(self, conflict):
+        if conflict in self.front:
+            self.front.remove(conflict)
+        self.rest.discard(conflict)
+
+    def order(self):
+        return self.front + reorder_conflicts(sorted(self.rest, key=lambda c: c.key()))
+
+class ConflictQueueTest(unittest.TestCase):
+    """ Random sequences of queue operations against a plain list """
+    @classmethod
+    def setUpClass(cls):
+        # the initial conflicts of an instance, they are of all three types
+        cwd = os.getcwd()
+        os.chdir(PROJECT_DIR)
+        logging.disable(logging.CRITICAL)
+        try:
+            problem = Problem.from_map(map.map("maze-32-32-4-even-2.scen", 40))
+            agents = problem.agents()
+            max_length = plan_initial_paths(agents, problem.grid, Config(), None, DISABLED)
+            cls.agents = agents_stay_at_destination(agents, max_length)
+            cls.grid = problem.grid
+            cls.pool = identify_conflicts(cls.agents, max_length)
+        finally:
+            os.chdir(cwd)
+            logging.disable(logging.NOTSET)
+
+    def check_queue(self, queue, model):
+        # len, membership and the conflicts kept per agent agree with what the model holds
+        held = set(model.front) | model.rest
+        self.assertEqual(len(queue), len(held))
+        for conflict in self.pool:
+            self.assertEqual(conflict in queue, conflict in held)
+        by_agent = {}
+        for conflict in held:
+            for a in conflict.agents:
+                by_agent.setdefault(a, set()).add(conflict)
+        self.assertEqual(queue.by_agent, by_agent)
+        order = queue.conflicts()
+        self.assertEqual(order[:len(model.front)], model.front)
+        self.assertEqual(set(order), held)
+        if queue.order == "time":
+            self.assertEqual(order, model.order())
+        return order
+
+    def run_operations(self, order, seed, steps = 1500):
+        rng = random.Random(seed)
+        queue = ConflictQueue(self.grid, order)
+        model = ListModel()
+        for _ in range(steps):
+            operation = rng.choice(["update", "update", "push_front", "remove", "pop", "peek", "compact"])
+            if operation == "update":
+                conflicts = rng.sample(self.pool, rng.randint(0, len(self.pool)))
+                queue.update(conflicts, self.agents)
+                model.update(conflicts)
+            elif operation == "push_front":
+                conflicts = rng.sample(self.pool, rng.randint(1, 3))
+                queue.push_front(conflicts, self.agents)
+                model.push_front(conflicts)
+            elif operation == "remove":
+                conflict = rng.choice(self.pool)
+                queue.remove(conflict, self.agents)
+                model.remove(conflict)
+            elif operation == "pop":
+                expected = queue.conflicts()
+                if not expected:
+                    self.assertRaises(IndexError, queue.pop)
+                    continue
+                conflict = queue.pop()
+                self.assertEqual(conflict, expected[0])
+                model.remove(conflict)
+            elif operation == "peek":
+                n = rng.randint(0, 10)
+                self.assertEqual(queue.peek(n), queue.conflicts()[:n])
+            else:
+                queue.compact()
+                self.assertEqual(len(queue.heap), len(queue.entries))
+            self.check_queue(queue, model)
+
+    def test_time_order(self):
+        for seed in range(3):
+            self.run_operations("time", seed)
+
+    def test_impact_order(self):
+        # the order within the heap depends on the cardinalities, the rest must be the same as with order time
+        for seed in range(3):
+            self.run_operations("impact", seed)
+
+    def test_unknown_order(self):
+        self.assertRaises(ValueError, ConflictQueue, self.grid, "random")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, "source"))
+
+from grid import Grid
+from prioritized_planning import PrioritizedPlanner, ReservationTable, SpaceTimeSearch
+
+def grid_of(rows):
+    return Grid([list(row) for row in rows])
+
+class PrioritizedPlanningTest(unittest.TestCase):
+    """ Prioritized planning on small grids: paths of agents that didn't fail never meet """
+    def check_paths(self, grid, queries, paths, failed = ()):
+        makespan = max(len(path) for path in paths)
+        for (origin, destination), path in zip(queries, paths):
+            self.assertEqual((path[0], path[-1]), (origin, destination))
+            for a, b in zip(path, path[1:]):
+                self.assertTrue(a == b or grid.cell_id(b) in grid.adjacency[grid.cell_id(a)])
+        # agents stay at their destinations once their paths end
+        planned = [path + [path[-1]] * (makespan - len(path)) for i, path in enumerate(paths) if i not in failed]
+        for t in range(makespan):
+            self.assertEqual(len({path[t] for path in planned}), len(planned))
+            if t + 1 < makespan:
+                moves = {(path[t], path[t + 1]) for path in planned if path[t] != path[t + 1]}
+                self.assertFalse(any((b, a) in moves for a, b in moves))
+
+    def test_conflict_free(self):
+        grid = grid_of(["......",
+                        ".@@.@.",
+                        "......",
+                        ".@....",
+                        "......"])
+        queries = [((0, 0), (5, 4)), ((5, 4), (0, 0)), ((5, 0), (0, 4)), ((0, 4), (5, 0)), ((2, 2), (3, 0)),
+                   ((3, 1), (2, 4))]
+        for ordering in ("longest", "shortest", "index", "random"):
+            planner = PrioritizedPlanner(grid, ordering=ordering)
+            paths = planner.plan(queries)
+            self.assertEqual(planner.failed, [])
+            self.check_paths(grid, queries, paths)
+
+    def test_waits_for_earlier_agent(self):
+        # the destination of agent 1 is on the path of agent 0 at step 2, so it can only stay there from step 3 on
+        grid = grid_of([".....",
+                        "@@.@@"])
+        queries = [((0, 0), (4, 0)), ((2, 1), (2, 0))]
+        planner = PrioritizedPlanner(grid, ordering="index")
+        paths = planner.plan(queries)
+        self.assertEqual(planner.failed, [])
+        self.assertEqual(paths[0], [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)])
+        self.assertEqual(len(paths[1]), 4)
+        self.assertNotEqual(paths[1][2], (2, 0))
+        self.check_paths(grid, queries, paths)
+
+    def test_failed_agent(self):
+        # agent 1 has no way out of the corridor agent 0 passes through, one of them keeps its A* path
+        grid = grid_of(["....."])
+        queries = [((0, 0), (4, 0)), ((3, 0), (3, 0))]
+        planner = PrioritizedPlanner(grid, ordering="index", restarts=2)
+        paths = planner.plan(queries)
+        self.assertEqual(len(planner.failed), 1)
+        self.assertEqual(planner.attempts, 3)
+        shortest = [[(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)], [(3, 0)]]
+        self.assertEqual(paths[planner.failed[0]], shortest[planner.failed[0]])
+        self.check_paths(grid, queries, paths, planner.failed)
+
+    def test_reservations(self):
+        grid = grid_of(["...."])
+        a, b, c = grid.cell_id((0, 0)), grid.cell_id((1, 0)), grid.cell_id((2, 0))
+        reservations = ReservationTable()
+        reservations.reserve([a, b, c])
+        self.assertEqual(reservations.horizon, 2)
+        self.assertFalse(reservations.is_free(b, 1))
+        self.assertTrue(reservations.is_free(b, 0))
+        self.assertFalse(reservations.is_free(c, 5))    # the agent stays at its destination
+        self.assertFalse(reservations.can_stay(b, 1))   # the path passes b at step 1
+        self.assertTrue(reservations.can_stay(b, 2))
+        self.assertFalse(reservations.can_stay(c, 10))
+        self.assertIn((a, b, 1), reservations.edges)
+
+    def test_swap_is_blocked(self):
+        # the reserved agent moves (0,0) -> (1,0) while the searched one would move the other way
+        grid = grid_of(["..",
+                        ".."])
+        x, y = grid.cell_id((0, 0)), grid.cell_id((1, 0))
+        reservations = ReservationTable()
+        reservations.reserve([x, y])
+        path = SpaceTimeSearch(grid).search_cells(y, x, reservations, 1000)
+        self.assertEqual([grid.coords[c] for c in path], [(1, 0), (1, 1), (0, 1), (0, 0)])
+
+    def test_horizon(self):
+        # after the last reserved step nothing changes, so a search that can't reach its destination ends with
+        # every cell expanded about once per step up to the horizon instead of using up its expansions
+        grid = grid_of(["....."])
+        cells = [grid.cell_id((x, 0)) for x in range(5)]
+        reservations = ReservationTable()
+        reservations.reserve([cells[2]] * 4)
+        search = SpaceTimeSearch(grid)
+        self.assertEqual(search.search_cells(cells[0], cells[4], reservations, 10 ** 6), [])
+        self.assertLessEqual(search.expansions, len(cells) * (reservations.horizon + 2))
+
+if __name__ == "__main__":
+    unittest.main()
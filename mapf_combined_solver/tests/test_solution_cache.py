@@ -0,0 +1,79 @@
+import os
+import random
+import sys
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, "source"))
+
+import cbs
+from solution_cache import SolutionCache
+from solver_backend import CBSBackend, SolverInstance
+
+# (0,0) (1,0) (2,0) (3,0) (4,0)
+#       (1,1)       (3,1)
+CELLS = [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (1, 1), (3, 1)]
+AGENTS = [((0, 0), (4, 0)), ((4, 0), (0, 0))]
+AVOIDS = [[((3, 1), 1), ((3, 1), 2), ((3, 1), 3), ((3, 0), 4), ((4, 0), 5)]]
+
+def instance_at(offset, ids, rng):
+    """ Solver instance of the situation above moved by offset on the map, cell i is node ids[i] and nodes and
+    neighbors are listed in random order; returns the instance and the map position of every node """
+    node = dict(zip(CELLS, ids))
+    coords = {node[c]: (c[0] + offset[0], c[1] + offset[1]) for c in CELLS}
+    neighbors = {}
+    for c in CELLS:
+        neighbors[node[c]] = [node[c]] + [node[d] for d in CELLS if abs(d[0] - c[0]) + abs(d[1] - c[1]) == 1]
+        rng.shuffle(neighbors[node[c]])
+    nodes = list(ids)
+    rng.shuffle(nodes)
+    agents = [(node[o], node[d]) for o, d in AGENTS]
+    avoids = [[(node[c], t) for c, t in row] for row in AVOIDS]
+    return SolverInstance(agents, avoids, nodes, neighbors), coords
+
+class SolutionCacheTest(unittest.TestCase):
+    """ A solution found somewhere on the map is reused for the same situation elsewhere """
+    def check_paths(self, instance, paths):
+        # endpoints, adjacent moves, avoids and the other agent of the instance respected
+        vertices, edges = cbs.avoid_tables(instance.avoids)
+        makespan = len(paths[0])
+        for (origin, dest), path in zip(instance.agents, paths):
+            self.assertEqual(len(path), makespan)
+            self.assertEqual((path[0], path[-1]), (origin, dest))
+            for t, node in enumerate(path, 1):
+                self.assertIn(node, instance.nodes)
+                self.assertNotIn((node, t), vertices)
+                if t < makespan:
+                    self.assertIn(path[t], instance.neighbors[node])
+                    self.assertNotIn((node, path[t], t), edges)
+        self.assertIsNone(cbs.first_conflict(paths))
+
+    def test_shifted_situation(self):
+        rng = random.Random(0)
+        cache = SolutionCache(namespace="cbs")
+        first, first_coords = instance_at((0, 0), range(1, len(CELLS) + 1), rng)
+        solved = cache.solve(first, first_coords, CBSBackend())
+        self.assertTrue(solved.solved)
+        self.check_paths(first, solved.paths)
+        ids = rng.sample(range(1, 100), len(CELLS))
+        second, second_coords = instance_at((17, 9), ids, rng)
+        key, order = cache.key(second, second_coords)
+        self.assertEqual(key, cache.key(first, first_coords)[0])
+        hit = cache.get(key, order)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertTrue(hit.solved)
+        self.assertEqual(hit.makespan, solved.makespan)
+        self.check_paths(second, hit.paths)
+
+    def test_other_situation(self):
+        # the same cells with the avoided agent one step later are another instance
+        rng = random.Random(1)
+        cache = SolutionCache()
+        first, coords = instance_at((0, 0), range(1, len(CELLS) + 1), rng)
+        cache.solve(first, coords, CBSBackend())
+        later = SolverInstance(first.agents, [[(n, t + 1) for n, t in row] for row in first.avoids], first.nodes,
+                               first.neighbors)
+        self.assertIsNone(cache.get(*cache.key(later, coords)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import logging
+import os
+import sys
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, "source"))
+
+import map
+from conflicts import identify_conflicts
+from solver_api import Problem, Config, solve
+
+class FinalPathsTest(unittest.TestCase):
+    """ The conflicts a Result reports are those of its final paths, whatever the work queue held at the end """
+    def setUp(self):
+        # maps and scenarios are read relative to the project directory
+        self.cwd = os.getcwd()
+        os.chdir(PROJECT_DIR)
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        logging.disable(logging.NOTSET)
+
+    def check_final_paths(self, scen, n, config):
+        result = solve(Problem.from_map(map.map(scen, n)), config)
+        found = set(identify_conflicts(result.agents, result.makespan)) - result.unsolveable_conflicts
+        self.assertEqual(found, set(result.conflicts))
+        if result.solved:
+            self.assertEqual(identify_conflicts(result.agents, result.makespan), [])
+
+    def test_flagged_conflicts_are_reported(self):
+        # with the cbs backend some conflicts of this instance fail again after they were flagged
+        self.check_final_paths("maze-32-32-4-even-2.scen", 40, Config(solver_backend="cbs", timeout=60))
+
+    def test_swap_is_repaired(self):
+        # the first repair of the swap fails, it is only solved when the conflicts are looked for again
+        problem = Problem([list("....."), list("@.@@@")], [[[0, 0], [4, 0]], [[4, 0], [0, 0]]])
+        result = solve(problem, Config(solver_backend="cbs"))
+        self.assertTrue(result.solved)
+        self.assertEqual(identify_conflicts(result.agents, result.makespan), [])
+
+    def test_windows(self):
+        self.check_final_paths("maze-32-32-4-even-2.scen", 20, Config(solver_backend="cbs", timeout=60, window=30))
+
+if __name__ == "__main__":
+    unittest.main()